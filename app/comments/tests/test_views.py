@@ -1,5 +1,6 @@
 import uuid
 
+from core.tests.mixins import IsolatedCacheMixin
 from django.contrib.auth import get_user_model
 from django.core import mail
 from django.test import TestCase, tag
@@ -14,7 +15,7 @@ User = get_user_model()
 
 
 @tag("fast", "comments", "views")
-class TestCommentViews(TestCase):
+class TestCommentViews(IsolatedCacheMixin, TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
             email="user@test.app",
@@ -80,6 +81,9 @@ class TestCommentViews(TestCase):
         self.assertEqual(Comment.objects.count(), 1)
         self.assertContains(response, "Test comment 123456")
 
+        self.trip.refresh_from_db()
+        self.assertEqual(self.trip.comments_count, 1)
+
     def test_add_comment_via_post_request_to_object_the_user_cannot_view(self):
         """Test that a comment cannot be added to an object the user cannot view."""
         self.client.force_login(self.user2)
@@ -114,6 +118,7 @@ class TestCommentViews(TestCase):
             trip=self.trip,
             content="Test comment",
         )
+        Trip.objects.recount_counters()
 
         self.client.force_login(self.user)
         response = self.client.post(
@@ -124,6 +129,9 @@ class TestCommentViews(TestCase):
         self.assertContains(response, "The comment has been deleted")
         self.assertEqual(Comment.objects.count(), 0)
 
+        self.trip.refresh_from_db()
+        self.assertEqual(self.trip.comments_count, 0)
+
     def test_delete_comment_that_does_not_belong_to_the_user(self):
         """Test that a comment cannot be deleted if it does not belong to the user."""
         comment = Comment.objects.create(
@@ -3,6 +3,7 @@ from core.models import News
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.exceptions import PermissionDenied
+from django.db import transaction
 from django.shortcuts import get_object_or_404, redirect
 from django.utils.decorators import method_decorator
 from django.views import View
@@ -26,7 +27,9 @@ class AddComment(LoginRequiredMixin, View):
             raise PermissionDenied
 
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                form.save()
+                trip.update_counters(comments_count=1)
 
             trip.followers.add(request.user)
 
@@ -105,7 +108,9 @@ class DeleteComment(LoginRequiredMixin, View):
             or comment.trip.user == request.user  # noqa: W503
             or request.user.is_superuser  # noqa: W503
         ):
-            comment.delete()
+            with transaction.atomic():
+                comment.delete()
+                comment.trip.update_counters(comments_count=-1)
             messages.success(
                 request,
                 "The comment has been deleted.",
@@ -0,0 +1,154 @@
+import functools
+import uuid
+from collections.abc import Iterable
+
+import redis
+from attrs import frozen
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, models, transaction
+
+FLUSH_BATCH_SIZE = 1000
+
+
+@functools.cache
+def _connect(location: str) -> redis.Redis:
+    return redis.Redis.from_url(location)
+
+
+def get_redis_client() -> redis.Redis:
+    """Return a client for the Redis server used by the default cache."""
+    location = settings.CACHES["default"]["LOCATION"]
+    if not isinstance(location, str):
+        location = location[0]
+    # The first of several servers is the primary, which is written to
+    return _connect(location.split(",")[0])
+
+
+@frozen
+class BufferedCounter:
+    """An integer model field which is incremented in Redis and written in batches.
+
+    Increments are added to a Redis hash of primary key to delta, which is applied
+    to the database by `flush`. This keeps row-locking writes off the request path
+    and does not lose increments from concurrent requests. Each batch of increments
+    is applied exactly once, even if a flush fails part way through. Only one flush
+    should run at a time for each counter.
+    """
+
+    model_label: str
+    field: str
+
+    @property
+    def model(self) -> type[models.Model]:
+        return apps.get_model(self.model_label)
+
+    @property
+    def name(self) -> str:
+        return f"{self.model_label.lower()}:{self.field}"
+
+    @property
+    def key(self) -> str:
+        return cache.make_key(f"counters:{self.name}")
+
+    @property
+    def batches_key(self) -> str:
+        return f"{self.key}:batches"
+
+    def batch_key(self, batch_id: str) -> str:
+        return f"{self.key}:batch:{batch_id}"
+
+    def increment(self, pk: int, amount: int = 1):
+        """Add `amount` to the counter of the object with primary key `pk`."""
+        get_redis_client().hincrby(self.key, pk, amount)
+
+    def increment_many(self, pks: Iterable[int], amount: int = 1):
+        """Add `amount` to the counter of each object in `pks`."""
+        with get_redis_client().pipeline(transaction=False) as pipe:
+            for pk in pks:
+                pipe.hincrby(self.key, pk, amount)
+            pipe.execute()
+
+    def flush(self, batch_size: int = FLUSH_BATCH_SIZE) -> int:
+        """Apply the buffered increments to the database.
+
+        The buffer is renamed before it is read so that increments made during the
+        flush are kept for the next one, and is then split into batches which are
+        each given an id. A batch is recorded as a `FlushedCounterBatch` in the same
+        transaction as it is written, and is only removed from Redis afterwards. A
+        flush which fails part way through is resumed by the next one, which skips
+        the batches that were already written.
+
+        Returns:
+            The number of rows updated.
+        """
+        from .models import FlushedCounterBatch
+
+        client = get_redis_client()
+        self._split_buffer(client, batch_size)
+
+        batch_ids = sorted(batch_id.decode() for batch_id in client.smembers(self.batches_key))
+        # Forget the batches which were written and removed from Redis by earlier flushes
+        FlushedCounterBatch.objects.filter(counter=self.name).exclude(
+            batch_id__in=batch_ids
+        ).delete()
+
+        updated = 0
+        for batch_id in batch_ids:
+            updated += self._apply_batch(client, batch_id)
+        return updated
+
+    def _split_buffer(self, client: redis.Redis, batch_size: int):
+        """Move the buffered increments into batches of at most `batch_size` objects."""
+        flushing_key = f"{self.key}:flushing"
+        if not client.exists(flushing_key):
+            if not client.exists(self.key):
+                return
+            client.rename(self.key, flushing_key)
+
+        deltas = list(client.hgetall(flushing_key).items())
+        for start in range(0, len(deltas), batch_size):
+            batch = dict(deltas[start : start + batch_size])
+            batch_id = uuid.uuid4().hex
+            # Moved in a single Redis transaction, so no increment is in two batches
+            with client.pipeline() as pipe:
+                pipe.hset(self.batch_key(batch_id), mapping=batch)
+                pipe.sadd(self.batches_key, batch_id)
+                pipe.hdel(flushing_key, *batch)
+                pipe.execute()
+
+    def _apply_batch(self, client: redis.Redis, batch_id: str) -> int:
+        """Write a batch to the database, unless it has been already, and remove it."""
+        from .models import FlushedCounterBatch
+
+        batch_key = self.batch_key(batch_id)
+        deltas = [(int(pk), int(delta)) for pk, delta in client.hgetall(batch_key).items()]
+
+        opts = self.model._meta
+        table = connection.ops.quote_name(opts.db_table)
+        column = connection.ops.quote_name(opts.get_field(self.field).column)
+        pk_column = connection.ops.quote_name(opts.pk.column)
+
+        updated = 0
+        with transaction.atomic():
+            _, created = FlushedCounterBatch.objects.get_or_create(
+                batch_id=batch_id, defaults={"counter": self.name}
+            )
+            if created and deltas:
+                values = ", ".join(["(%s, %s)"] * len(deltas))
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f"UPDATE {table} SET {column} = {table}.{column} + counts.delta "
+                        f"FROM (VALUES {values}) AS counts (pk, delta) "
+                        f"WHERE {table}.{pk_column} = counts.pk",
+                        [value for row in deltas for value in row],
+                    )
+                    updated = cursor.rowcount
+
+        with client.pipeline() as pipe:
+            pipe.delete(batch_key)
+            pipe.srem(self.batches_key, batch_id)
+            pipe.execute()
+
+        return updated
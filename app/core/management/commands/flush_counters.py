@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from logger.models import Trip
+from users.models import CavingUser
+
+COUNTERS = (Trip.view_counter, CavingUser.profile_view_counter)
+
+
+class Command(BaseCommand):
+    help = "Write the view counts buffered in Redis to the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="Keep running and flush every this many seconds",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            for counter in COUNTERS:
+                count = counter.flush()
+                if options["verbosity"] >= 2 or (count and options["verbosity"] >= 1):
+                    self.stdout.write(
+                        self.style.SUCCESS(f"Flushed {counter.field} for {count} objects.")
+                    )
+
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
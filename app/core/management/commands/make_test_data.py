@@ -8,6 +8,8 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.management.base import BaseCommand
 from logger.factories import TripFactory
+from logger.models import Trip
+from stats.models import UserStats
 from users.factories import UserFactory
 
 User = get_user_model()
@@ -83,6 +85,8 @@ class Command(BaseCommand):
 
         self._generate_friendships(user_pks)
         trips = self._generate_trips(user_pks)
+        Trip.objects.recount_counters()
+        UserStats.objects.recount()
 
         if options["verbosity"] >= 1:
             self.stdout.write(f"Done! Generated {len(user_pks)} users and {len(trips)} trips.")
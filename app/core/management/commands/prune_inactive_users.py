@@ -1,5 +1,9 @@
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.utils import timezone
+from logger.models import CaveNameDictionary, FeedEntry, Trip
+from logger.search import invalidate_search_results
+from stats.models import UserStats
 from users.models import CavingUser as User
 
 
@@ -15,7 +19,26 @@ class Command(BaseCommand):
             date_joined__lte=td,
         )
 
-        count = users_to_delete.count()
-        users_to_delete.delete()
+        # Deleting the users deletes their trips and friendships in bulk, without the
+        # bookkeeping done by `Trip.delete` and when a friend is removed
+        trips = Trip.objects.filter(user__in=users_to_delete)
+        with transaction.atomic():
+            has_trips = trips.exists()
+            friends = list(
+                User.objects.filter(friends__in=users_to_delete)
+                .exclude(pk__in=users_to_delete)
+                .distinct()
+            )
+            FeedEntry.objects.invalidate_trips(trips)
+            CaveNameDictionary.objects.remove_trips(trips)
+
+            count = users_to_delete.count()
+            users_to_delete.delete()
+
+            for friend in friends:
+                UserStats.objects.recount(friend)
+
+        if has_trips:
+            invalidate_search_results()
 
         self.stdout.write(self.style.SUCCESS(f"Deleted {count} unverified users."))
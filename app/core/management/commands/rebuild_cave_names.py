@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from logger.models import CaveNameDictionary
+
+
+class Command(BaseCommand):
+    help = "Rebuild the cave names suggested when logging and searching for trips"
+
+    def handle(self, *args, **options):
+        count = CaveNameDictionary.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Stored {count} cave names."))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from logger.models import FeedEntry
+
+
+class Command(BaseCommand):
+    help = "Rebuild the social feed of every user from their own and their friends' trips"
+
+    def handle(self, *args, **options):
+        count = FeedEntry.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the feed with {count} entries."))
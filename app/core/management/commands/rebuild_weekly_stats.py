@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from stats.models import UserWeeklyStats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the weekly statistics of every user from their trips"
+
+    def handle(self, *args, **options):
+        count = UserWeeklyStats.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Stored {count} weeks of statistics."))
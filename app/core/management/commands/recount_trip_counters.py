@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from logger.models import Trip
+
+
+class Command(BaseCommand):
+    help = "Recalculate the stored like, comment and photo counts of every trip"
+
+    def handle(self, *args, **options):
+        count = Trip.objects.recount_counters()
+        self.stdout.write(self.style.SUCCESS(f"Repaired the counters of {count} trips."))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from stats.models import UserStats
+
+
+class Command(BaseCommand):
+    help = "Recalculate the stored quick statistics of every user"
+
+    def handle(self, *args, **options):
+        count = UserStats.objects.recount()
+        self.stdout.write(self.style.SUCCESS(f"Repaired the statistics of {count} users."))
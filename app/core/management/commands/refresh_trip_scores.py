@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from logger.models import TripScore
+
+
+class Command(BaseCommand):
+    help = "Recalculate the engagement scores used to rank the discover feed"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="Keep running and recalculate the scores every this many seconds",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            count = TripScore.objects.refresh()
+            self.stdout.write(self.style.SUCCESS(f"Scored {count} trips."))
+
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.9 on 2026-10-17 11:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0004_alter_news_slug"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FlushedCounterBatch",
+            fields=[
+                ("batch_id", models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ("counter", models.CharField(max_length=100)),
+                ("flushed_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
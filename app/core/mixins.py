@@ -0,0 +1,23 @@
+class FullSaveExcludedFieldsMixin:
+    """Leave the fields in `FULL_SAVE_EXCLUDED_FIELDS` out of a full save of a model.
+
+    These are fields written elsewhere, by F() expressions, database triggers or
+    queryset updates. They are never written by a full save of an existing object,
+    as the instance may be older than a change made to them since it was loaded,
+    but may still be written by naming them in `update_fields`.
+    """
+
+    FULL_SAVE_EXCLUDED_FIELDS: tuple[str, ...] = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = self._get_full_save_fields()
+        return super().save(*args, **kwargs)
+
+    def _get_full_save_fields(self):
+        """Return the names of the fields written by a full save of an existing object."""
+        return [
+            field.name
+            for field in self._meta.concrete_fields
+            if not field.primary_key and field.name not in self.FULL_SAVE_EXCLUDED_FIELDS
+        ]
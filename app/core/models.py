@@ -44,3 +44,18 @@ class FAQ(models.Model):
 
     def __str__(self):
         return self.question
+
+
+class FlushedCounterBatch(models.Model):
+    """A batch of buffered counter increments which has been written to the database.
+
+    It is created in the same transaction as the write, so that a batch which is
+    flushed again after a failure is not counted twice. See `core.counters`.
+    """
+
+    batch_id = models.CharField(max_length=32, primary_key=True)
+    counter = models.CharField(max_length=100)
+    flushed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.batch_id
@@ -0,0 +1,35 @@
+import os
+
+from django.conf import settings
+from django.test import override_settings
+
+from ..counters import get_redis_client
+
+
+class IsolatedCacheMixin:
+    """Give the cache keys of each parallel test process their own prefix.
+
+    Cached pages, buffered view counts and the search version are kept in the shared
+    Redis server, where tests running in other processes would otherwise change them.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # The process id is only known once the tests are running in a worker
+        key_prefix = f"test-{os.getpid()}"
+        cls.enterClassContext(
+            override_settings(
+                CACHES={"default": {**settings.CACHES["default"], "KEY_PREFIX": key_prefix}}
+            )
+        )
+        # Clear keys left by an earlier process with the same id, and this class's own
+        cls._delete_cached_keys(key_prefix)
+        cls.addClassCleanup(cls._delete_cached_keys, key_prefix)
+        super().setUpClass()
+
+    @staticmethod
+    def _delete_cached_keys(key_prefix):
+        client = get_redis_client()
+        keys = list(client.scan_iter(match=f"{key_prefix}:*", count=1000))
+        if keys:
+            client.delete(*keys)
@@ -0,0 +1,135 @@
+import os
+import unittest
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, tag
+from django.urls import reverse
+from logger.factories import TripFactory
+from logger.models import Trip
+from users.factories import UserFactory
+
+from ..counters import FLUSH_BATCH_SIZE, BufferedCounter, get_redis_client
+from ..models import FlushedCounterBatch
+from .mixins import IsolatedCacheMixin
+
+
+@tag("fast", "counters")
+class BufferedCounterTests(IsolatedCacheMixin, TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.trip = TripFactory(user=self.user, privacy=Trip.PUBLIC)
+        self.counter = Trip.view_counter
+
+    def tearDown(self):
+        for counter in (self.counter, self.user.profile_view_counter):
+            client = get_redis_client()
+            batch_keys = [
+                counter.batch_key(b.decode()) for b in client.smembers(counter.batches_key)
+            ]
+            client.delete(counter.key, f"{counter.key}:flushing", counter.batches_key, *batch_keys)
+
+    def test_flush_applies_buffered_increments(self):
+        """Test that increments are only written to the database when flushed."""
+        other_trip = TripFactory(user=self.user)
+        self.counter.increment(self.trip.pk)
+        self.counter.increment(self.trip.pk, 2)
+        self.counter.increment_many([self.trip.pk, other_trip.pk])
+
+        self.trip.refresh_from_db()
+        self.assertEqual(self.trip.view_count, 0)
+
+        self.assertEqual(self.counter.flush(), 2)
+        self.trip.refresh_from_db()
+        other_trip.refresh_from_db()
+        self.assertEqual(self.trip.view_count, 4)
+        self.assertEqual(other_trip.view_count, 1)
+
+        self.assertEqual(self.counter.flush(), 0)
+
+    def test_flush_resumes_an_interrupted_flush(self):
+        """Test that increments from a failed flush are not lost or counted twice."""
+        self.counter.increment(self.trip.pk, 5)
+        get_redis_client().rename(self.counter.key, f"{self.counter.key}:flushing")
+        self.counter.increment(self.trip.pk)
+
+        self.counter.flush()
+        self.trip.refresh_from_db()
+        self.assertEqual(self.trip.view_count, 5)
+
+        self.counter.flush()
+        self.trip.refresh_from_db()
+        self.assertEqual(self.trip.view_count, 6)
+
+    def test_flush_does_not_apply_a_batch_twice(self):
+        """Test that a batch which was written but not removed from Redis is skipped."""
+        client = get_redis_client()
+        self.counter.increment(self.trip.pk, 5)
+        self.counter._split_buffer(client, FLUSH_BATCH_SIZE)
+        (batch_id,) = [batch_id.decode() for batch_id in client.smembers(self.counter.batches_key)]
+
+        # Write the batch as a flush which failed before removing it would have
+        with transaction.atomic():
+            FlushedCounterBatch.objects.create(batch_id=batch_id, counter=self.counter.name)
+            Trip.objects.filter(pk=self.trip.pk).update(view_count=F("view_count") + 5)
+
+        self.counter.increment(self.trip.pk)
+        self.assertEqual(self.counter.flush(), 1)
+        self.trip.refresh_from_db()
+        self.assertEqual(self.trip.view_count, 6)
+        self.assertFalse(client.exists(self.counter.batch_key(batch_id)))
+
+        self.assertEqual(self.counter.flush(), 0)
+        self.assertFalse(FlushedCounterBatch.objects.exists())
+
+    def test_flush_ignores_deleted_objects(self):
+        """Test that increments for objects which no longer exist are discarded."""
+        counter = BufferedCounter("logger.Trip", "view_count")
+        counter.increment(self.trip.pk)
+        self.trip.delete()
+
+        self.assertEqual(counter.flush(), 0)
+        self.assertFalse(get_redis_client().exists(f"{counter.key}:flushing"))
+        self.assertFalse(get_redis_client().exists(counter.batches_key))
+
+    @tag("views")
+    def test_trip_and_profile_views_are_flushed_by_command(self):
+        """Test that trip and profile views are counted by the flush_counters command."""
+        viewer = UserFactory()
+        self.user.privacy = self.user.PUBLIC
+        self.user.save()
+
+        self.client.force_login(viewer)
+        self.client.get(self.trip.get_absolute_url())
+        self.client.get(reverse("log:user", args=[self.user.username]))
+
+        # Viewing your own trip or profile is not counted
+        self.client.force_login(self.user)
+        self.client.get(self.trip.get_absolute_url())
+        self.client.get(reverse("log:user", args=[self.user.username]))
+
+        call_command("flush_counters", stdout=StringIO())
+        self.trip.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(self.trip.view_count, 1)
+        self.assertEqual(self.user.profile_view_count, 1)
+
+
+@tag("fast", "counters")
+class IsolatedCacheMixinTests(SimpleTestCase):
+    def test_cached_keys_are_deleted_after_the_tests(self):
+        """Test that the keys written by isolated tests are deleted when they finish."""
+        match = f"test-{os.getpid()}:*"
+
+        class IsolatedTests(IsolatedCacheMixin, SimpleTestCase):
+            def test_write(self):
+                cache.set("isolated", 1)
+                self.assertTrue(list(get_redis_client().scan_iter(match=match)))
+
+        result = unittest.TestResult()
+        unittest.TestSuite([IsolatedTests("test_write")]).run(result)
+        self.assertTrue(result.wasSuccessful(), result.failures + result.errors)
+        self.assertEqual(list(get_redis_client().scan_iter(match=match)), [])
@@ -5,11 +5,13 @@ from django.contrib.auth import get_user_model
 from django.test import Client, TestCase, tag
 from django.urls import reverse
 
+from .mixins import IsolatedCacheMixin
+
 User = get_user_model()
 
 
 @tag("middleware", "fast")
-class TestMiddleware(TestCase):
+class TestMiddleware(IsolatedCacheMixin, TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
             email="test@caves.app",
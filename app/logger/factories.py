@@ -170,6 +170,17 @@ class TripFactory(DjangoModelFactory):
     class Meta:
         model = Trip
 
+    class Params:
+        # Leave every distance blank, so tests can set only the ones they total
+        no_distances = factory.Trait(
+            aid_dist=None,
+            vert_dist_up=None,
+            vert_dist_down=None,
+            horizontal_dist=None,
+            surveyed_dist=None,
+            resurveyed_dist=None,
+        )
+
     user = factory.Iterator(get_user_model().objects.filter(is_active=True))
     cave_name = factory.LazyFunction(_generate_cave_name)
     cave_entrance = factory.LazyFunction(_generate_cave_entrance_or_exit)
@@ -15,6 +15,31 @@ from .models import Caver, Trip, TripPhoto
 User = CavingUser
 
 
+class CaveNameInput(forms.TextInput):
+    """A text input suggesting the cave names which have been logged as it is typed in.
+
+    The suggestions are loaded into a `<datalist>` which must be included in the form
+    layout with `cave_name_suggestions()`.
+    """
+
+    def __init__(self, attrs=None):
+        super().__init__(
+            attrs={
+                "list": "caveNameSuggestions",
+                "autocomplete": "off",
+                "hx-get": reverse_lazy("log:cave_name_suggestions"),
+                "hx-trigger": "keyup changed delay:200ms",
+                "hx-target": "#caveNameSuggestions",
+                **(attrs or {}),
+            }
+        )
+
+
+def cave_name_suggestions():
+    """Return the layout object holding the suggestions of a `CaveNameInput`."""
+    return HTML('<datalist id="caveNameSuggestions"></datalist>')
+
+
 # noinspection PyTypeChecker
 class BaseTripForm(forms.ModelForm):
     """A parent class for all forms which handle the Trip model."""
@@ -95,6 +120,7 @@ class TripForm(DistanceUnitFormMixin, CleanCaveLocationMixin, BaseTripForm):
             "public_notes",
         ]
         widgets = {
+            "cave_name": CaveNameInput,
             "start": forms.DateTimeInput(attrs={"type": "datetime-local"}),
             "end": forms.DateTimeInput(attrs={"type": "datetime-local"}),
             "cave_location": forms.TextInput(
@@ -128,7 +154,7 @@ class TripForm(DistanceUnitFormMixin, CleanCaveLocationMixin, BaseTripForm):
         # Form layout
         self.helper.layout = Layout(
             Div(
-                Div("cave_name", css_class="col-12"),
+                Div("cave_name", cave_name_suggestions(), css_class="col-12"),
                 Div("cave_entrance", css_class="col-12 col-lg-6"),
                 Div("cave_exit", css_class="col-12 col-lg-6"),
                 Div("cave_region", css_class="col-12 col-lg-6"),
@@ -278,6 +304,7 @@ class TripSearchForm(forms.Form):
         label="Search terms",
         required=True,
         help_text="Text to search for in trip records.",
+        widget=CaveNameInput,
     )
     user = forms.CharField(
         label="Username",
@@ -295,6 +322,15 @@ class TripSearchForm(forms.Form):
     cavers = forms.BooleanField(initial=True, required=False)
     clubs = forms.BooleanField(initial=False, required=False)
     expedition = forms.BooleanField(initial=False, required=False)
+    fuzzy = forms.BooleanField(
+        label="Allow spelling mistakes",
+        initial=False,
+        required=False,
+        help_text="Find trips with similar cave names, entrances, regions and cavers.",
+    )
+    # Set by following a facet of the results, rather than from the form itself
+    in_country = forms.CharField(required=False, widget=forms.HiddenInput)
+    year = forms.IntegerField(required=False, widget=forms.HiddenInput)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -304,6 +340,7 @@ class TripSearchForm(forms.Form):
         self.helper.layout = Layout(
             Div(
                 "terms",
+                cave_name_suggestions(),
                 css_class="row",
             ),
             Div(
@@ -326,6 +363,10 @@ class TripSearchForm(forms.Form):
                 Div("expedition", css_class="col"),
                 css_class="row row-cols-2 row-cols-lg-3 mt-3",
             ),
+            Div(
+                Div("fuzzy", css_class="col-12"),
+                css_class="row mt-3",
+            ),
         )
 
     def clean_terms(self):
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.9 on 2026-10-17 03:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0046_alter_trip_notes_alter_trip_public_notes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="trip",
+            index=models.Index(fields=["-added", "-id"], name="trip_feed_added_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="trip",
+            index=models.Index(fields=["-start", "-id"], name="trip_feed_start_idx"),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.9 on 2026-10-17 03:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0047_trip_feed_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FeedEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("added", models.DateTimeField()),
+                ("start", models.DateTimeField()),
+            ],
+            options={
+                "verbose_name_plural": "feed entries",
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name="trip",
+            name="trip_feed_added_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="trip",
+            name="trip_feed_start_idx",
+        ),
+        migrations.AddField(
+            model_name="feedentry",
+            name="trip",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="feed_entries",
+                to="logger.trip",
+            ),
+        ),
+        migrations.AddField(
+            model_name="feedentry",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="feed_entries",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="feedentry",
+            index=models.Index(fields=["user", "-added", "-trip"], name="feed_entry_added_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="feedentry",
+            index=models.Index(fields=["user", "-start", "-trip"], name="feed_entry_start_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="feedentry",
+            constraint=models.UniqueConstraint(fields=("user", "trip"), name="unique_feed_entry"),
+        ),
+    ]
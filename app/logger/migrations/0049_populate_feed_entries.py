@@ -0,0 +1,36 @@
+from django.db import migrations
+from django.db.models import Q
+
+
+def populate_feed_entries(apps, schema_editor):
+    trip_model = apps.get_model("logger", "Trip")
+    feed_entry_model = apps.get_model("logger", "FeedEntry")
+
+    entries = [
+        feed_entry_model(user_id=user_pk, trip_id=pk, added=added, start=start)
+        for user_pk, pk, added, start in trip_model.objects.values_list(
+            "user", "pk", "added", "start"
+        ).iterator()
+    ]
+
+    friends_trips = trip_model.objects.filter(
+        Q(privacy__in=["Public", "Friends"]) | (Q(privacy="Default") & ~Q(user__privacy="Private")),
+        user__friends__isnull=False,
+    ).values_list("user__friends", "pk", "added", "start")
+    entries += [
+        feed_entry_model(user_id=user_pk, trip_id=pk, added=added, start=start)
+        for user_pk, pk, added, start in friends_trips.iterator()
+    ]
+
+    feed_entry_model.objects.bulk_create(entries, batch_size=5000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0048_feedentry"),
+        ("users", "0045_remove_cavinguser_show_cavers_on_trip_list"),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_feed_entries, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.9 on 2026-10-17 03:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0049_populate_feed_entries"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trip",
+            name="comments_count",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="likes_count",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="trip",
+            name="valid_photo_count",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+    ]
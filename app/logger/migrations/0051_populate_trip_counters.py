@@ -0,0 +1,36 @@
+from django.db import migrations
+from django.db.models import Count, OuterRef, Q, Subquery
+
+
+def populate_trip_counters(apps, schema_editor):
+    trip_model = apps.get_model("logger", "Trip")
+
+    def count_of(relation, **filters):
+        counts = (
+            trip_model.objects.filter(pk=OuterRef("pk"))
+            .annotate(count=Count(relation, filter=Q(**filters) if filters else None))
+            .values("count")
+        )
+        return Subquery(counts)
+
+    trip_model.objects.update(
+        likes_count=count_of("likes"),
+        comments_count=count_of("comments"),
+        valid_photo_count=count_of(
+            "photos",
+            photos__is_valid=True,
+            photos__deleted_at=None,
+            photos__photo_type="DE",
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("comments", "0003_rename_article_newscomment_news"),
+        ("logger", "0050_trip_counters"),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_trip_counters, reverse_code=migrations.RunPython.noop),
+    ]
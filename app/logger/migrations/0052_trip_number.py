@@ -0,0 +1,27 @@
+# Generated by Django 5.2.9 on 2026-10-17 04:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0051_populate_trip_counters"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trip",
+            name="number",
+            field=models.PositiveIntegerField(
+                editable=False,
+                help_text="The position of the trip in the user's trips, ordered by start time.",
+                null=True,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="trip",
+            index=models.Index(fields=["user", "start"], name="trip_user_start_idx"),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def populate_trip_number(apps, schema_editor):
+    schema_editor.execute(
+        "UPDATE logger_trip SET number = numbered.row_number "
+        "FROM ("
+        "SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY start, id DESC) AS row_number "
+        "FROM logger_trip"
+        ") AS numbered "
+        "WHERE logger_trip.id = numbered.id"
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0052_trip_number"),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_trip_number, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.9 on 2026-10-17 04:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0053_populate_trip_number"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TripScore",
+            fields=[
+                (
+                    "trip",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="score",
+                        serialize=False,
+                        to="logger.trip",
+                    ),
+                ),
+                ("score", models.FloatField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["-score"], include=("trip",), name="trip_score_idx")
+                ],
+            },
+        ),
+    ]
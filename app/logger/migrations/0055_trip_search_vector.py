@@ -0,0 +1,27 @@
+# Generated by Django 5.2.9 on 2026-10-17 05:01
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0054_tripscore"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trip",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="trip",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="trip_search_vector_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,93 @@
+from django.db import migrations
+
+# The weights here must be kept in agreement with `logger.search.SEARCH_FIELD_WEIGHTS`.
+CREATE_TRIGGERS = """
+-- Text is unaccented before it is parsed, so that accented letters are never
+-- treated as word boundaries, whatever the locale of the database.
+CREATE FUNCTION logger_trip_search_document(text) RETURNS tsvector AS $$
+    SELECT to_tsvector('simple', unaccent($1))
+$$ LANGUAGE sql STABLE;
+
+-- Build a query matching the start of every word in terms, within the given weights.
+-- The terms are parsed in the same way as the documents they are matched against.
+CREATE FUNCTION logger_trip_search_terms(query_terms text, query_weights text) RETURNS text AS $$
+    SELECT string_agg(quote_literal(lexeme) || ':*' || query_weights, ' & ')
+    FROM unnest(logger_trip_search_document(query_terms))
+$$ LANGUAGE sql STABLE;
+
+CREATE FUNCTION logger_trip_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(logger_trip_search_document(concat_ws(' ',
+            NEW.cave_name, NEW.cave_entrance, NEW.cave_exit)), 'A')
+        || setweight(logger_trip_search_document(coalesce((
+            SELECT string_agg(caver.name, ' ')
+            FROM logger_caver caver
+            INNER JOIN logger_trip_cavers trip_cavers ON trip_cavers.caver_id = caver.id
+            WHERE trip_cavers.trip_id = NEW.id
+        ), '')), 'B')
+        || setweight(logger_trip_search_document(concat_ws(' ',
+            NEW.cave_region, NEW.cave_country)), 'C')
+        || setweight(logger_trip_search_document(concat_ws(' ',
+            NEW.clubs, NEW.expedition, NEW.public_notes)), 'D');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER logger_trip_search_vector
+    BEFORE INSERT OR UPDATE OF cave_name, cave_entrance, cave_exit, cave_region,
+        cave_country, clubs, expedition, public_notes
+    ON logger_trip FOR EACH ROW EXECUTE FUNCTION logger_trip_search_vector();
+
+-- Touching a column of the trip fires the trigger above to rebuild its vector
+CREATE FUNCTION logger_trip_cavers_search_vector() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        UPDATE logger_trip SET cave_name = cave_name WHERE id = OLD.trip_id;
+    ELSE
+        UPDATE logger_trip SET cave_name = cave_name WHERE id = NEW.trip_id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER logger_trip_cavers_search_vector
+    AFTER INSERT OR DELETE ON logger_trip_cavers
+    FOR EACH ROW EXECUTE FUNCTION logger_trip_cavers_search_vector();
+
+CREATE FUNCTION logger_caver_search_vector() RETURNS trigger AS $$
+BEGIN
+    UPDATE logger_trip SET cave_name = cave_name
+    WHERE id IN (SELECT trip_id FROM logger_trip_cavers WHERE caver_id = NEW.id);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER logger_caver_search_vector
+    AFTER UPDATE OF name ON logger_caver
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION logger_caver_search_vector();
+
+UPDATE logger_trip SET cave_name = cave_name;
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER logger_caver_search_vector ON logger_caver;
+DROP FUNCTION logger_caver_search_vector();
+DROP TRIGGER logger_trip_cavers_search_vector ON logger_trip_cavers;
+DROP FUNCTION logger_trip_cavers_search_vector();
+DROP TRIGGER logger_trip_search_vector ON logger_trip;
+DROP FUNCTION logger_trip_search_vector();
+DROP FUNCTION logger_trip_search_terms(text, text);
+DROP FUNCTION logger_trip_search_document(text);
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0055_trip_search_vector"),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_TRIGGERS, reverse_sql=DROP_TRIGGERS),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.9 on 2026-10-17 05:16
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations
+
+import logger.models.trip
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0056_trip_search_vector_triggers"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            "CREATE FUNCTION immutable_unaccent(text) RETURNS text AS $$ "
+            "SELECT public.unaccent('public.unaccent'::regdictionary, $1) "
+            "$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT",
+            reverse_sql="DROP FUNCTION immutable_unaccent(text)",
+        ),
+        migrations.AddIndex(
+            model_name="caver",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    logger.models.trip.UnaccentLower("name"), name="gin_trgm_ops"
+                ),
+                name="caver_name_trgm_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="trip",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    logger.models.trip.UnaccentLower("cave_name"), name="gin_trgm_ops"
+                ),
+                name="trip_cave_name_trgm_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="trip",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    logger.models.trip.UnaccentLower("cave_entrance"), name="gin_trgm_ops"
+                ),
+                name="trip_cave_entrance_trgm_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="trip",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    logger.models.trip.UnaccentLower("cave_region"), name="gin_trgm_ops"
+                ),
+                name="trip_cave_region_trgm_idx",
+            ),
+        ),
+    ]
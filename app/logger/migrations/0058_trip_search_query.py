@@ -0,0 +1,33 @@
+from django.db import migrations
+
+# Build the query as a tsquery directly, rather than as text passed to to_tsquery(),
+# which parses each word again and can split a lexeme such as '3e4a' in two.
+CREATE_FUNCTION = """
+CREATE FUNCTION logger_trip_search_query(query_terms text, query_weights text)
+RETURNS tsquery AS $$
+    SELECT string_agg(quote_literal(lexeme) || ':*' || query_weights, ' & ')::tsquery
+    FROM unnest(logger_trip_search_document(query_terms))
+$$ LANGUAGE sql STABLE;
+
+DROP FUNCTION logger_trip_search_terms(text, text);
+"""
+
+DROP_FUNCTION = """
+CREATE FUNCTION logger_trip_search_terms(query_terms text, query_weights text)
+RETURNS text AS $$
+    SELECT string_agg(quote_literal(lexeme) || ':*' || query_weights, ' & ')
+    FROM unnest(logger_trip_search_document(query_terms))
+$$ LANGUAGE sql STABLE;
+
+DROP FUNCTION logger_trip_search_query(text, text);
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0057_trigram_indexes"),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_FUNCTION, reverse_sql=DROP_FUNCTION),
+    ]
@@ -0,0 +1,93 @@
+# Generated by Django 5.2.9 on 2026-10-17 06:27
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Kept in agreement with `CaveNameDictionaryManager.rebuild`
+POPULATE_CAVE_NAMES = """
+INSERT INTO logger_cavenamedictionary (user_id, normalized_name, display_name, usage_count)
+SELECT user_id,
+    immutable_unaccent(lower(btrim(regexp_replace(cave_name, '\\s+', ' ', 'g')))),
+    mode() WITHIN GROUP (ORDER BY btrim(regexp_replace(cave_name, '\\s+', ' ', 'g'))),
+    COUNT(*)
+FROM logger_trip
+WHERE btrim(cave_name) <> ''
+GROUP BY 1, 2;
+
+INSERT INTO logger_cavenamedictionary (user_id, normalized_name, display_name, usage_count)
+SELECT NULL::bigint,
+    immutable_unaccent(lower(btrim(regexp_replace(trip.cave_name, '\\s+', ' ', 'g')))),
+    mode() WITHIN GROUP (ORDER BY btrim(regexp_replace(trip.cave_name, '\\s+', ' ', 'g'))),
+    COUNT(*)
+FROM logger_trip trip
+INNER JOIN users_cavinguser owner ON owner.id = trip.user_id
+WHERE btrim(trip.cave_name) <> ''
+    AND (trip.privacy = 'Public' OR (trip.privacy = 'Default' AND owner.privacy = 'Public'))
+GROUP BY 1, 2;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0058_trip_search_query"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CaveNameDictionary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("normalized_name", models.TextField()),
+                ("display_name", models.CharField(max_length=100)),
+                ("usage_count", models.PositiveIntegerField(default=0)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="cave_names",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "cave name dictionary",
+                "indexes": [
+                    models.Index(
+                        django.contrib.postgres.indexes.OpClass(
+                            models.F("normalized_name"), name="text_pattern_ops"
+                        ),
+                        name="cave_name_prefix_idx",
+                    ),
+                    django.contrib.postgres.indexes.GinIndex(
+                        django.contrib.postgres.indexes.OpClass(
+                            models.F("normalized_name"), name="gin_trgm_ops"
+                        ),
+                        name="cave_name_trgm_idx",
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        condition=models.Q(("user__isnull", False)),
+                        fields=("user", "normalized_name"),
+                        name="unique_user_cave_name",
+                    ),
+                    models.UniqueConstraint(
+                        condition=models.Q(("user__isnull", True)),
+                        fields=("normalized_name",),
+                        name="unique_public_cave_name",
+                    ),
+                ],
+            },
+        ),
+        migrations.RunSQL(POPULATE_CAVE_NAMES, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.9 on 2026-10-17 06:53
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+CREATE_TRIGGER = """
+CREATE FUNCTION logger_trip_cavers_trip_count() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        UPDATE logger_caver SET trip_count = trip_count - 1 WHERE id = OLD.caver_id;
+    ELSE
+        UPDATE logger_caver SET trip_count = trip_count + 1 WHERE id = NEW.caver_id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER logger_trip_cavers_trip_count
+    AFTER INSERT OR DELETE ON logger_trip_cavers
+    FOR EACH ROW EXECUTE FUNCTION logger_trip_cavers_trip_count();
+
+UPDATE logger_caver SET trip_count = (
+    SELECT COUNT(*) FROM logger_trip_cavers WHERE caver_id = logger_caver.id
+);
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER logger_trip_cavers_trip_count ON logger_trip_cavers;
+DROP FUNCTION logger_trip_cavers_trip_count();
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0059_cavenamedictionary"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="caver",
+            name="trip_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="caver",
+            index=models.Index(
+                models.F("user"),
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Lower("name"), name="text_pattern_ops"
+                ),
+                name="caver_user_name_idx",
+            ),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, reverse_sql=DROP_TRIGGER),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 5.2.9 on 2026-10-17 11:06
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+# Kept in agreement with `TripNameManager.split`, which parses the names of each trip
+# as it is saved
+POPULATE_NAMES = """
+CREATE TEMPORARY TABLE trip_names AS
+SELECT trip.id AS trip_id, names.field, names.ordinal,
+    btrim(regexp_replace(names.part, '\\s+', ' ', 'g')) AS name
+FROM logger_trip trip,
+LATERAL (
+    SELECT 'club', part, ordinal
+    FROM regexp_split_to_table(trip.clubs, ',') WITH ORDINALITY AS parts(part, ordinal)
+    UNION ALL
+    SELECT 'expedition', part, ordinal
+    FROM regexp_split_to_table(trip.expedition, ',') WITH ORDINALITY AS parts(part, ordinal)
+) AS names(field, part, ordinal);
+
+DELETE FROM trip_names WHERE name = '';
+
+-- Keep the spelling of each name in the earliest trip, as if the trips were saved in turn
+INSERT INTO logger_club (name)
+SELECT DISTINCT ON (lower(name)) name FROM trip_names WHERE field = 'club'
+ORDER BY lower(name), trip_id, ordinal;
+
+INSERT INTO logger_club_trips (club_id, trip_id)
+SELECT DISTINCT club.id, trip_names.trip_id FROM trip_names
+INNER JOIN logger_club club ON lower(club.name) = lower(trip_names.name)
+WHERE trip_names.field = 'club';
+
+INSERT INTO logger_expedition (name)
+SELECT DISTINCT ON (lower(name)) name FROM trip_names WHERE field = 'expedition'
+ORDER BY lower(name), trip_id, ordinal;
+
+INSERT INTO logger_expedition_trips (expedition_id, trip_id)
+SELECT DISTINCT expedition.id, trip_names.trip_id FROM trip_names
+INNER JOIN logger_expedition expedition ON lower(expedition.name) = lower(trip_names.name)
+WHERE trip_names.field = 'expedition';
+
+DROP TABLE trip_names;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0060_caver_trip_count"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Club",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("name", models.CharField(max_length=100)),
+                (
+                    "trips",
+                    models.ManyToManyField(
+                        blank=True,
+                        related_name="club_set",
+                        related_query_name="linked_club",
+                        to="logger.trip",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        django.db.models.functions.text.Lower("name"), name="club_name_unique"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="Expedition",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("name", models.CharField(max_length=100)),
+                (
+                    "trips",
+                    models.ManyToManyField(
+                        blank=True,
+                        related_name="expedition_set",
+                        related_query_name="linked_expedition",
+                        to="logger.trip",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        django.db.models.functions.text.Lower("name"), name="expedition_name_unique"
+                    )
+                ],
+            },
+        ),
+        migrations.RunSQL(POPULATE_NAMES, reverse_sql=migrations.RunSQL.noop),
+    ]
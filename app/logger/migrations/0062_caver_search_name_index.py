@@ -0,0 +1,31 @@
+# Generated by Django 5.2.9 on 2026-10-17 13:30
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations, models
+
+import logger.models.trip
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0061_club_expedition"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="caver",
+            name="caver_user_name_idx",
+        ),
+        migrations.AddIndex(
+            model_name="caver",
+            index=models.Index(
+                models.F("user"),
+                django.contrib.postgres.indexes.OpClass(
+                    logger.models.trip.UnaccentLower("name"), name="text_pattern_ops"
+                ),
+                name="caver_user_name_idx",
+            ),
+        ),
+    ]
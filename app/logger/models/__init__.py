@@ -1,4 +1,17 @@
+from .cavename import CaveNameDictionary
+from .club import Club, Expedition
+from .feed import FeedEntry, TripScore
 from .trip import Caver, Trip
 from .tripphoto import TripPhoto, trip_photo_upload_path
 
-__all__ = ["Caver", "Trip", "TripPhoto", "trip_photo_upload_path"]
+__all__ = [
+    "CaveNameDictionary",
+    "Caver",
+    "Club",
+    "Expedition",
+    "FeedEntry",
+    "Trip",
+    "TripPhoto",
+    "TripScore",
+    "trip_photo_upload_path",
+]
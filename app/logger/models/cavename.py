@@ -0,0 +1,247 @@
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db import connection, models, transaction
+from django.db.models import Exists, F, OuterRef, Q, Value
+
+from .trip import Trip, UnaccentLower
+
+# A cave name with its whitespace collapsed, as shown in suggestions
+DISPLAY_NAME_SQL = "btrim(regexp_replace({}, '\\s+', ' ', 'g'))"
+# The display name of a cave name in the form it is matched on, which must be kept
+# in agreement with `CaveNameDictionaryManager.normalize`
+NORMALIZED_NAME_SQL = f"immutable_unaccent(lower({DISPLAY_NAME_SQL}))"
+
+# The fewest characters for which cave names are suggested
+SUGGESTION_MIN_LENGTH = 2
+# The most cave names suggested at once
+SUGGESTION_LIMIT = 10
+
+
+class CaveNameDictionaryManager(models.Manager):
+    def normalize(self, name):
+        """Return an expression for `name` in the form that cave names are matched on."""
+        return UnaccentLower(Value(" ".join(name.split())))
+
+    def suggest(self, user, query, limit=SUGGESTION_LIMIT):
+        """Return the display names of up to `limit` cave names matching `query`.
+
+        Names beginning with `query` are suggested before those merely containing it,
+        and the user's own cave names before those from the public set, with the most
+        used names first.
+        """
+        if len(query.strip()) < SUGGESTION_MIN_LENGTH:
+            return []
+
+        names = self.filter(Q(user=user) | Q(user__isnull=True)).order_by(
+            F("user").asc(nulls_last=True), "-usage_count"
+        )
+        normalized = self.normalize(query)
+
+        suggestions = {}
+        for lookup in ("normalized_name__startswith", "normalized_name__contains"):
+            # The same name may be both the user's own and in the public set
+            matches = names.filter(**{lookup: normalized})[: limit * 2]
+            for normalized_name, display_name in matches.values_list(
+                "normalized_name", "display_name"
+            ):
+                suggestions.setdefault(normalized_name, display_name)
+            if len(suggestions) >= limit:
+                break
+
+        return list(suggestions.values())[:limit]
+
+    def get_trip_entry(self, trip: Trip):
+        """Return the `(user_id, cave_name, is_public)` of `trip` as stored in the database.
+
+        The entry is passed to `update_trip` once the trip has been saved, so that
+        only the cave names which were changed by the save are recounted.
+        """
+        public_trips = Trip.objects.visible_to(None).filter(pk=OuterRef("pk"))
+        return (
+            Trip.objects.filter(pk=trip.pk)
+            .annotate(is_public=Exists(public_trips))
+            .values_list("user", "cave_name", "is_public")
+            .first()
+        )
+
+    def update_trip(self, trip: Trip, previous):
+        """Recount the cave name of `trip`, which was `previous` before it was saved."""
+        self._move(previous, self.get_trip_entry(trip))
+
+    def remove_trip(self, trip: Trip):
+        """Stop counting the cave name of `trip`, which is about to be deleted."""
+        self._move(self.get_trip_entry(trip), None)
+
+    def remove_trips(self, trips):
+        """Stop counting the cave names of `trips`, a queryset about to be deleted in bulk."""
+        with transaction.atomic():
+            for counted, public in ((trips, False), (trips.visible_to(None), True)):
+                sql, params = counted.values_list("user", "cave_name").query.sql_with_params()
+                self._subtract(sql, params, public=public)
+
+    def update_owner_privacy(self, owner, was_public, is_public):
+        """Recount the public cave names of `owner` after their privacy has changed.
+
+        Only trips with the default privacy follow the privacy of their owner.
+        """
+        if was_public == is_public:
+            return
+
+        trips = Trip.objects.filter(user=owner, privacy=Trip.DEFAULT)
+        sql, params = trips.values_list("user", "cave_name").query.sql_with_params()
+        with transaction.atomic():
+            if is_public:
+                self._add(sql, params, public=True)
+            else:
+                self._subtract(sql, params, public=True)
+
+    def rebuild(self):
+        """Rebuild the cave names of every user and the public set from scratch.
+
+        Returns:
+            The number of cave names stored.
+        """
+        with transaction.atomic():
+            self.all().delete()
+            for trips, public in (
+                (Trip.objects.all(), False),
+                (Trip.objects.visible_to(None), True),
+            ):
+                sql, params = trips.values_list("user", "cave_name").query.sql_with_params()
+                self._add(sql, params, public=public)
+        return self.count()
+
+    def _move(self, previous, current):
+        """Recount a trip's cave name, given its `get_trip_entry` before and after.
+
+        Either entry is None if the trip did not, or no longer does, exist.
+        """
+        if previous == current:
+            return
+
+        old_user, old_name, old_public = previous or (None, None, False)
+        new_user, new_name, new_public = current or (None, None, False)
+        with transaction.atomic():
+            if (old_user, old_name) != (new_user, new_name):
+                if old_name is not None:
+                    self._subtract("SELECT %s, %s", [old_user, old_name], public=False)
+                if new_name is not None:
+                    self._add("SELECT %s, %s", [new_user, new_name], public=False)
+            if old_public:
+                self._subtract("SELECT %s, %s", [old_user, old_name], public=True)
+            if new_public:
+                self._add("SELECT %s, %s", [new_user, new_name], public=True)
+
+    def _add(self, names_sql, params, *, public):
+        """Count each `(user_id, cave_name)` row selected by `names_sql` once more."""
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        if public:
+            user_sql = "NULL::bigint"
+            conflict = "(normalized_name) WHERE user_id IS NULL"
+        else:
+            user_sql = "names.user_id"
+            conflict = "(user_id, normalized_name) WHERE user_id IS NOT NULL"
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (user_id, normalized_name, display_name, usage_count) "
+                f"SELECT {user_sql}, {NORMALIZED_NAME_SQL.format('names.cave_name')}, "
+                f"mode() WITHIN GROUP (ORDER BY {DISPLAY_NAME_SQL.format('names.cave_name')}), "
+                f"COUNT(*) "
+                f"FROM ({names_sql}) AS names(user_id, cave_name) "
+                f"WHERE btrim(names.cave_name) <> '' "
+                f"GROUP BY 1, 2 "
+                f"ON CONFLICT {conflict} DO UPDATE SET "
+                f"usage_count = {table}.usage_count + EXCLUDED.usage_count, "
+                f"display_name = EXCLUDED.display_name",
+                params,
+            )
+
+    def _subtract(self, names_sql, params, *, public):
+        """Count each `(user_id, cave_name)` row selected by `names_sql` once less.
+
+        Cave names which are no longer used are removed.
+        """
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        if public:
+            user_sql = "NULL::bigint"
+            match_sql = f"{table}.user_id IS NULL"
+        else:
+            user_sql = "names.user_id"
+            match_sql = f"{table}.user_id = counts.user_id"
+
+        counts_sql = (
+            f"WITH counts AS ("
+            f"SELECT {user_sql} AS user_id, "
+            f"{NORMALIZED_NAME_SQL.format('names.cave_name')} AS normalized_name, "
+            f"COUNT(*) AS usage_count "
+            f"FROM ({names_sql}) AS names(user_id, cave_name) GROUP BY 1, 2) "
+        )
+        match_sql += f" AND {table}.normalized_name = counts.normalized_name"
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"{counts_sql}UPDATE {table} "
+                f"SET usage_count = GREATEST({table}.usage_count - counts.usage_count, 0) "
+                f"FROM counts WHERE {match_sql}",
+                params,
+            )
+            cursor.execute(
+                f"{counts_sql}DELETE FROM {table} USING counts "
+                f"WHERE {match_sql} AND {table}.usage_count = 0",
+                params,
+            )
+
+
+class CaveNameDictionary(models.Model):
+    """A cave name which has been logged, counted to rank it as a suggestion.
+
+    Each user has their own set of cave names, and those logged on public trips
+    are also counted in a shared set with no user. The counts are kept up to date
+    as trips are saved and deleted, and may be rebuilt with the `rebuild_cave_names`
+    command.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="cave_names",
+    )
+    # Not limited in length, as unaccenting may lengthen a name (ß becomes ss)
+    normalized_name = models.TextField()
+    display_name = models.CharField(max_length=100)
+    usage_count = models.PositiveIntegerField(default=0)
+
+    objects = CaveNameDictionaryManager()
+
+    class Meta:
+        verbose_name_plural = "cave name dictionary"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "normalized_name"],
+                condition=Q(user__isnull=False),
+                name="unique_user_cave_name",
+            ),
+            models.UniqueConstraint(
+                fields=["normalized_name"],
+                condition=Q(user__isnull=True),
+                name="unique_public_cave_name",
+            ),
+        ]
+        indexes = [
+            # Serves prefix matches regardless of the collation of the database
+            models.Index(
+                OpClass(F("normalized_name"), name="text_pattern_ops"),
+                name="cave_name_prefix_idx",
+            ),
+            # Serves matches within a name
+            GinIndex(
+                OpClass(F("normalized_name"), name="gin_trgm_ops"),
+                name="cave_name_trgm_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.display_name} ({self.usage_count})"
@@ -0,0 +1,82 @@
+from django.db import models
+from django.db.models import Q, Value
+from django.db.models.functions import Lower
+
+from .trip import Trip
+
+
+class TripNameManager(models.Manager):
+    def split(self, value):
+        """Return the names in the comma-separated list `value`, without duplicates.
+
+        Whitespace in each name is collapsed, and names which differ only in case are
+        the same, spelt as they first appear. This must be kept in agreement with the
+        parsing in the migration which first populated the names from trips, which
+        also keeps the first spelling of each name.
+        """
+        names = {}
+        for part in value.split(","):
+            name = " ".join(part.split())
+            if name:
+                names.setdefault(name.lower(), name)
+        return list(names.values())
+
+    def update_trip(self, trip: Trip):
+        """Link `trip` to the names in its comma-separated field, creating any new names."""
+        names = self.split(getattr(trip, self.model.TRIP_FIELD))
+        links = getattr(trip, f"{self.model._meta.model_name}_set")
+        if {name.lower() for name in links.values_list("name", flat=True)} == {
+            name.lower() for name in names
+        }:
+            return
+
+        pks = []
+        if names:
+            self.bulk_create([self.model(name=name) for name in names], ignore_conflicts=True)
+            matching = Q()
+            for name in names:
+                matching |= Q(lower_name=Lower(Value(name)))
+            pks = self.annotate(lower_name=Lower("name")).filter(matching).values_list("pk")
+        links.set([pk for (pk,) in pks])
+
+
+class Club(models.Model):
+    """A caving club or organisation named in the clubs of any trip."""
+
+    TRIP_FIELD = "clubs"
+
+    name = models.CharField(max_length=100)
+    trips = models.ManyToManyField(
+        Trip, blank=True, related_name="club_set", related_query_name="linked_club"
+    )
+
+    objects = TripNameManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(Lower("name"), name="club_name_unique"),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class Expedition(models.Model):
+    """An expedition named in the expeditions of any trip."""
+
+    TRIP_FIELD = "expedition"
+
+    name = models.CharField(max_length=100)
+    trips = models.ManyToManyField(
+        Trip, blank=True, related_name="expedition_set", related_query_name="linked_expedition"
+    )
+
+    objects = TripNameManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(Lower("name"), name="expedition_name_unique"),
+        ]
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,228 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .trip import Trip
+
+
+class FeedEntryManager(models.Manager):
+    def add_trip(self, trip: Trip):
+        """Fan out a trip to the feed of its owner and every friend who can view it.
+
+        This is safe to call repeatedly, and will remove the trip from the feeds of
+        friends who can no longer view it, for example after a privacy change.
+        """
+        recipients = {trip.user_id}
+        if Trip.objects.filter(pk=trip.pk).visible_to_friends().exists():
+            user_model = get_user_model()
+            recipients.update(
+                user_model.friends.through.objects.filter(from_cavinguser=trip.user_id).values_list(
+                    "to_cavinguser", flat=True
+                )
+            )
+
+        with transaction.atomic():
+            previous = self.filter(trip=trip).values_list("user", flat=True)
+            self.invalidate_feeds(recipients.union(previous))
+            self.filter(trip=trip).exclude(user__in=recipients).delete()
+            self.bulk_create(
+                [
+                    FeedEntry(user_id=pk, trip=trip, added=trip.added, start=trip.start)
+                    for pk in recipients
+                ],
+                update_conflicts=True,
+                unique_fields=["user", "trip"],
+                update_fields=["added", "start"],
+            )
+
+    def add_friendship(self, user, friend):
+        """Add each user's trips to the other user's feed."""
+        with transaction.atomic():
+            self._fan_out(owner=user, viewer=friend)
+            self._fan_out(owner=friend, viewer=user)
+            self.invalidate_feeds([user.pk, friend.pk])
+
+    def remove_friendship(self, user, friend):
+        """Remove each user's trips from the other user's feed."""
+        with transaction.atomic():
+            self.filter(user=user, trip__user=friend).delete()
+            self.filter(user=friend, trip__user=user).delete()
+            self.invalidate_feeds([user.pk, friend.pk])
+
+    def refresh_owner(self, owner):
+        """Rebuild the feed entries for all trips owned by a user.
+
+        This should be called when a change to the owner's profile, such as their
+        profile privacy, changes which of their friends can view their trips.
+        """
+        with transaction.atomic():
+            self.filter(trip__user=owner).exclude(user=owner).delete()
+            for friend in owner.friends.exclude(pk=owner.pk):
+                self._fan_out(owner=owner, viewer=friend)
+            self.invalidate_feeds([owner.pk, *owner.friends.values_list("pk", flat=True)])
+
+    def invalidate_feeds(self, users):
+        """Increment the feed version of `users`, an iterable of user primary keys.
+
+        Cached pages of their feeds will no longer be used.
+        """
+        user_model = get_user_model()
+        user_model.objects.filter(pk__in=users).update(feed_version=F("feed_version") + 1)
+
+    def invalidate_trip(self, trip: Trip):
+        """Invalidate the cached feed of every user with `trip` in their feed."""
+        self.invalidate_feeds(self.filter(trip=trip).values("user"))
+
+    def invalidate_trips(self, trips):
+        """Invalidate the cached feed of every user with any of `trips` in their feed."""
+        self.invalidate_feeds(self.filter(trip__in=trips).values("user"))
+
+    def invalidate_owner(self, owner):
+        """Invalidate the cached feed of every user with a trip by `owner` in their feed.
+
+        This should be called when something shown alongside each of the owner's
+        trips, such as their name or avatar, changes.
+        """
+        self.invalidate_feeds(self.filter(trip__user=owner).values("user"))
+
+    def _fan_out(self, owner, viewer):
+        trips = Trip.objects.filter(user=owner)
+        if owner != viewer:
+            trips = trips.visible_to_friends()
+
+        self.bulk_create(
+            [
+                FeedEntry(user=viewer, trip_id=pk, added=added, start=start)
+                for pk, added, start in trips.values_list("pk", "added", "start")
+            ],
+            ignore_conflicts=True,
+        )
+
+    def rebuild(self):
+        """Rebuild the feed of every user from scratch.
+
+        Returns:
+            The number of feed entries created.
+        """
+        own_trips = Trip.objects.values_list("user", "pk", "added", "start")
+        friends_trips = (
+            Trip.objects.visible_to_friends()
+            .filter(user__friends__isnull=False)
+            .values_list("user__friends", "pk", "added", "start")
+        )
+
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            get_user_model().objects.update(feed_version=F("feed_version") + 1)
+            self.all().delete()
+            for qs in (own_trips, friends_trips):
+                sql, params = qs.query.sql_with_params()
+                cursor.execute(
+                    f"INSERT INTO {table} (user_id, trip_id, added, start) {sql} "
+                    "ON CONFLICT DO NOTHING",
+                    params,
+                )
+        return self.count()
+
+
+class FeedEntry(models.Model):
+    """A trip in a user's social feed, written when the trip or friendship changes.
+
+    The `added` and `start` fields are copied from the trip so that each
+    `CavingUser.feed_ordering` can be served from a single index.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="feed_entries"
+    )
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name="feed_entries")
+    added = models.DateTimeField()
+    start = models.DateTimeField()
+
+    objects = FeedEntryManager()
+
+    class Meta:
+        verbose_name_plural = "feed entries"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "trip"], name="unique_feed_entry"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "-added", "-trip"], name="feed_entry_added_idx"),
+            models.Index(fields=["user", "-start", "-trip"], name="feed_entry_start_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.trip} in the feed of {self.user}"
+
+
+# Weights of each kind of engagement in a trip's discover score
+SCORE_LIKE_WEIGHT = 3
+SCORE_COMMENT_WEIGHT = 5
+SCORE_VIEW_WEIGHT = 0.1
+# How quickly the score of a trip decays with the hours since it was added
+SCORE_GRAVITY = 1.5
+# Trips added longer ago than this are not scored at all
+SCORE_MAX_AGE = timezone.timedelta(days=30)
+
+
+class TripScoreManager(models.Manager):
+    def refresh(self):
+        """Recalculate the score of every recently added public trip.
+
+        The score is the weighted sum of the trip's stored like, comment and view
+        counts, divided by `(hours since added + 2) ^ SCORE_GRAVITY` so that newer
+        trips rank higher.
+
+        Returns:
+            The number of trips scored.
+        """
+        trips = Trip.objects.visible_to(None).filter(added__gte=timezone.now() - SCORE_MAX_AGE)
+        sql, params = trips.values("pk").query.sql_with_params()
+
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        trip_table = connection.ops.quote_name(Trip._meta.db_table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            self.all().delete()
+            cursor.execute(
+                f"INSERT INTO {table} (trip_id, score) "
+                f"SELECT id, (likes_count * %s + comments_count * %s + view_count * %s + 1) "
+                f"/ POWER(EXTRACT(EPOCH FROM (NOW() - added)) / 3600 + 2, %s) "
+                f"FROM {trip_table} WHERE id IN ({sql})",
+                [
+                    SCORE_LIKE_WEIGHT,
+                    SCORE_COMMENT_WEIGHT,
+                    SCORE_VIEW_WEIGHT,
+                    SCORE_GRAVITY,
+                    *params,
+                ],
+            )
+            return cursor.rowcount
+
+    def top_trip_pks(self, limit):
+        """Return the primary keys of the `limit` highest scoring trips."""
+        return list(self.order_by("-score").values_list("trip", flat=True)[:limit])
+
+
+class TripScore(models.Model):
+    """The engagement score of a public trip, used to rank the discover feed.
+
+    Scores are recalculated in bulk by the `refresh_trip_scores` command.
+    """
+
+    trip = models.OneToOneField(
+        Trip, on_delete=models.CASCADE, primary_key=True, related_name="score"
+    )
+    score = models.FloatField()
+
+    objects = TripScoreManager()
+
+    class Meta:
+        indexes = [
+            # Covers the trip so that the top trips are read with an index-only scan
+            models.Index(fields=["-score"], include=["trip"], name="trip_score_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.trip} scored {self.score}"
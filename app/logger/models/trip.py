@@ -4,12 +4,33 @@ import uuid
 from typing import TYPE_CHECKING
 
 import humanize
+from core.counters import BufferedCounter
+from core.mixins import FullSaveExcludedFieldsMixin
 from distancefield import D, DistanceField, DistanceUnitField
 from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.gis.db import models
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.db.models import Sum
+from django.db import connection, transaction
+from django.db.models import (
+    Case,
+    Count,
+    Exists,
+    F,
+    Func,
+    OuterRef,
+    Prefetch,
+    Q,
+    Subquery,
+    Sum,
+    When,
+    Window,
+)
+from django.db.models.functions import Lower, RowNumber
 from django.http.request import HttpRequest
 from django.urls import reverse
 
@@ -22,11 +43,113 @@ from ..validators import (
 if TYPE_CHECKING:
     from users.models import CavingUser
 
+FEED_PHOTO_LIMIT = 10
+
+
+class UnaccentLower(Func):
+    """Lowercase text and remove its accents, as indexed for trigram search.
+
+    `unaccent()` is not IMMUTABLE and so cannot be used in an index expression.
+    This calls the `immutable_unaccent` wrapper created by the logger migrations.
+    """
+
+    function = "immutable_unaccent"
+    output_field = models.TextField()
+
+    def __init__(self, expression, **extra):
+        super().__init__(Lower(expression), **extra)
+
+
+# Shorter queries only match the start of caver names, as trigram indexes cannot serve them
+CAVER_SUBSTRING_MIN_LENGTH = 3
+# Users with no more cavers than this have their cavers matched from a cached list
+CAVER_CACHE_LIMIT = 500
+CAVER_CACHE_TIMEOUT = 60
+
+
+class CaverManager(models.Manager):
+    def autocomplete(self, user, query):
+        """Return the cavers of `user` matching `query`, as it is typed in.
+
+        Queries of at least `CAVER_SUBSTRING_MIN_LENGTH` characters match anywhere
+        in a caver's name, and shorter ones only at its start, ignoring case and
+        accents. Names starting with the query are listed first, followed by the
+        cavers on the most trips.
+
+        The cavers of users with no more than `CAVER_CACHE_LIMIT` of them are matched
+        from a cached list, so that each keystroke does not read their cavers from
+        the database. Both are matched on names folded by `UnaccentLower`, so that
+        the results do not depend on how many cavers a user has.
+        """
+        query = self.fold(query.strip())
+        cavers = self._get_cached_cavers(user)
+        if cavers is not None:
+            if len(query) >= CAVER_SUBSTRING_MIN_LENGTH:
+                cavers = [c for c in cavers if query in c.search_name]
+            else:
+                cavers = [c for c in cavers if c.search_name.startswith(query)]
+            return sorted(cavers, key=lambda c: not c.search_name.startswith(query))
+
+        cavers = self.filter(user=user).alias(search_name=UnaccentLower("name"))
+        if len(query) >= CAVER_SUBSTRING_MIN_LENGTH:
+            cavers = cavers.filter(search_name__contains=query)
+        else:
+            cavers = cavers.filter(search_name__startswith=query)
+        return cavers.order_by(
+            Case(When(search_name__startswith=query, then=0), default=1),
+            "-trip_count",
+            "name",
+        )
+
+    def fold(self, text):
+        """Return `text` lowercased and without its accents, as by `UnaccentLower`."""
+        # Neither changes the case or accents of ASCII differently
+        if text.isascii():
+            return text.lower()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT immutable_unaccent(lower(%s))", [text])
+            return cursor.fetchone()[0]
+
+    def invalidate_cached_cavers(self, user):
+        """Forget the cached cavers of `user`, after one is added, changed or removed."""
+        cache.delete(self._get_cache_key(user))
+
+    def _get_cache_key(self, user):
+        return f"cavers:{user.uuid}:folded"
+
+    def _get_cached_cavers(self, user):
+        """Return every caver of `user` from the cache, or None if they have too many.
+
+        Each caver has its name folded by `UnaccentLower` as `search_name`.
+        """
+        key = self._get_cache_key(user)
+        cavers = cache.get(key)
+        if cavers is None:
+            cavers = list(
+                self.filter(user=user)
+                .annotate(search_name=UnaccentLower("name"))
+                .order_by("-trip_count", "name")
+                .values_list("pk", "name", "trip_count", "search_name")[: CAVER_CACHE_LIMIT + 1]
+            )
+            cache.set(key, cavers, CAVER_CACHE_TIMEOUT)
+
+        if len(cavers) > CAVER_CACHE_LIMIT:
+            return None
+
+        result = []
+        for pk, name, trip_count, search_name in cavers:
+            caver = self.model(pk=pk, user=user, name=name, trip_count=trip_count)
+            caver.search_name = search_name
+            result.append(caver)
+        return result
 
-class Caver(models.Model):
+
+class Caver(FullSaveExcludedFieldsMixin, models.Model):
     """A caver that was on a trip."""
 
     name = models.CharField(max_length=40)
+    # Kept up to date by a database trigger on the cavers of each trip
+    trip_count = models.PositiveIntegerField(default=0, editable=False)
     added = models.DateTimeField("caver added on", auto_now_add=True)
     updated = models.DateTimeField("caver last updated", auto_now=True)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -44,6 +167,22 @@ class Caver(models.Model):
         help_text="A unique identifier for this caver.",
     )
 
+    objects = CaverManager()
+
+    FULL_SAVE_EXCLUDED_FIELDS = ("trip_count",)
+
+    class Meta:
+        indexes = [
+            GinIndex(
+                OpClass(UnaccentLower("name"), name="gin_trgm_ops"), name="caver_name_trgm_idx"
+            ),
+            models.Index(
+                F("user"),
+                OpClass(UnaccentLower("name"), name="text_pattern_ops"),
+                name="caver_user_name_idx",
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -62,14 +201,165 @@ class Caver(models.Model):
         if self.linked_account not in self.user.friends.all():
             self.linked_account = None
 
+        # Trips are searched by the names of their cavers. A new caver is not on any
+        # trips yet, so the results only change when a caver is renamed.
+        renamed = (
+            not self._state.adding and not Caver.objects.filter(pk=self.pk, name=self.name).exists()
+        )
+
         super().save(*args, **kwargs)
+        Caver.objects.invalidate_cached_cavers(self.user)
+
+        if renamed:
+            from ..search import invalidate_search_results
+
+            invalidate_search_results()
+
+    def delete(self, *args, **kwargs):
+        from ..search import invalidate_search_results
+
+        result = super().delete(*args, **kwargs)
+        Caver.objects.invalidate_cached_cavers(self.user)
+        invalidate_search_results()
+        return result
 
     def get_absolute_url(self):
         return reverse("log:caver_detail", args=[self.uuid])
 
 
+class TripQuerySet(models.QuerySet):
+    def visible_to(self, user_viewing: CavingUser | AnonymousUser | None):
+        """Return only the trips which user_viewing can view.
+
+        This expresses the rules in `Trip.is_viewable_by` as a single SQL filter,
+        and the two must be kept in agreement.
+        """
+        user_model = get_user_model()
+
+        if user_viewing is None or not user_viewing.is_authenticated:
+            return self.filter(
+                Q(privacy=Trip.PUBLIC) | Q(privacy=Trip.DEFAULT, user__privacy=user_model.PUBLIC)
+            )
+
+        # Whether user_viewing is in the friends list of the trip owner
+        is_friend = Exists(
+            user_model.friends.through.objects.filter(
+                from_cavinguser=OuterRef("user"), to_cavinguser=user_viewing.pk
+            )
+        )
+
+        return self.filter(
+            Q(user=user_viewing)
+            | Q(privacy=Trip.PUBLIC)
+            | (Q(privacy=Trip.FRIENDS) & is_friend)
+            | (
+                Q(privacy=Trip.DEFAULT)
+                & (
+                    Q(user__privacy=user_model.PUBLIC)
+                    | (Q(user__privacy=user_model.FRIENDS) & is_friend)
+                )
+            )
+        )
+
+    def visible_to_friends(self):
+        """Return only the trips which the friends of the trip owner can view."""
+        user_model = get_user_model()
+        return self.filter(
+            Q(privacy__in=[Trip.PUBLIC, Trip.FRIENDS])
+            | (Q(privacy=Trip.DEFAULT) & ~Q(user__privacy=user_model.PRIVATE))
+        )
+
+    def with_feed_photos(self):
+        """Prefetch the photos shown in the feed for each trip in a single query.
+
+        The slice is applied to each trip with a ROW_NUMBER() window, and the photos
+        are returned by `Trip.feed_photos`.
+        """
+        from .tripphoto import TripPhoto
+
+        return self.prefetch_related(
+            Prefetch(
+                "photos",
+                queryset=TripPhoto.objects.shuffled()[:FEED_PHOTO_LIMIT],
+                to_attr="prefetched_feed_photos",
+            )
+        )
+
+    def with_numbers(self):
+        """Annotate each trip with `row_number`, its position in its owner's trips by start.
+
+        The window only covers the trips in this queryset, so any filtering other
+        than by user should be applied afterwards. Use the stored `Trip.number`
+        where possible.
+        """
+        return self.annotate(
+            row_number=Window(
+                RowNumber(),
+                partition_by=F("user"),
+                order_by=[F("start").asc(), F("pk").desc()],
+            )
+        )
+
+    def renumber(self):
+        """Recalculate the stored number of every trip owned by the owners of these trips.
+
+        Returns:
+            The number of trips whose stored number was incorrect.
+        """
+        numbered = Trip.objects.filter(user__in=self.values("user")).with_numbers()
+        sql, params = numbered.values("pk", "row_number").query.sql_with_params()
+
+        table = connection.ops.quote_name(Trip._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET number = numbered.row_number FROM ({sql}) AS numbered "
+                f"WHERE {table}.id = numbered.pk "
+                f"AND {table}.number IS DISTINCT FROM numbered.row_number",
+                params,
+            )
+            return cursor.rowcount
+
+    def recount_counters(self):
+        """Recalculate the stored like, comment and valid photo counts of the trips.
+
+        Returns:
+            The number of trips whose stored counters were incorrect.
+        """
+        from .tripphoto import TripPhoto
+
+        def count_of(relation, **filters):
+            counts = (
+                Trip.objects.filter(pk=OuterRef("pk"))
+                .annotate(count=Count(relation, filter=Q(**filters) if filters else None))
+                .values("count")
+            )
+            return Subquery(counts)
+
+        actual = {
+            "likes_count": count_of("likes"),
+            "comments_count": count_of("comments"),
+            "valid_photo_count": count_of(
+                "photos",
+                photos__is_valid=True,
+                photos__deleted_at=None,
+                photos__photo_type=TripPhoto.PhotoTypes.DEFAULT,
+            ),
+        }
+
+        incorrect = self.annotate(**{f"actual_{name}": value for name, value in actual.items()})
+        incorrect = incorrect.filter(
+            ~Q(likes_count=F("actual_likes_count"))
+            | ~Q(comments_count=F("actual_comments_count"))
+            | ~Q(valid_photo_count=F("actual_valid_photo_count"))
+        )
+
+        return Trip.objects.filter(pk__in=list(incorrect.values_list("pk", flat=True))).update(
+            **actual
+        )
+
+
 # noinspection PyUnresolvedReferences
-class Trip(models.Model):
+class Trip(FullSaveExcludedFieldsMixin, models.Model):
     """Caving trip model."""
 
     # Trip types
@@ -321,6 +611,13 @@ class Trip(models.Model):
         settings.AUTH_USER_MODEL, blank=True, related_name="followed_trips"
     )
     view_count = models.IntegerField(default=0)
+    view_counter = BufferedCounter("logger.Trip", "view_count")
+
+    # Counters maintained with F() expressions by `update_counters`, so that
+    # they can be displayed without aggregating over the related tables.
+    likes_count = models.IntegerField(default=0, editable=False)
+    comments_count = models.IntegerField(default=0, editable=False)
+    valid_photo_count = models.IntegerField(default=0, editable=False)
     featured_photo = models.ForeignKey(
         "logger.TripPhoto",
         null=True,
@@ -353,6 +650,40 @@ class Trip(models.Model):
         help_text="A unique identifier for this trip.",
     )
 
+    number = models.PositiveIntegerField(
+        null=True,
+        editable=False,
+        help_text="The position of the trip in the user's trips, ordered by start time.",
+    )
+
+    # Maintained by a database trigger on this table, the cavers join table and
+    # the caver table. See `logger.search` for how the fields are weighted.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = TripQuerySet.as_manager()
+
+    COUNTER_FIELDS = ("view_count", "likes_count", "comments_count", "valid_photo_count")
+    # The search vector is always written by a database trigger
+    FULL_SAVE_EXCLUDED_FIELDS = (*COUNTER_FIELDS, "number", "search_vector")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "start"], name="trip_user_start_idx"),
+            GinIndex(fields=["search_vector"], name="trip_search_vector_idx"),
+            GinIndex(
+                OpClass(UnaccentLower("cave_name"), name="gin_trgm_ops"),
+                name="trip_cave_name_trgm_idx",
+            ),
+            GinIndex(
+                OpClass(UnaccentLower("cave_entrance"), name="gin_trgm_ops"),
+                name="trip_cave_entrance_trgm_idx",
+            ),
+            GinIndex(
+                OpClass(UnaccentLower("cave_region"), name="gin_trgm_ops"),
+                name="trip_cave_region_trgm_idx",
+            ),
+        ]
+
     def __str__(self):
         return self.cave_name
 
@@ -394,7 +725,154 @@ class Trip(models.Model):
         if not self.cave_location:
             self.cave_coordinates = None
 
-        return super().save(*args, **kwargs)
+        from stats.models import TRIP_FIELDS, UserStats, UserWeeklyStats
+
+        from .cavename import CaveNameDictionary
+        from .club import Club, Expedition
+
+        adding = self._state.adding
+        changed = {}
+        if not adding:
+            update_fields = kwargs.get("update_fields")
+            if update_fields is None:
+                update_fields = self._get_full_save_fields()
+            changed = self._get_changed_fields(update_fields)
+        count_cave_name = adding or changed.keys() & {"cave_name", "privacy", "user"}
+        link_names = adding or changed.keys() & {"clubs", "expedition"}
+        count_stats = adding or changed.keys() & TRIP_FIELDS
+        with transaction.atomic():
+            if adding:
+                self._lock_numbers()
+                self.number = self._get_number_position()
+                self._shift_numbers(self.number, None, 1)
+
+            # Keep the cave name suggestions up to date
+            previous_cave_name = None
+            if count_cave_name and not adding:
+                previous_cave_name = CaveNameDictionary.objects.get_trip_entry(self)
+
+            # Keep the owner's statistics up to date
+            if count_stats and not adding:
+                UserWeeklyStats.objects.remove_trip(self)
+                UserStats.objects.remove_trip(self)
+
+            super().save(*args, **kwargs)
+
+            if count_cave_name:
+                CaveNameDictionary.objects.update_trip(self, previous_cave_name)
+            if link_names:
+                Club.objects.update_trip(self)
+                Expedition.objects.update_trip(self)
+            if count_stats:
+                UserWeeklyStats.objects.add_trip(self)
+                UserStats.objects.add_trip(self)
+
+            if "user" in changed:
+                Trip.objects.filter(user__in=[self.user_id, changed["user"]]).renumber()
+                self.number = Trip.objects.values_list("number", flat=True).get(pk=self.pk)
+            elif "start" in changed:
+                self._lock_numbers()
+                self._move_number()
+
+        # Keep the trip's entries in the social feed up to date. They only need to be
+        # written again when who can view the trip or its position in the feed changes.
+        from .feed import FeedEntry
+
+        if adding or changed.keys() & {"user", "privacy", "start"}:
+            FeedEntry.objects.add_trip(self)
+        else:
+            FeedEntry.objects.invalidate_trip(self)
+
+        from ..search import SEARCH_RESULT_FIELDS, invalidate_search_results
+
+        if adding or changed.keys() & SEARCH_RESULT_FIELDS:
+            invalidate_search_results()
+        self._invalidate_owner_totals()
+
+    def delete(self, *args, **kwargs):
+        from stats.models import UserStats, UserWeeklyStats
+
+        from ..search import invalidate_search_results
+        from .cavename import CaveNameDictionary
+        from .feed import FeedEntry
+
+        with transaction.atomic():
+            FeedEntry.objects.invalidate_trip(self)
+            CaveNameDictionary.objects.remove_trip(self)
+            UserWeeklyStats.objects.remove_trip(self)
+            UserStats.objects.remove_trip(self)
+            self._lock_numbers()
+            number = Trip.objects.values_list("number", flat=True).get(pk=self.pk)
+            result = super().delete(*args, **kwargs)
+            if number is not None:
+                self._shift_numbers(number + 1, None, -1)
+
+        invalidate_search_results()
+        self._invalidate_owner_totals()
+        return result
+
+    def _get_changed_fields(self, update_fields):
+        """Return the stored value of each field in `update_fields` which this save changes.
+
+        The bookkeeping done by `save` is only needed for the fields that change, and
+        most edits of a trip only change a few of them.
+        """
+        fields = [self._meta.get_field(name) for name in update_fields]
+        # Loaded as a trip, so that each value is converted like those of this instance
+        stored = Trip.objects.only(*[field.attname for field in fields]).filter(pk=self.pk).first()
+        if stored is None:
+            return {field.name: None for field in fields}
+        return {
+            field.name: getattr(stored, field.attname)
+            for field in fields
+            if getattr(stored, field.attname) != getattr(self, field.attname)
+        }
+
+    def _invalidate_owner_totals(self):
+        """Forget the totals cached on the owner, if it was loaded through this trip."""
+        if self._meta.get_field("user").is_cached(self):
+            self.user.invalidate_distance_totals()
+
+    def _lock_numbers(self):
+        """Lock the owner's row so that their trips are renumbered one at a time."""
+        user_model = get_user_model()
+        list(user_model.objects.select_for_update().filter(pk=self.user_id).values_list("pk"))
+
+    def _get_number_position(self):
+        """Return the number this trip should have amongst its owner's other trips.
+
+        Trips are ordered by start time and then by newest first. A trip which has
+        not been saved yet will have the highest primary key.
+        """
+        before = Q(start__lt=self.start)
+        if self.pk:
+            before |= Q(start=self.start, pk__gt=self.pk)
+        return Trip.objects.filter(before, user=self.user_id).exclude(pk=self.pk).count() + 1
+
+    def _shift_numbers(self, first, last, delta):
+        """Add `delta` to the number of the owner's other trips from `first` to `last`."""
+        trips = Trip.objects.filter(user=self.user_id, number__gte=first).exclude(pk=self.pk)
+        if last is not None:
+            trips = trips.filter(number__lte=last)
+        trips.update(number=F("number") + delta)
+
+    def _move_number(self):
+        """Move the trip to its new position after its start time has changed."""
+        old = Trip.objects.values_list("number", flat=True).get(pk=self.pk)
+        new = self._get_number_position()
+        if old == new:
+            self.number = new
+            return
+
+        if old is None:
+            self._shift_numbers(new, None, 1)
+        elif new > old:
+            self._shift_numbers(old + 1, new, -1)
+        else:
+            self._shift_numbers(new, old - 1, 1)
+
+        Trip.objects.filter(pk=self.pk).update(number=new)
+        self.number = new
 
     def clean(self):
         # Check self.start exists - may have been removed by form validation
@@ -428,17 +906,24 @@ class Trip(models.Model):
 
         return False
 
-    def _build_liked_str(self, liked_user_names, self_liked=False, name_limit=2):
-        """Builds a string from a list of user names."""
+    def _build_liked_str(self, liked_user_names, self_liked=False, name_limit=2, total=None):
+        """Builds a string from a list of user names.
+
+        If `liked_user_names` only holds the names which will be displayed, `total`
+        is the number of users that liked the trip, including the current user.
+        """
         if name_limit <= 0:
             raise ValueError("name_limit must be greater than 0")
 
-        if not liked_user_names:
+        if total is None:
+            total = len(liked_user_names)
+
+        if not total:
             return "0 likes"
 
         # Limit the number of names
-        if len(liked_user_names) > name_limit:
-            number_of_others = len(liked_user_names) - name_limit
+        if total > name_limit:
+            number_of_others = total - name_limit
             liked_user_names = liked_user_names[:name_limit]
             if number_of_others == 1:
                 if self_liked:
@@ -456,38 +941,43 @@ class Trip(models.Model):
         english_list = english_list + " and " + liked_user_names[-1]
         return f"Liked by {english_list}"
 
-    def get_liked_str(self, for_user=None, for_user_friends=None):
-        """Returns a string of the names of the users that liked the trip."""
-        friends_liked = []
-        others_liked = []
-        self_liked = False
-
-        for user in self.likes.all():
-            if for_user and user == for_user:
-                self_liked = True
-                continue
-
-            if for_user_friends and user in for_user_friends:
-                friends_liked.append(user.name)
-            else:
-                others_liked.append(user.name)
-
-        # Ensure the user's friends are shown first
-        liked_user_names = []
-        liked_user_names.extend(friends_liked)
-        liked_user_names.extend(others_liked)
-        if self_liked:
-            liked_user_names.append("you")
-
-        return self._build_liked_str(liked_user_names, self_liked)
-
-    def add_view(self, request: HttpRequest, commit=True):
-        if request.user.is_anonymous or self.user == request.user:
+    def update_counters(self, **deltas):
+        """Add each delta to the named counter field in the database.
+
+        For example, `trip.update_counters(likes_count=1)`. The new values are
+        loaded back onto the instance, and cached feeds showing the trip are
+        invalidated.
+        """
+        from .feed import FeedEntry
+
+        Trip.objects.filter(pk=self.pk).update(
+            **{name: F(name) + delta for name, delta in deltas.items()}
+        )
+        self.refresh_from_db(fields=list(deltas))
+        FeedEntry.objects.invalidate_trip(self)
+
+    def add_like(self, user) -> bool:
+        """Like the trip as `user`, returning False if they had already liked it."""
+        with transaction.atomic():
+            _, created = Trip.likes.through.objects.get_or_create(trip=self, cavinguser=user)
+            if created:
+                self.update_counters(likes_count=1)
+        return created
+
+    def remove_like(self, user) -> bool:
+        """Unlike the trip as `user`, returning False if they had not liked it."""
+        with transaction.atomic():
+            deleted, _ = Trip.likes.through.objects.filter(trip=self, cavinguser=user).delete()
+            if deleted:
+                self.update_counters(likes_count=-deleted)
+        return bool(deleted)
+
+    def add_view(self, request: HttpRequest):
+        if request.user.is_anonymous or self.user_id == request.user.pk:
             return
 
         self.view_count += 1
-        if commit:
-            self.save(update_fields=["view_count"])
+        self.view_counter.increment(self.pk)
 
     @property
     def latitude(self):
@@ -531,13 +1021,6 @@ class Trip(models.Model):
             return self.user.is_public
         return self.privacy == self.PUBLIC
 
-    @property
-    def number(self):
-        """Returns the 'index' of the trip by date."""
-        qs = Trip.objects.filter(user=self.user).order_by("start", "-pk")
-        index = list(qs.values_list("pk", flat=True)).index(self.pk)
-        return index + 1
-
     @property
     def custom_fields(self) -> tuple[tuple[str, str], ...]:
         """Returns a tuple of (field_label, value) for valid custom fields."""
@@ -570,4 +1053,6 @@ class Trip(models.Model):
 
     @property
     def feed_photos(self):
-        return self.valid_photos.order_by("?")[:10]
+        if hasattr(self, "prefetched_feed_photos"):
+            return self.prefetched_feed_photos
+        return self.photos.shuffled()[:FEED_PHOTO_LIMIT]
@@ -4,6 +4,9 @@ import uuid
 from django.conf import settings
 from django.core.files.storage import storages
 from django.db import models
+from django.db.models import CharField, Value
+from django.db.models.functions import MD5, Cast, Concat
+from django.utils import timezone
 
 from .trip import Trip
 
@@ -18,6 +21,21 @@ class TripPhotoManager(models.Manager):
     def deleted(self):
         return self.filter(deleted_at__isnull=False)
 
+    def shuffled(self, seed=None):
+        """Return valid photos in a pseudo-random order which is stable for a day.
+
+        Photos are ordered by the MD5 hash of their UUID and `seed`, which defaults
+        to today's date, so the same photos are chosen on every render that day.
+        """
+        if seed is None:
+            seed = timezone.localdate().isoformat()
+
+        return (
+            self.valid()
+            .annotate(shuffle_key=MD5(Concat(Cast("uuid", CharField()), Value(seed))))
+            .order_by("shuffle_key")
+        )
+
 
 def trip_photo_upload_path(instance, filename):
     """Returns the path to upload trip photos to."""
@@ -1,19 +1,287 @@
-from django.db.models import Q
+import hashlib
+import json
+
+from attrs import field, frozen
+from django.contrib.postgres.lookups import TrigramSimilar
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Exists, F, FloatField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Cast, ExtractYear, Greatest
 from users.models import CavingUser
 
-from .models import Trip
+from .models import Caver, Trip
+from .models.trip import UnaccentLower
 
 User = CavingUser
 
+# The weight of each search field in `Trip.search_vector`, which must be kept in
+# agreement with the trigger that maintains it. Trip public notes are searched with
+# weight D, alongside clubs and expeditions.
+SEARCH_FIELD_WEIGHTS = {
+    "cave_name": "A",
+    "cave_entrance": "A",
+    "cave_exit": "A",
+    "cavers": "B",
+    "region": "C",
+    "country": "C",
+    "clubs": "D",
+    "expedition": "D",
+}
+
+# The search fields with a trigram index, which can be used by a fuzzy search, and the
+# minimum similarity of a match. The threshold is the pg_trgm default.
+FUZZY_SEARCH_FIELDS = {
+    "cave_name": "cave_name",
+    "cave_entrance": "cave_entrance",
+    "region": "cave_region",
+}
+FUZZY_SIMILARITY_THRESHOLD = 0.3
+
+# The trip fields which change which trips a search matches for each viewer, or how
+# the matches are ordered and counted. Cached results are kept when others change.
+SEARCH_RESULT_FIELDS = frozenset(
+    [
+        "cave_name",
+        "cave_entrance",
+        "cave_exit",
+        "cave_region",
+        "cave_country",
+        "clubs",
+        "expedition",
+        "public_notes",
+        "type",
+        "start",
+        "privacy",
+        "user",
+    ]
+)
+
+SEARCH_PAGE_SIZE = 10
+SEARCH_STREAM_CHUNK_SIZE = 500
+SEARCH_CACHE_TIMEOUT = 60 * 15
+SEARCH_VERSION_KEY = "search:trip_version"
+
+# The fields of each trip streamed by `stream_trip_search`, alongside the username
+# of its owner. The private notes of the trip are never included.
+SEARCH_STREAM_FIELDS = (
+    "uuid",
+    "cave_name",
+    "cave_entrance",
+    "cave_exit",
+    "cave_region",
+    "cave_country",
+    "type",
+    "start",
+    "end",
+    "duration",
+    "clubs",
+    "expedition",
+    "public_notes",
+)
+
+
+@frozen
+class SearchPage:
+    """A page of trip search results.
+
+    `count` and `facets` cover every matching trip, rather than only those on the
+    page. Each facet is a list of `(value, count)` pairs, most common first.
+    """
+
+    object_list: list[Trip]
+    count: int = 0
+    facets: dict[str, list[tuple]] = field(factory=dict)
+    next_cursor: str | None = None
 
-def trip_search(*, terms, for_user, search_user=None, type=None, fields=None) -> list:
-    """Search through trips and return a list of results."""
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def trip_search(
+    *,
+    terms,
+    for_user,
+    search_user=None,
+    type=None,
+    country=None,
+    year=None,
+    fields=None,
+    fuzzy=False,
+    similarity_threshold=FUZZY_SIMILARITY_THRESHOLD,
+    cursor=None,
+) -> SearchPage:
+    """Search through trips and return a page of results, with facet counts.
+
+    Results are ordered by how well they match, and `cursor` is the position of the
+    first trip on the page, as returned by `SearchPage.next_cursor`.
+
+    A fuzzy search tolerates misspelt terms by matching them against the trigram
+    indexed fields, and orders the results by their similarity to the terms.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
     if not terms:  # pragma: no cover
-        return []
+        return SearchPage(object_list=[])
 
     if fields is None:  # pragma: no cover
         fields = []
 
+    # Decode the cursor before running any queries, so that a bad one fails early
+    offset = decode_search_cursor(cursor) if cursor else 0
+
+    # Matching trips are cached for each search by each viewer, so that paging
+    # through and returning to the results only needs a primary key lookup.
+    search = {
+        "terms": terms,
+        "for_user": for_user,
+        "search_user": search_user,
+        "type": type,
+        "country": country,
+        "year": year,
+        "fields": fields,
+        "fuzzy": fuzzy,
+        "similarity_threshold": similarity_threshold,
+    }
+    cache_key = _get_cache_key(**search)
+    matches = cache.get(cache_key)
+    if matches is None:
+        matches = _get_matches(**search)
+        cache.set(cache_key, matches, SEARCH_CACHE_TIMEOUT)
+
+    trip_ids = matches["trip_ids"][offset : offset + SEARCH_PAGE_SIZE]
+    trips = Trip.objects.select_related("user").prefetch_related("cavers").in_bulk(trip_ids)
+    object_list = [trips[pk] for pk in trip_ids if pk in trips]
+
+    next_cursor = None
+    if offset + SEARCH_PAGE_SIZE < len(matches["trip_ids"]):
+        next_cursor = encode_search_cursor(offset + SEARCH_PAGE_SIZE)
+
+    return SearchPage(
+        object_list=object_list,
+        count=matches["count"],
+        facets=matches["facets"],
+        next_cursor=next_cursor,
+    )
+
+
+def stream_trip_search(
+    *,
+    terms,
+    for_user,
+    search_user=None,
+    type=None,
+    country=None,
+    year=None,
+    fields=None,
+    fuzzy=False,
+    similarity_threshold=FUZZY_SIMILARITY_THRESHOLD,
+    chunk_size=SEARCH_STREAM_CHUNK_SIZE,
+):
+    """Yield every trip matching a search as a dict of `SEARCH_STREAM_FIELDS`.
+
+    Trips are ordered as in `trip_search`, and are read `chunk_size` at a time by
+    paging through the search from the relevance, start and primary key of the last
+    trip read. Each chunk is read in a short transaction of its own, so that neither
+    memory use nor the time before the first trip is sent grows with the number of
+    results, and no transaction is held open while the trips are sent to a slow
+    client. As the whole search is made for each chunk, a trip which can no longer
+    be viewed once the stream has started is left out.
+    """
+    if not terms:  # pragma: no cover
+        return
+
+    results = _search_trips(
+        terms=terms,
+        for_user=for_user,
+        search_user=search_user,
+        type=type,
+        country=country,
+        year=year,
+        fields=fields or [],
+        fuzzy=fuzzy,
+    )
+    if results is None:
+        return
+
+    # The relevance is read as a double, as a real is rounded when it is read and so
+    # could not be compared with the relevance of the last trip in a chunk
+    results = (
+        results.annotate(rank=Cast("relevance", FloatField()))
+        .order_by("-rank", "-start", "-pk")
+        .values("rank", "pk", *SEARCH_STREAM_FIELDS, username=F("user__username"))
+    )
+    chunk = results
+    while True:
+        # The similarity threshold only lasts until the end of the transaction
+        with transaction.atomic():
+            if fuzzy:
+                _set_similarity_threshold(similarity_threshold)
+            trips = list(chunk[:chunk_size])
+
+        if not trips:
+            return
+        last = trips[-1]
+        chunk = results.filter(
+            Q(rank__lt=last["rank"])
+            | Q(rank=last["rank"], start__lt=last["start"])
+            | Q(rank=last["rank"], start=last["start"], pk__lt=last["pk"])
+        )
+
+        for trip in trips:
+            del trip["rank"], trip["pk"]
+            yield trip
+
+        if len(trips) < chunk_size:
+            return
+
+
+def _get_matches(
+    *, terms, for_user, search_user, type, country, year, fields, fuzzy, similarity_threshold
+) -> dict:
+    """Return the ordered primary keys of the trips matching a search, with facet counts."""
+    results = _search_trips(
+        terms=terms,
+        for_user=for_user,
+        search_user=search_user,
+        type=type,
+        country=country,
+        year=year,
+        fields=fields,
+        fuzzy=fuzzy,
+    )
+    if results is None:
+        return {"trip_ids": [], "count": 0, "facets": {}}
+
+    with transaction.atomic():
+        if fuzzy:
+            _set_similarity_threshold(similarity_threshold)
+
+        trip_ids = list(
+            results.order_by("-relevance", "-start", "-pk").values_list("pk", flat=True)
+        )
+        count, facets = _get_facets(results)
+
+    return {"trip_ids": trip_ids, "count": count, "facets": facets}
+
+
+def _search_trips(*, terms, for_user, search_user, type, country, year, fields, fuzzy):
+    """Return the trips matching a search, annotated with their relevance.
+
+    Returns:
+        None if a fuzzy search was made without any fields that support it.
+    """
     # Progressively and lazily build up the query:
     # The base QuerySet will either be the user searched for, or
     # public trips + trips of the user's friends.
@@ -23,41 +291,175 @@ def trip_search(*, terms, for_user, search_user=None, type=None, fields=None) ->
         friends = for_user.friends.all()
         results = Trip.objects.filter(
             Q(user=for_user) | Q(user__in=friends) | Q(privacy=Trip.PUBLIC)
-        ).distinct("pk")
+        )
 
-    # Filter by trip type if provided
+    # Remove trips that the user doesn't have permission to view
+    results = results.visible_to(for_user)
+
+    # Filter by trip type, country and year if provided
     if type and type.lower() != "any":
         results = results.filter(type=type)
+    if country:
+        results = results.filter(cave_country=country)
+    if year:
+        results = results.filter(start__year=year)
 
-    # Progressively add each search field with the appropriate weight
-    # fields being falsey is treated as 'any field'.
-    queries = _build_search_field_queries(terms, fields, for_user)
-    results = results.filter(queries)
+    # Annotate each matching trip with its relevance, or how well it matches the terms.
+    # No fields selected is treated as 'any field'.
+    if fuzzy:
+        return _filter_fuzzy(results, terms, fields)
 
-    # Prefetch related users and their friends
-    results = results.select_related("user").prefetch_related("user__friends")
+    query = _build_search_query(terms, fields)
+    return results.filter(search_vector=query).annotate(
+        relevance=SearchRank(F("search_vector"), query)
+    )
 
-    # Remove trips that the user doesn't have permission to view
-    return [x for x in results if x.is_viewable_by(for_user)]
 
+def encode_search_cursor(offset: int) -> str:
+    """Return a cursor pointing at the trip `offset` places into the search results."""
+    return str(offset)
+
+
+def decode_search_cursor(cursor: str) -> int:
+    """Return the offset encoded in a search cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    offset = int(cursor)
+    if offset < 0:
+        raise ValueError(f"Invalid search cursor: {cursor}")
+    return offset
+
+
+def invalidate_search_results():
+    """Invalidate every cached search result.
+
+    This should be called whenever a trip is added or deleted, a change is made to
+    one of its `SEARCH_RESULT_FIELDS` or cavers, or a change is made to who can view
+    trips, such as to the privacy of a user's profile.
+    """
+    cache.add(SEARCH_VERSION_KEY, 0, timeout=None)
+    cache.incr(SEARCH_VERSION_KEY)
+
+
+def _get_cache_key(*, terms, for_user, search_user, fields, **params) -> str:
+    """Return the cache key of a search by for_user.
+
+    The key includes the version of the trip table, and a hash of the set of users
+    whose trips for_user can view as a friend, as search results depend on both.
+    """
+    version = cache.get_or_set(SEARCH_VERSION_KEY, 0, timeout=None)
+    friend_ids = sorted(for_user.friends.values_list("pk", flat=True))
+    key_data = {
+        "terms": " ".join(terms.lower().split()),
+        "search_user": search_user.pk if search_user else None,
+        "fields": sorted(fields),
+        "friends": friend_ids,
+        **params,
+    }
+    digest = hashlib.md5(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+    return f"search:{version}:{for_user.uuid}:{digest}"
+
+
+def _get_facets(results) -> tuple[int, dict[str, list[tuple]]]:
+    """Count the trips in results by type, country and year in a single query.
+
+    Each facet is a grouping set over the same scan of the matching trips, and the
+    empty grouping set gives the total.
+
+    Returns:
+        The total number of trips, and a dict of each facet's `(value, count)` pairs.
+    """
+    sql, params = (
+        results.annotate(year=ExtractYear("start"))
+        .order_by()
+        .values("type", "cave_country", "year")
+        .query.sql_with_params()
+    )
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT GROUPING(type, cave_country, year), type, cave_country, year, COUNT(*) "
+            f"FROM ({sql}) AS matches "
+            "GROUP BY GROUPING SETS ((type), (cave_country), (year), ()) "
+            "ORDER BY COUNT(*) DESC",
+            params,
+        )
+        rows = cursor.fetchall()
+
+    # GROUPING() sets a bit for each column that is not part of the grouping set
+    grouping_sets = {0b011: ("type", 1), 0b101: ("country", 2), 0b110: ("year", 3)}
+    count = 0
+    facets = {name: [] for name, _ in grouping_sets.values()}
+    for row in rows:
+        if row[0] == 0b111:
+            count = row[4]
+        else:
+            name, column = grouping_sets[row[0]]
+            if row[column]:
+                facets[name].append((row[column], row[4]))
+
+    return count, facets
+
+
+def _filter_fuzzy(results, terms, fields):
+    """Return the trips in results with a selected field similar to terms.
+
+    Each field is matched with the `%` operator against the same expression as its
+    trigram index, so that the index is used. The operator compares similarity to
+    `pg_trgm.similarity_threshold`, set by `_set_similarity_threshold`.
+
+    Returns:
+        The matching trips, annotated with their greatest similarity as `relevance`,
+        or None if none of the fields can be searched with trigrams.
+    """
+    terms = UnaccentLower(Value(terms))
+    matches = Q()
+    similarities = []
+
+    for search_field, column in FUZZY_SEARCH_FIELDS.items():
+        if search_field in fields or not fields:
+            matches |= TrigramSimilar(UnaccentLower(column), terms)
+            similarities.append(TrigramSimilarity(UnaccentLower(column), terms))
 
-def _build_search_field_queries(terms, fields, for_user) -> Q:
-    queries = Q()
     if "cavers" in fields or not fields:
-        queries |= Q(cavers__name__unaccent__icontains=terms)
-    if "cave_name" in fields or not fields:
-        queries |= Q(cave_name__unaccent__icontains=terms)
-    if "cave_entrance" in fields or not fields:
-        queries |= Q(cave_entrance__unaccent__icontains=terms)
-    if "cave_exit" in fields or not fields:
-        queries |= Q(cave_exit__unaccent__icontains=terms)
-    if "region" in fields or not fields:
-        queries |= Q(cave_region__unaccent__icontains=terms)
-    if "country" in fields or not fields:
-        queries |= Q(cave_country__unaccent__iexact=terms)
-    if "clubs" in fields or not fields:
-        queries |= Q(clubs__unaccent__icontains=terms)
-    if "expedition" in fields or not fields:
-        queries |= Q(expedition__unaccent__icontains=terms)
-
-    return queries
+        cavers = Caver.objects.filter(trip=OuterRef("pk")).annotate(
+            similarity=TrigramSimilarity(UnaccentLower("name"), terms)
+        )
+        matches |= Exists(cavers.filter(TrigramSimilar(UnaccentLower("name"), terms)))
+        similarities.append(Subquery(cavers.order_by("-similarity").values("similarity")[:1]))
+
+    if not similarities:
+        return None
+
+    relevance = Greatest(*similarities) if len(similarities) > 1 else similarities[0]
+    return results.filter(matches).annotate(relevance=relevance)
+
+
+def _set_similarity_threshold(similarity_threshold):
+    """Set the minimum similarity of a trigram match for the current transaction."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT set_config('pg_trgm.similarity_threshold', %s, true)",
+            [str(similarity_threshold)],
+        )
+
+
+class PrefixSearchQuery(SearchQuery):
+    """A query matching the start of each word in terms, within the given weights.
+
+    The query is built by the `logger_trip_search_query` database function, which
+    parses the terms in the same way as `Trip.search_vector`.
+    """
+
+    def __init__(self, terms, weights=""):
+        super().__init__(terms)
+        self.function = "logger_trip_search_query"
+        self.set_source_expressions([Value(terms), Value(weights)])
+
+
+def _build_search_query(terms, fields) -> SearchQuery:
+    """Return a query matching the start of each word in terms, within the weights of fields."""
+    weights = "".join(sorted({SEARCH_FIELD_WEIGHTS[search_field] for search_field in fields}))
+    return PrefixSearchQuery(terms, weights)
@@ -1,13 +1,17 @@
 import typing
+from collections import defaultdict
+from datetime import UTC, datetime, timedelta
 
 import boto3
+from attrs import frozen
 from django.conf import settings
-from django.core.paginator import EmptyPage, Paginator
-from django.db.models import Case, Count, Exists, OuterRef, Q, Value, When
+from django.core.cache import cache
+from django.db.models import Count, Exists, F, OuterRef, Q, Value, Window
+from django.db.models.functions import RowNumber
 from django.http import HttpRequest
 from users.models import CavingUser
 
-from .models import Trip, TripPhoto
+from .models import FeedEntry, Trip, TripScore
 
 User = CavingUser
 
@@ -46,67 +50,226 @@ def generate_s3_presigned_post(upload_path, content_type, max_bytes=10485760):
     return aws_response
 
 
-def get_trips_context(request, ordering, page=1):
-    """Return a paginated list of trips that the user has permission to view."""
-    friends = request.user.friends.all()
+FEED_PAGE_SIZE = 10
+FEED_CACHE_TIMEOUT = 60 * 15
+DISCOVER_TRIP_LIMIT = 20
+LIKED_STR_NAME_LIMIT = 2
+FEED_CURSOR_EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+
+
+@frozen
+class FeedPage:
+    """A single page of trips from the social feed.
+
+    Pages are addressed by a cursor rather than a page number, so that fetching
+    a page is a range scan of exactly the rows it contains, regardless of how far
+    down the feed the user has scrolled.
+    """
+
+    object_list: list[Trip]
+    next_cursor: str | None = None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def encode_feed_cursor(trip: Trip, ordering: str) -> str:
+    """Return a cursor pointing at `trip` for the given feed ordering."""
+    value = getattr(trip, _get_feed_ordering_field(ordering))
+    microseconds = (value - FEED_CURSOR_EPOCH) // timedelta(microseconds=1)
+    return f"{microseconds}.{trip.pk}"
+
+
+def decode_feed_cursor(cursor: str) -> tuple[datetime, int]:
+    """Return the (timestamp, pk) pair encoded in a feed cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    microseconds, _, pk = cursor.partition(".")
+    return FEED_CURSOR_EPOCH + timedelta(microseconds=int(microseconds)), int(pk)
+
+
+def _get_feed_ordering_field(ordering: str) -> str:
+    if ordering not in (User.FEED_ADDED, User.FEED_DATE):
+        raise ValueError(f"Invalid feed ordering: {ordering}")
+    return ordering.lstrip("-")
+
+
+def get_trips_context(request, ordering, cursor=None):
+    """Return a page of trips that the user has permission to view.
+
+    The feed is read from the user's `FeedEntry` rows, ordered by
+    `(ordering, trip)` descending, and `cursor` is the position of the last
+    trip on the previous page, as returned by `FeedPage.next_cursor`.
+
+    Raises:
+        ValueError: If the ordering or cursor is invalid.
+    """
+    field = _get_feed_ordering_field(ordering)
+    entries = FeedEntry.objects.filter(user=request.user).order_by(f"-{field}", "-trip")
+
+    if cursor:
+        value, pk = decode_feed_cursor(cursor)
+        entries = entries.filter(**{f"{field}__lte": value}).filter(
+            Q(**{f"{field}__lt": value}) | Q(**{field: value, "trip__lt": pk})
+        )
+
+    # Fetch one extra trip to find out whether there is another page.
+    trip_pks = list(entries.values_list("trip", flat=True)[: FEED_PAGE_SIZE + 1])
+    if not trip_pks:
+        return []
+
+    has_next = len(trip_pks) > FEED_PAGE_SIZE
+    object_list = _get_feed_trips(request, trip_pks[:FEED_PAGE_SIZE])
+    if not object_list:
+        return []
+
+    next_cursor = None
+    if has_next:
+        next_cursor = encode_feed_cursor(object_list[-1], ordering)
+
+    return FeedPage(object_list=object_list, next_cursor=next_cursor)
+
+
+def get_discover_context(request):
+    """Return the highest scoring public trips for the discover feed.
+
+    Trips are ranked by `TripScore`, and any trip which is no longer public
+    since the scores were last refreshed is left out.
+    """
+    trip_pks = TripScore.objects.top_trip_pks(DISCOVER_TRIP_LIMIT)
+    trips = _get_feed_trips(request, trip_pks, Trip.objects.visible_to(None))
+    return {
+        "trips": FeedPage(object_list=trips),
+        "liked_str": get_liked_str_context(request, trips),
+    }
+
+
+def _get_feed_trips(request, trip_pks, queryset=None):
+    """Return the trips in `trip_pks`, in the same order, ready to be shown in the feed."""
+    if queryset is None:
+        queryset = Trip.objects.all()
 
     trips = (
-        Trip.objects.filter(Q(user__in=friends) | Q(user=request.user))
+        queryset.filter(pk__in=trip_pks)
         .select_related("user")
-        .prefetch_related("photos", "cavers", "likes", "user__friends")
+        .prefetch_related("cavers")
+        .with_feed_photos()
+        .annotate(
+            user_liked=Exists(
+                User.objects.filter(pk=request.user.pk, liked_trips=OuterRef("pk")).only("pk")
+            ),
+        )
+        .in_bulk()
     )
+    return [trips[pk] for pk in trip_pks if pk in trips]
 
-    # There is a behaviour in Django where the following line:
-    #        comments_count=Count("comments", distinct=True),
-    # will cause the query to take a very long time when no comments exist.
-    # I am not sure why this is the case, but the following line will
-    # prevent this from happening and hence slowing down tests significantly,
-    # at the cost of an extra query.
-    if not trips.exists():
-        return []
 
-    trips = trips.annotate(
-        likes_count=Count("likes", distinct=True),
-        comments_count=Count("comments", distinct=True),
-        user_liked=Exists(
-            User.objects.filter(pk=request.user.pk, liked_trips=OuterRef("pk")).only("pk")
-        ),
-        has_photos=Exists(TripPhoto.objects.valid().filter(trip=OuterRef("pk")).only("pk")),
-        photo_count=Count(
-            "photos",
-            filter=Q(photos__is_valid=True, photos__deleted_at=None),
-            distinct=True,
-        ),
-        more_than_five_photos=Case(
-            When(photo_count__gt=5, then=Value(True)),
-        ),
-    ).order_by(ordering)[:100]
-
-    # Remove trips that the user does not have permission to view.
-    sanitised_trips = [x for x in trips if x.is_viewable_by(request.user)]
-
-    try:
-        return Paginator(
-            object_list=sanitised_trips, per_page=10, allow_empty_first_page=False
-        ).page(page)
-    except EmptyPage:
-        return []
+def get_feed_context(request, ordering, cursor=None):
+    """Return the trips and liked strings for a page of the feed, cached per viewer.
+
+    The cache key includes the viewer's `feed_version`, which is incremented by
+    `FeedEntry.objects.invalidate_feeds` whenever anything shown in their feed
+    changes, so a cached page is only used while it is up to date. This covers the
+    trips, their cavers, photos, likes and comments, the names and avatars of their
+    owners, and the viewer's units and timezone. Anything else read while rendering
+    a page may be up to `FEED_CACHE_TIMEOUT` seconds out of date.
+
+    Raises:
+        ValueError: If the ordering or cursor is invalid.
+    """
+    if cursor:
+        decode_feed_cursor(cursor)
 
+    user = request.user
+    key = f"feed:{user.uuid}:{user.feed_version}:{ordering}:{cursor or ''}"
+    context = cache.get(key)
+    if context is None:
+        trips = get_trips_context(request, ordering, cursor)
+        context = {"trips": trips, "liked_str": get_liked_str_context(request, trips)}
+        cache.set(key, context, FEED_CACHE_TIMEOUT)
+
+    return context
+
+
+def get_liked_str_context(request, trips, name_limit=LIKED_STR_NAME_LIMIT):
+    """Return a dictionary of liked strings for each trip.
+
+    The likes for every trip are fetched in a single query, which uses a window
+    function to rank the viewer's own like first, followed by the likes of their
+    friends, and to count the likes of each trip. Only the first `name_limit + 1`
+    likes of each trip are loaded.
+    """
+    trips = list(trips)
+    if not trips:
+        return {}
+
+    viewer = request.user
+    if viewer.is_authenticated:
+        is_self = Q(cavinguser=viewer.pk)
+        is_friend = Exists(
+            User.friends.through.objects.filter(
+                from_cavinguser=viewer.pk, to_cavinguser=OuterRef("cavinguser")
+            )
+        )
+    else:
+        is_self = Value(False)
+        is_friend = Value(False)
+
+    likes = (
+        Trip.likes.through.objects.filter(trip__in=[trip.pk for trip in trips])
+        .annotate(is_self=is_self, is_friend=is_friend)
+        .annotate(
+            rank=Window(
+                RowNumber(),
+                partition_by=F("trip"),
+                order_by=[F("is_self").desc(), F("is_friend").desc(), F("pk").asc()],
+            ),
+            total=Window(Count("pk"), partition_by=F("trip")),
+        )
+        .filter(rank__lte=name_limit + 1)
+        .order_by("trip", "rank")
+        .values_list("trip", "cavinguser__name", "is_self", "total")
+    )
+
+    liked_user_names = defaultdict(list)
+    self_liked = set()
+    totals = {}
+    for trip_pk, name, liked_by_self, total in likes:
+        totals[trip_pk] = total
+        if liked_by_self:
+            self_liked.add(trip_pk)
+        else:
+            liked_user_names[trip_pk].append(name)
 
-def get_liked_str_context(request, trips):
-    """Return a dictionary of liked strings for each trip."""
-    friends = request.user.friends.all()
     liked_str_index = {}
     for trip in trips:
-        liked_str_index[trip.pk] = trip.get_liked_str(request.user, friends)
+        names = liked_user_names[trip.pk][:name_limit]
+        if trip.pk in self_liked:
+            names.append("you")
+        liked_str_index[trip.pk] = trip._build_liked_str(
+            names, trip.pk in self_liked, name_limit, total=totals.get(trip.pk, 0)
+        )
 
     return liked_str_index
 
 
 def bulk_update_view_count(request: HttpRequest, trips: typing.Iterable[Trip]):
-    if not trips:
+    if request.user.is_anonymous:
         return
 
-    for trip in trips:
-        trip.add_view(request, commit=False)
-    Trip.objects.bulk_update(trips, ["view_count"])
+    viewed = [trip for trip in trips if trip.user_id != request.user.pk]
+    for trip in viewed:
+        trip.view_count += 1
+    Trip.view_counter.increment_many(trip.pk for trip in viewed)
@@ -3,6 +3,7 @@ from datetime import datetime, timedelta
 from django import template
 from django.contrib.auth import get_user_model
 from django.utils import timezone
+from django_countries import countries
 
 register = template.Library()
 User = get_user_model()
@@ -39,6 +40,12 @@ def get(dict, value):
     return dict[value]
 
 
+@register.filter
+def country_name(value):
+    """Return the name of a country entered as its code, or the value as it was entered."""
+    return countries.name(value) or value
+
+
 @register.filter
 def shortdelta(value: timedelta | datetime, simplify=True):
     """Formats a datetime as a short time string, e.g. 3d, 2w, 1y."""
@@ -0,0 +1,154 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import Client, TestCase, tag
+from django.urls import reverse
+from django.utils import timezone
+from users.factories import UserFactory
+from users.models import CavingUser as User
+
+from ..factories import TripFactory
+from ..models import CaveNameDictionary, Trip
+
+
+@tag("fast", "logger", "search")
+class CaveNameDictionaryTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = UserFactory(is_active=True, privacy=User.PUBLIC)
+        self.user2 = UserFactory(is_active=True, privacy=User.PUBLIC)
+
+    def _counts(self, user):
+        return dict(
+            CaveNameDictionary.objects.filter(user=user).values_list("display_name", "usage_count")
+        )
+
+    def test_names_are_counted_as_trips_are_saved_and_deleted(self):
+        """Test that each user's cave names are recounted when trips change."""
+        first = TripFactory(user=self.user, cave_name="Ogof Ffynnon Ddu")
+        second = TripFactory(user=self.user, cave_name=" ogof  ffynnon ddu ")
+        TripFactory(user=self.user2, cave_name="Ogof Ffynnon Ddu")
+        self.assertEqual(self._counts(self.user), {"ogof ffynnon ddu": 2})
+
+        first.cave_name = "Dan yr Ogof"
+        first.save()
+        self.assertEqual(self._counts(self.user), {"ogof ffynnon ddu": 1, "Dan yr Ogof": 1})
+
+        second.delete()
+        self.assertEqual(self._counts(self.user), {"Dan yr Ogof": 1})
+        self.assertEqual(self._counts(self.user2), {"Ogof Ffynnon Ddu": 1})
+
+    def test_names_follow_a_trip_to_another_user(self):
+        """Test that a trip's cave name is counted for its new owner."""
+        trip = TripFactory(user=self.user, cave_name="Gaping Gill", privacy=Trip.PUBLIC)
+        trip.user = self.user2
+        trip.save()
+        self.assertEqual(self._counts(self.user), {})
+        self.assertEqual(self._counts(self.user2), {"Gaping Gill": 1})
+        self.assertEqual(self._counts(None), {"Gaping Gill": 1})
+
+    def test_public_names_follow_trip_and_owner_privacy(self):
+        """Test that only the cave names of public trips are in the public set."""
+        trip = TripFactory(user=self.user, cave_name="Gaping Gill", privacy=Trip.DEFAULT)
+        TripFactory(user=self.user2, cave_name="Gaping Gill", privacy=Trip.PUBLIC)
+        TripFactory(user=self.user2, cave_name="Lost John's", privacy=Trip.PRIVATE)
+        self.assertEqual(self._counts(None), {"Gaping Gill": 2})
+
+        trip.privacy = Trip.FRIENDS
+        trip.save()
+        self.assertEqual(self._counts(None), {"Gaping Gill": 1})
+
+        trip.privacy = Trip.DEFAULT
+        trip.save()
+        self.client.force_login(self.user)
+        self.client.post(
+            reverse("users:account_settings"),
+            {
+                "privacy": "Private",
+                "timezone": "Europe/London",
+                "units": "Metric",
+                "settings_submit": "Save",
+            },
+        )
+        self.assertEqual(self._counts(None), {"Gaping Gill": 1})
+
+    def test_rebuild_matches_the_incremental_counts(self):
+        """Test that rebuilding the dictionary gives the same counts as trip saves."""
+        for name in ["Swildon's Hole", "Swildon's Hole", "Wookey Hole"]:
+            TripFactory(user=self.user, cave_name=name, privacy=Trip.PUBLIC)
+        TripFactory(user=self.user2, cave_name="Wookey Hole", privacy=Trip.PRIVATE)
+        entries = set(
+            CaveNameDictionary.objects.values_list(
+                "user", "normalized_name", "display_name", "usage_count"
+            )
+        )
+
+        self.assertEqual(CaveNameDictionary.objects.rebuild(), 5)
+        self.assertEqual(
+            set(
+                CaveNameDictionary.objects.values_list(
+                    "user", "normalized_name", "display_name", "usage_count"
+                )
+            ),
+            entries,
+        )
+
+    def test_names_of_pruned_users_are_removed(self):
+        """Test that the cave names of unverified users are removed when they are pruned."""
+        TripFactory(user=self.user, cave_name="Dan yr Ogof", privacy=Trip.PUBLIC)
+        TripFactory(user=self.user2, cave_name="Dan yr Ogof", privacy=Trip.PUBLIC)
+        User.objects.filter(pk=self.user2.pk).update(
+            is_active=False,
+            has_verified_email=False,
+            date_joined=timezone.now() - timezone.timedelta(days=2),
+        )
+
+        call_command("prune_inactive_users", stdout=StringIO())
+        self.assertFalse(User.objects.filter(pk=self.user2.pk).exists())
+        self.assertEqual(self._counts(self.user), {"Dan yr Ogof": 1})
+        self.assertEqual(self._counts(None), {"Dan yr Ogof": 1})
+        self.assertEqual(CaveNameDictionary.objects.rebuild(), 2)
+
+    def test_names_which_lengthen_when_unaccented(self):
+        """Test that a cave name of the longest length is counted when unaccented."""
+        name = "Große Höhle " * 8 + "Groß"
+        self.assertEqual(len(name), 100)
+        TripFactory(user=self.user, cave_name=name, privacy=Trip.PUBLIC)
+        self.assertEqual(self._counts(self.user), {name: 1})
+        self.assertEqual(self._counts(None), {name: 1})
+
+        self.assertEqual(CaveNameDictionary.objects.rebuild(), 2)
+        self.assertEqual(CaveNameDictionary.objects.suggest(self.user, "grosse hohle g"), [name])
+
+    def test_suggestions_are_ranked(self):
+        """Test that prefix matches and the user's own names are suggested first."""
+        TripFactory(user=self.user, cave_name="Peak Cavern")
+        TripFactory(user=self.user2, cave_name="Speedwell Cavern", privacy=Trip.PUBLIC)
+        for _ in range(2):
+            TripFactory(user=self.user2, cave_name="Peak Cavern", privacy=Trip.PUBLIC)
+            TripFactory(user=self.user2, cave_name="Peştera Vântului", privacy=Trip.PUBLIC)
+
+        self.assertEqual(
+            CaveNameDictionary.objects.suggest(self.user, "pe"),
+            ["Peak Cavern", "Peştera Vântului", "Speedwell Cavern"],
+        )
+        self.assertEqual(
+            CaveNameDictionary.objects.suggest(self.user, "PESTERA  V"), ["Peştera Vântului"]
+        )
+        self.assertEqual(CaveNameDictionary.objects.suggest(self.user, "p"), [])
+
+    def test_suggestions_view(self):
+        """Test that the suggestions view lists the matching cave names."""
+        TripFactory(user=self.user, cave_name="Titan")
+        TripFactory(user=self.user2, cave_name="Titan's Shaft", privacy=Trip.PRIVATE)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("log:cave_name_suggestions"), {"terms": "tit"})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<option value="Titan">')
+        self.assertNotContains(response, "Shaft")
+
+    def test_suggestions_view_requires_login(self):
+        """Test that the suggestions view redirects anonymous users."""
+        response = self.client.get(reverse("log:cave_name_suggestions"), {"cave_name": "tit"})
+        self.assertEqual(response.status_code, 302)
@@ -1,6 +1,8 @@
 import logging
 from datetime import datetime as dt
+from unittest import mock
 
+from core.tests.mixins import IsolatedCacheMixin
 from django.contrib.auth import get_user_model
 from django.test import TestCase, tag
 from django.urls import reverse
@@ -11,7 +13,7 @@ User = get_user_model()
 
 
 @tag("logger", "caver", "fast")
-class CaverModelTests(TestCase):
+class CaverModelTests(IsolatedCacheMixin, TestCase):
     def setUp(self):
         """Reduce log level to avoid 404 error."""
         logger = logging.getLogger("django.request")
@@ -277,3 +279,94 @@ class CaverModelTests(TestCase):
         """Reset the log level back to normal."""
         logger = logging.getLogger("django.request")
         logger.setLevel(self.previous_level)
+
+
+@tag("logger", "caver", "fast")
+class CaverAutocompleteTests(IsolatedCacheMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="test@caves.app",
+            username="testuser",
+            password="password",
+            name="Test User",
+        )
+        self.user.is_active = True
+        self.user.save()
+
+        self.trips = [
+            Trip.objects.create(
+                user=self.user,
+                cave_name=f"Test Trip {i}",
+                start=dt.fromisoformat("2010-01-01T12:00:00+00:00"),
+                end=dt.fromisoformat("2010-01-01T14:00:00+00:00"),
+            )
+            for i in range(3)
+        ]
+
+        self.ann = Caver.objects.create(name="Ann Smith", user=self.user)
+        self.jo = Caver.objects.create(name="Jo Bråthen", user=self.user)
+        self.sam = Caver.objects.create(name="Sam Annand", user=self.user)
+        for trip in self.trips:
+            trip.cavers.add(self.sam)
+        self.trips[0].cavers.add(self.jo)
+
+    def _autocomplete(self, query):
+        return [caver.name for caver in Caver.objects.autocomplete(self.user, query)]
+
+    def test_trip_count_follows_the_cavers_of_trips(self):
+        """Test that each caver's stored trip count is kept up to date."""
+        stale = Caver.objects.get(pk=self.sam.pk)
+        self.trips[1].cavers.remove(self.sam)
+        self.trips[2].delete()
+        self.trips[0].cavers.add(self.ann)
+
+        stale.name = "Samuel Annand"
+        stale.save()
+
+        counts = dict(Caver.objects.values_list("name", "trip_count"))
+        self.assertEqual(counts, {"Ann Smith": 1, "Jo Bråthen": 1, "Samuel Annand": 1})
+
+    def test_autocomplete_ranks_prefix_matches_then_trip_count(self):
+        """Test that cavers are matched within their names and ranked."""
+        self.assertEqual(self._autocomplete(""), ["Sam Annand", "Jo Bråthen", "Ann Smith"])
+        self.assertEqual(self._autocomplete("ann"), ["Ann Smith", "Sam Annand"])
+        self.assertEqual(self._autocomplete("an"), ["Ann Smith"])
+        self.assertEqual(self._autocomplete("brat"), ["Jo Bråthen"])
+
+    def test_autocomplete_from_database_matches_cache(self):
+        """Test that users with too many cavers to cache get the same matches."""
+        cached = [self._autocomplete(q) for q in ["", "ann", "an", "brat"]]
+        with mock.patch("logger.models.trip.CAVER_CACHE_LIMIT", 0):
+            self.assertEqual([self._autocomplete(q) for q in ["", "ann", "an", "brat"]], cached)
+
+    def test_autocomplete_folds_accents_alike_from_cache_and_database(self):
+        """Test that accents are ignored the same way however many cavers a user has."""
+        Caver.objects.create(name="Bjørn Strauß", user=self.user)
+        queries = ["bjorn", "STRAUSS", "bjø", "jö"]
+        expected = [["Bjørn Strauß"], ["Bjørn Strauß"], ["Bjørn Strauß"], ["Jo Bråthen"]]
+        self.assertEqual([self._autocomplete(q) for q in queries], expected)
+        with mock.patch("logger.models.trip.CAVER_CACHE_LIMIT", 0):
+            self.assertEqual([self._autocomplete(q) for q in queries], expected)
+
+    def test_autocomplete_reads_cavers_from_cache(self):
+        """Test that the cavers are only read from the database once."""
+        with self.assertNumQueries(1):
+            self._autocomplete("ann")
+        with self.assertNumQueries(0):
+            self._autocomplete("anna")
+
+        Caver.objects.create(name="Anna Jones", user=self.user)
+        self.assertEqual(self._autocomplete("anna"), ["Anna Jones", "Sam Annand"])
+
+    def test_autocomplete_view(self):
+        """Test that the autocomplete view lists and creates cavers."""
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("log:caver_autocomplete"), {"q": "ann"})
+        self.assertEqual(
+            [result["text"] for result in response.json()["results"]],
+            ["Ann Smith", "Sam Annand", 'Create "ann"'],
+        )
+
+        response = self.client.post(reverse("log:caver_autocomplete"), {"text": "New Caver"})
+        caver = Caver.objects.get(name="New Caver", user=self.user)
+        self.assertEqual(response.json(), {"id": str(caver.pk), "text": "New Caver"})
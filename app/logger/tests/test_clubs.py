@@ -0,0 +1,75 @@
+from importlib import import_module
+
+from django.db import connection
+from django.test import TestCase, tag
+from stats.statistics.most_common import most_common_clubs
+from users.factories import UserFactory
+
+from ..factories import TripFactory
+from ..models import Club, Expedition
+
+populate_migration = import_module("logger.migrations.0061_club_expedition")
+
+
+@tag("fast", "logger")
+class ClubTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory(is_active=True)
+
+    def _links(self, model):
+        return sorted(
+            model.trips.through.objects.values_list(f"{model._meta.model_name}__name", "trip")
+        )
+
+    def test_names_are_split(self):
+        """Test that comma-separated names are trimmed and deduplicated."""
+        self.assertEqual(
+            Club.objects.split(" Mendip  Caving Group, , SWCC,mendip caving group,"),
+            ["Mendip Caving Group", "SWCC"],
+        )
+        self.assertEqual(Club.objects.split(""), [])
+
+    def test_trips_are_linked_as_they_are_saved(self):
+        """Test that trips are linked to the clubs and expeditions that they name."""
+        first = TripFactory(user=self.user, clubs="SWCC, Red Rose", expedition="Matienzo")
+        second = TripFactory(user=self.user, clubs="red rose", expedition="")
+        self.assertEqual(Club.objects.count(), 2)
+        self.assertEqual(
+            self._links(Club),
+            [("Red Rose", first.pk), ("Red Rose", second.pk), ("SWCC", first.pk)],
+        )
+        self.assertEqual(self._links(Expedition), [("Matienzo", first.pk)])
+
+        first.clubs = "SWCC"
+        first.expedition = ""
+        first.save()
+        self.assertEqual(self._links(Club), [("Red Rose", second.pk), ("SWCC", first.pk)])
+        self.assertEqual(self._links(Expedition), [])
+
+        # The migration links the same names as saving each trip, spelt as in the
+        # earliest trip
+        third = TripFactory(user=self.user, clubs="RED ROSE", expedition=" Matienzo ,Ario,")
+        Club.objects.all().delete()
+        Expedition.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(populate_migration.POPULATE_NAMES)
+        self.assertEqual(
+            self._links(Club),
+            [("SWCC", first.pk), ("red rose", second.pk), ("red rose", third.pk)],
+        )
+        self.assertEqual(self._links(Expedition), [("Ario", third.pk), ("Matienzo", third.pk)])
+
+    def test_most_common_clubs(self):
+        """Test that the most common clubs are counted and spelt as in the user's trips."""
+        TripFactory(user=UserFactory(is_active=True), clubs="swcc, RED ROSE")
+        TripFactory(user=self.user, clubs="SWCC, Red Rose")
+        TripFactory(user=self.user, clubs="red rose")
+        TripFactory(user=self.user, clubs="Red Rose")
+
+        with self.assertNumQueries(2):
+            stats = most_common_clubs(self.user.trips, limit=10)
+
+        self.assertEqual(
+            [(row.metric, row.value) for row in stats.rows], [("Red Rose", 3), ("SWCC", 1)]
+        )
+        self.assertEqual(Club.objects.get(name__iexact="red rose").name, "RED ROSE")
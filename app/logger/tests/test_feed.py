@@ -1,20 +1,25 @@
 import uuid
+from io import StringIO
+from unittest import mock
 from unittest.mock import MagicMock
 
+from core.tests.mixins import IsolatedCacheMixin
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import Client, TestCase, tag
 from django.urls import reverse
 from django.utils import timezone
+from users.models import FriendRequest
 
 from .. import services
 from ..factories import TripFactory
-from ..models import Trip
+from ..models import FeedEntry, Trip, TripPhoto, TripScore
 
 User = get_user_model()
 
 
 @tag("feed", "fast", "views")
-class SocialFeedTests(TestCase):
+class SocialFeedTests(IsolatedCacheMixin, TestCase):
     def setUp(self):
         self.client = Client()
         self.user = User.objects.create_user(
@@ -179,3 +184,352 @@ class SocialFeedTests(TestCase):
             reverse("log:trip_like_htmx_view", args=[uuid.uuid4()]),
         )
         self.assertEqual(response.status_code, 404)
+
+    def test_feed_pages_through_more_than_one_hundred_trips(self):
+        """Test that every trip can be reached by following the feed cursors."""
+        request = MagicMock()
+        request.user = self.user
+        trips = TripFactory.create_batch(105, user=self.user)
+
+        seen = []
+        page = services.get_trips_context(request, User.FEED_ADDED)
+        while True:
+            self.assertLessEqual(len(page), services.FEED_PAGE_SIZE)
+            seen.extend(trip.pk for trip in page)
+            if not page.has_next:
+                break
+            page = services.get_trips_context(request, User.FEED_ADDED, cursor=page.next_cursor)
+
+        self.assertEqual(len(seen), len(trips))
+        self.assertEqual(set(seen), {trip.pk for trip in trips})
+
+    def test_feed_cursor_orders_trips_with_equal_start_times_by_pk(self):
+        """Test that trips sharing a start time are neither skipped nor repeated."""
+        request = MagicMock()
+        request.user = self.user
+        start = timezone.now()
+        trips = [TripFactory(user=self.user, start=start, end=None) for _i in range(15)]
+
+        first = services.get_trips_context(request, User.FEED_DATE)
+        second = services.get_trips_context(request, User.FEED_DATE, cursor=first.next_cursor)
+
+        self.assertEqual(
+            [trip.pk for trip in first] + [trip.pk for trip in second],
+            sorted((trip.pk for trip in trips), reverse=True),
+        )
+        self.assertFalse(second.has_next)
+
+    @tag("htmx")
+    def test_htmx_trip_feed_with_an_invalid_cursor(self):
+        """Test that the HTMX feed view returns a 404 for a malformed cursor."""
+        self.client.force_login(self.user)
+        TripFactory(user=self.user)
+
+        response = self.client.get(reverse("log:feed_htmx_view") + "?cursor=invalid")
+        self.assertEqual(response.status_code, 404)
+
+    @tag("htmx")
+    def test_htmx_trip_feed_loads_the_next_page(self):
+        """Test that the load more trips link fetches the following page."""
+        self.client.force_login(self.user)
+        for i in range(1, 16):
+            Trip.objects.create(
+                user=self.user,
+                cave_name=f"Feed Cave {i}",
+                start=timezone.now() - timezone.timedelta(days=i),
+            )
+
+        response = self.client.get(reverse("log:index"))
+        cursor = response.context["trips"].next_cursor
+        self.assertContains(response, f"?cursor={cursor}")
+
+        response = self.client.get(reverse("log:feed_htmx_view") + f"?cursor={cursor}")
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Feed Cave 1\n")
+        self.assertNotContains(response, "Feed Cave 15\n")
+        self.assertNotContains(response, '<div id="loadMoreTrips"')
+
+    def test_feed_photos_are_prefetched_for_a_page_of_trips(self):
+        """Test that feed photos are fetched in one query, capped at ten per trip."""
+        trips = [TripFactory(user=self.user) for _i in range(3)]
+        for trip in trips[:2]:
+            for _i in range(12):
+                TripPhoto.objects.create(trip=trip, user=self.user, is_valid=True)
+        TripPhoto.objects.create(trip=trips[0], user=self.user, is_valid=False)
+
+        with self.assertNumQueries(2):
+            prefetched = Trip.objects.filter(pk__in=[t.pk for t in trips]).with_feed_photos()
+            photos = {trip.pk: trip.feed_photos for trip in prefetched}
+
+        self.assertEqual(len(photos[trips[0].pk]), 10)
+        self.assertEqual(len(photos[trips[1].pk]), 10)
+        self.assertEqual(photos[trips[2].pk], [])
+        self.assertEqual(photos[trips[0].pk], list(trips[0].feed_photos))
+
+    def test_shuffled_photos_are_stable_for_a_seed(self):
+        """Test that the photo order only changes when the seed changes."""
+        trip = TripFactory(user=self.user)
+        for _i in range(20):
+            TripPhoto.objects.create(trip=trip, user=self.user, is_valid=True)
+
+        first = list(TripPhoto.objects.shuffled("2024-01-01"))
+        self.assertEqual(first, list(TripPhoto.objects.shuffled("2024-01-01")))
+        self.assertNotEqual(first, list(TripPhoto.objects.shuffled("2024-01-02")))
+        self.assertCountEqual(first, TripPhoto.objects.valid())
+
+    def test_feed_pages_are_cached_until_the_feed_version_changes(self):
+        """Test that a cached feed page is used until something in the feed changes."""
+        self.user.friends.add(self.user2)
+        self.user2.friends.add(self.user)
+        trip = TripFactory(user=self.user2, privacy=Trip.FRIENDS, cave_name="Cached Cave")
+
+        self.user.refresh_from_db()
+        request = MagicMock(user=self.user)
+        context = services.get_feed_context(request, self.user.feed_ordering)
+        self.assertEqual(context["liked_str"], {trip.pk: "0 likes"})
+
+        with self.assertNumQueries(0):
+            services.get_feed_context(request, self.user.feed_ordering)
+
+        # A like on a trip in the feed invalidates the cached page
+        trip.add_like(self.user2)
+        self.user.refresh_from_db()
+        context = services.get_feed_context(request, self.user.feed_ordering)
+        self.assertEqual(context["liked_str"], {trip.pk: "Test User 2 liked this"})
+
+        # So does a new trip by a friend
+        new_trip = TripFactory(user=self.user2, privacy=Trip.FRIENDS)
+        self.user.refresh_from_db()
+        context = services.get_feed_context(request, self.user.feed_ordering)
+        self.assertIn(new_trip, context["trips"])
+
+        # And a change to the name of a friend
+        self.client.force_login(self.user2)
+        self.client.post(
+            reverse("users:profile_update"),
+            {"name": "Renamed User 2", "username": self.user2.username},
+        )
+        self.user.refresh_from_db()
+        context = services.get_feed_context(request, self.user.feed_ordering)
+        self.assertEqual({trip.user.name for trip in context["trips"]}, {"Renamed User 2"})
+
+    def test_full_save_does_not_reset_the_feed_version(self):
+        """Test that saving a stale user does not go back to an older feed version."""
+        stale_user = User.objects.get(pk=self.user.pk)
+        TripFactory(user=self.user)
+
+        stale_user.name = "Renamed User"
+        stale_user.save()
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, "Renamed User")
+        self.assertGreater(self.user.feed_version, stale_user.feed_version)
+
+
+@tag("feed", "fast")
+class FeedEntryTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            email="test1@user.app", username="test1", name="Test User 1"
+        )
+        self.user.is_active = True
+        self.user.save()
+
+        self.user2 = User.objects.create_user(
+            email="test2@users.app", username="test2", name="Test User 2"
+        )
+        self.user2.is_active = True
+        self.user2.save()
+
+    def _feed_trips(self, user):
+        return set(FeedEntry.objects.filter(user=user).values_list("trip", flat=True))
+
+    def test_new_trip_is_added_to_the_feed_of_its_owner_and_friends(self):
+        """Test that a new trip is written to the feed of the owner and their friends."""
+        self.user.friends.add(self.user2)
+        self.user2.friends.add(self.user)
+
+        trip = TripFactory(user=self.user, privacy=Trip.FRIENDS)
+        self.assertEqual(self._feed_trips(self.user), {trip.pk})
+        self.assertEqual(self._feed_trips(self.user2), {trip.pk})
+
+    @tag("privacy")
+    def test_private_trip_is_removed_from_the_feed_of_friends(self):
+        """Test that changing a trip to private removes it from the feed of friends."""
+        self.user.friends.add(self.user2)
+        self.user2.friends.add(self.user)
+
+        trip = TripFactory(user=self.user, privacy=Trip.PUBLIC)
+        trip.privacy = Trip.PRIVATE
+        trip.save()
+
+        self.assertEqual(self._feed_trips(self.user), {trip.pk})
+        self.assertEqual(self._feed_trips(self.user2), set())
+
+    def test_trip_is_only_fanned_out_again_when_who_can_view_it_changes(self):
+        """Test that other edits only invalidate the feeds which show the trip."""
+        self.user.friends.add(self.user2)
+        self.user2.friends.add(self.user)
+        trip = TripFactory(user=self.user, privacy=Trip.FRIENDS)
+        self.user2.refresh_from_db()
+
+        with mock.patch.object(FeedEntry.objects, "add_trip") as add_trip:
+            trip.notes = "Edited"
+            trip.save()
+            add_trip.assert_not_called()
+
+            trip.privacy = Trip.PUBLIC
+            trip.save()
+            add_trip.assert_called_once_with(trip)
+
+        feed_version = self.user2.feed_version
+        self.user2.refresh_from_db()
+        self.assertGreater(self.user2.feed_version, feed_version)
+
+    def test_changing_trip_start_updates_the_feed_entry(self):
+        """Test that the denormalised start time follows the trip."""
+        trip = TripFactory(user=self.user)
+        trip.start = trip.start - timezone.timedelta(days=30)
+        trip.save()
+
+        entry = FeedEntry.objects.get(user=self.user, trip=trip)
+        self.assertEqual(entry.start, trip.start)
+
+    @tag("privacy")
+    def test_refresh_owner_after_profile_privacy_change(self):
+        """Test that default privacy trips follow the privacy of the owner's profile."""
+        self.user.friends.add(self.user2)
+        self.user2.friends.add(self.user)
+        self.user.privacy = User.FRIENDS
+        self.user.save()
+        trip = TripFactory(user=self.user, privacy=Trip.DEFAULT)
+        self.assertEqual(self._feed_trips(self.user2), {trip.pk})
+
+        self.user.privacy = User.PRIVATE
+        self.user.save()
+        FeedEntry.objects.refresh_owner(self.user)
+        self.assertEqual(self._feed_trips(self.user2), set())
+
+        self.user.privacy = User.FRIENDS
+        self.user.save()
+        FeedEntry.objects.refresh_owner(self.user)
+        self.assertEqual(self._feed_trips(self.user2), {trip.pk})
+
+    @tag("views")
+    def test_accepting_and_removing_a_friend_updates_the_feed(self):
+        """Test that existing trips are added to and removed from the feed with friendship."""
+        trip = TripFactory(user=self.user, privacy=Trip.FRIENDS, cave_name="Friendly Cave")
+        other_trip = TripFactory(user=self.user2, privacy=Trip.FRIENDS)
+        self.assertEqual(self._feed_trips(self.user2), {other_trip.pk})
+
+        f_req = FriendRequest.objects.create(user_from=self.user, user_to=self.user2)
+        self.client.force_login(self.user2)
+        self.client.post(reverse("users:friend_request_accept", args=[f_req.pk]))
+        self.assertEqual(self._feed_trips(self.user), {trip.pk, other_trip.pk})
+        self.assertEqual(self._feed_trips(self.user2), {trip.pk, other_trip.pk})
+
+        response = self.client.get(reverse("log:index"))
+        self.assertContains(response, "Friendly Cave")
+
+        self.client.post(reverse("users:friend_remove", args=[self.user.username]))
+        self.assertEqual(self._feed_trips(self.user), {trip.pk})
+        self.assertEqual(self._feed_trips(self.user2), {other_trip.pk})
+
+    def test_rebuild_feed_command(self):
+        """Test that rebuilding the feed produces the same entries as fan-out on write."""
+        self.user.friends.add(self.user2)
+        self.user2.friends.add(self.user)
+        for privacy in (Trip.PUBLIC, Trip.FRIENDS, Trip.PRIVATE, Trip.DEFAULT):
+            TripFactory(user=self.user, privacy=privacy)
+            TripFactory(user=self.user2, privacy=privacy)
+
+        expected = set(FeedEntry.objects.values_list("user", "trip", "added", "start"))
+        FeedEntry.objects.all().delete()
+
+        out = StringIO()
+        call_command("rebuild_feed", stdout=out)
+        self.assertIn(f"Rebuilt the feed with {len(expected)} entries.", out.getvalue())
+        self.assertEqual(
+            set(FeedEntry.objects.values_list("user", "trip", "added", "start")), expected
+        )
+
+    def test_pruning_users_invalidates_feeds_with_their_trips(self):
+        """Test that feeds which showed the trips of pruned users are invalidated."""
+        self.user.friends.add(self.user2)
+        self.user2.friends.add(self.user)
+        TripFactory(user=self.user2, privacy=Trip.PUBLIC)
+        User.objects.filter(pk=self.user2.pk).update(
+            is_active=False,
+            has_verified_email=False,
+            date_joined=timezone.now() - timezone.timedelta(days=2),
+        )
+        feed_version = User.objects.get(pk=self.user.pk).feed_version
+
+        call_command("prune_inactive_users", stdout=StringIO())
+        self.assertFalse(User.objects.filter(pk=self.user2.pk).exists())
+        self.assertGreater(User.objects.get(pk=self.user.pk).feed_version, feed_version)
+
+
+@tag("feed", "fast", "views")
+class DiscoverFeedTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            email="test1@user.app", username="test1", name="Test User 1"
+        )
+        self.user.is_active = True
+        self.user.save()
+
+        self.viewer = User.objects.create_user(
+            email="test2@users.app", username="test2", name="Test User 2"
+        )
+        self.viewer.is_active = True
+        self.viewer.save()
+
+    def test_refresh_scores_recent_public_trips_by_engagement(self):
+        """Test that only recent public trips are scored, ranked by engagement."""
+        quiet = TripFactory(user=self.user, privacy=Trip.PUBLIC)
+        popular = TripFactory(user=self.user, privacy=Trip.PUBLIC)
+        Trip.objects.filter(pk=popular.pk).update(likes_count=10, comments_count=2)
+        private = TripFactory(user=self.user, privacy=Trip.PRIVATE)
+        Trip.objects.filter(pk=private.pk).update(likes_count=50)
+        old = TripFactory(user=self.user, privacy=Trip.PUBLIC)
+        Trip.objects.filter(pk=old.pk).update(
+            likes_count=50, added=timezone.now() - timezone.timedelta(days=60)
+        )
+
+        self.assertEqual(TripScore.objects.refresh(), 2)
+        self.assertEqual(TripScore.objects.top_trip_pks(10), [popular.pk, quiet.pk])
+
+    def test_discover_page_shows_top_public_trips(self):
+        """Test that the discover page shows scored trips which are still public."""
+        trip = TripFactory(user=self.user, privacy=Trip.PUBLIC, cave_name="Popular Cave")
+        hidden = TripFactory(user=self.user, privacy=Trip.PUBLIC, cave_name="Hidden Cave")
+        TripScore.objects.refresh()
+        hidden.privacy = Trip.PRIVATE
+        hidden.save()
+
+        self.client.force_login(self.viewer)
+        response = self.client.get(reverse("log:discover"))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, trip.cave_name)
+        self.assertNotContains(response, hidden.cave_name)
+
+    def test_refresh_trip_scores_command(self):
+        """Test that the refresh_trip_scores command scores trips."""
+        TripFactory(user=self.user, privacy=Trip.PUBLIC)
+
+        out = StringIO()
+        call_command("refresh_trip_scores", stdout=out)
+        self.assertIn("Scored 1 trips.", out.getvalue())
+        self.assertEqual(TripScore.objects.count(), 1)
+
+        # With an interval, the scores are recalculated until the command is stopped
+        with (
+            mock.patch("time.sleep", side_effect=[None, KeyboardInterrupt]) as sleep,
+            self.assertRaises(KeyboardInterrupt),
+        ):
+            call_command("refresh_trip_scores", interval=60, stdout=StringIO())
+        self.assertEqual(sleep.call_count, 2)
+        sleep.assert_called_with(60)
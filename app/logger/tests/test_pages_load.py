@@ -1,3 +1,4 @@
+from core.tests.mixins import IsolatedCacheMixin
 from django.contrib.auth import get_user_model
 from django.test import Client, TestCase, tag
 from django.urls import reverse
@@ -9,7 +10,7 @@ User = get_user_model()
 
 
 @tag("fast", "views", "logger")
-class TestLoggerPagesLoad(TestCase):
+class TestLoggerPagesLoad(IsolatedCacheMixin, TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
             email="test@caves.app",
@@ -1,15 +1,25 @@
+import json
 import uuid
+from datetime import timedelta as td
+from io import StringIO
 
+from core.tests.mixins import IsolatedCacheMixin
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import Client, TestCase, tag
 from django.urls import reverse
+from django.utils import timezone
 from users.factories import UserFactory
+from users.models import CavingUser as User
 
+from .. import search
 from ..factories import TripFactory
-from ..models import Trip
+from ..models import Caver, Trip
 
 
 @tag("fast", "search", "views", "logger")
-class TripSearchTests(TestCase):
+class TripSearchTests(IsolatedCacheMixin, TestCase):
     def setUp(self):
         self.client = Client()
         self.user = UserFactory(is_active=True)
@@ -209,9 +219,381 @@ class TripSearchTests(TestCase):
             },
         )
         self.assertEqual(response.status_code, 200)
-        self.assertContains(response, "?page=2")
+        self.assertEqual(len(response.context["trips"]), 10)
+        self.assertEqual(response.context["trips"].count, 11)
+        next_cursor = response.context["trips"].next_cursor
+        self.assertContains(response, f"?cursor={next_cursor}")
 
         # Check that the second page contains 1 trip
-        response = self.client.get(f"{reverse('log:search')}?page=2")
+        response = self.client.get(reverse("log:search"), {"cursor": next_cursor})
         self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["trips"]), 1)
         self.assertContains(response, "Testing Pagination")
+        self.assertFalse(response.context["trips"].has_next)
+
+    def test_search_with_an_invalid_cursor(self):
+        """Test that a malformed cursor returns a 404."""
+        self.client.force_login(self.user)
+        self.client.post(reverse("log:search"), {"terms": "cave", "trip_type": "Any"})
+
+        response = self.client.get(reverse("log:search"), {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_search_facets_refine_the_results(self):
+        """Test that following a facet narrows down the last search."""
+        self.client.force_login(self.user)
+        trip = TripFactory(user=self.user, cave_name="Facet Cave", type=Trip.SURVEY)
+        TripFactory(user=self.user, cave_name="Facet Cave", type=Trip.DIGGING)
+
+        response = self.client.post(
+            reverse("log:search"), {"terms": "facet", "trip_type": "Any", "cave_name": True}
+        )
+        self.assertEqual(response.context["trips"].count, 2)
+        self.assertIn((Trip.SURVEY, 1), response.context["trips"].facets["type"])
+        self.assertContains(response, f"?trip_type={Trip.SURVEY}")
+
+        response = self.client.get(reverse("log:search"), {"trip_type": Trip.SURVEY})
+        self.assertEqual(list(response.context["trips"]), [trip])
+
+    def test_search_session_only_stores_the_search_fields(self):
+        """Test that the search is stored from the form, without any other POST data."""
+        self.client.force_login(self.user)
+        TripFactory(user=self.user, cave_name="Session Cave", cave_country="GB")
+        TripFactory(user=self.user, cave_name="Session Cave", cave_country="Narnia")
+
+        response = self.client.post(
+            reverse("log:search"),
+            {
+                "terms": " session ",
+                "user": self.user.username,
+                "trip_type": "Any",
+                "csrfmiddlewaretoken": "token",
+            },
+        )
+        params = self.client.session["search_params"]
+        self.assertNotIn("csrfmiddlewaretoken", params)
+        self.assertEqual(params["terms"], "session")
+        self.assertEqual(params["user"], self.user.username)
+
+        # Country facets are shown by name if they were entered as a code
+        self.assertContains(response, "United Kingdom")
+        self.assertContains(response, "Narnia")
+
+        response = self.client.get(reverse("log:search"), {"in_country": "GB"})
+        self.assertEqual(response.context["trips"].count, 1)
+
+    def test_fuzzy_search_from_the_search_page(self):
+        """Test that the search page can find a misspelt cave name."""
+        self.client.force_login(self.user)
+        trip = TripFactory(user=self.user, cave_name="Peak Cavern")
+
+        response = self.client.post(
+            reverse("log:search"),
+            {"terms": "Peek Cavern", "trip_type": "Any", "cave_name": True, "fuzzy": True},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, trip.get_absolute_url())
+
+
+@tag("fast", "search", "logger")
+class TripSearchVectorTests(IsolatedCacheMixin, TestCase):
+    def setUp(self):
+        self.user = UserFactory(is_active=True)
+
+    def _search(self, terms, fields=None):
+        return list(search.trip_search(terms=terms, for_user=self.user, fields=fields or []))
+
+    def test_results_are_ranked_by_field_weight(self):
+        """Test that a match in the cave name ranks above a match in the clubs."""
+        club_trip = TripFactory(user=self.user, cave_name="Swildons", clubs="Mendip Rangers")
+        cave_trip = TripFactory(user=self.user, cave_name="Mendip Hole", clubs="")
+
+        self.assertEqual(self._search("mendip"), [cave_trip, club_trip])
+
+    def test_search_fields_limit_the_matched_weights(self):
+        """Test that only the selected search fields are matched."""
+        trip = TripFactory(user=self.user, cave_name="Ogof Ffynnon Ddu", expedition="")
+        TripFactory(user=self.user, cave_name="Daren", expedition="Ffynnon Expedition")
+
+        self.assertEqual(self._search("ffynnon", ["cave_name"]), [trip])
+        self.assertEqual(len(self._search("ffynnon", ["cave_name", "expedition"])), 2)
+
+    def test_search_is_accent_insensitive_and_matches_prefixes(self):
+        """Test that terms match accented words and the start of words."""
+        trip = TripFactory(user=self.user, cave_name="Gouffre Berger", cave_region="Isère")
+
+        self.assertEqual(self._search("isere"), [trip])
+        self.assertEqual(self._search("gouf berg"), [trip])
+
+    def test_search_terms_are_parsed_like_the_document(self):
+        """Test that words which look like numbers are matched as they were indexed."""
+        trip = TripFactory(user=self.user, cave_name="58ae0401-3e4a-44b8-89a4-cde5a711dda9")
+
+        self.assertEqual(self._search("58ae0401-3e4a-44b8-89a4-cde5a711dda9"), [trip])
+        self.assertEqual(self._search("3e4a"), [trip])
+
+    def test_search_vector_follows_cavers(self):
+        """Test that adding, renaming and removing a caver updates the search vector."""
+        trip = TripFactory(user=self.user)
+        caver = Caver.objects.create(name="Gwendolyn Cavewright", user=self.user)
+
+        # Changing a trip's cavers does not save the trip, so the trip views
+        # invalidate search results themselves
+        trip.cavers.add(caver)
+        search.invalidate_search_results()
+        self.assertEqual(self._search("gwendolyn", ["cavers"]), [trip])
+
+        caver.name = "Ffion Cavewright"
+        caver.save()
+        self.assertEqual(self._search("gwendolyn", ["cavers"]), [])
+        self.assertEqual(self._search("ffion", ["cavers"]), [trip])
+
+        trip.cavers.remove(caver)
+        search.invalidate_search_results()
+        self.assertEqual(self._search("ffion", ["cavers"]), [])
+
+    def test_search_vector_is_not_written_by_a_stale_save(self):
+        """Test that saving an old instance keeps the vector built by the trigger."""
+        trip = TripFactory(user=self.user, cave_name="Lancaster Hole")
+        trip.cavers.add(Caver.objects.create(name="Tanwen Ropewalker", user=self.user))
+
+        trip.save()
+        self.assertEqual(self._search("tanwen"), [trip])
+
+    def test_fuzzy_search_tolerates_misspellings(self):
+        """Test that a fuzzy search finds misspelt cave names, most similar first."""
+        trip = TripFactory(user=self.user, cave_name="Ogof Ffynnon Ddu")
+        other = TripFactory(user=self.user, cave_name="Ogof Draenen")
+
+        self.assertEqual(self._search("ogof ffynon ddu"), [])
+        self.assertEqual(
+            search.trip_search(terms="ogof ffynon ddu", for_user=self.user, fuzzy=True).object_list[
+                0
+            ],
+            trip,
+        )
+        self.assertEqual(
+            list(
+                search.trip_search(
+                    terms="Ogof Ffynon Ddu",
+                    for_user=self.user,
+                    fuzzy=True,
+                    similarity_threshold=0.2,
+                )
+            ),
+            [trip, other],
+        )
+
+    def test_fuzzy_search_matches_cavers_and_threshold(self):
+        """Test that a fuzzy search matches caver names above the similarity threshold."""
+        trip = TripFactory(user=self.user, cave_name="Lancaster Hole")
+        trip.cavers.add(Caver.objects.create(name="Siân Williams", user=self.user))
+
+        def fuzzy_search(terms, **kwargs):
+            return list(
+                search.trip_search(
+                    terms=terms, for_user=self.user, fields=["cavers"], fuzzy=True, **kwargs
+                )
+            )
+
+        self.assertEqual(fuzzy_search("sian wiliams"), [trip])
+        self.assertEqual(fuzzy_search("sian wiliams", similarity_threshold=0.9), [])
+        self.assertEqual(fuzzy_search("lancaster"), [])
+
+    def test_facets_are_counted_in_one_query(self):
+        """Test that every facet is counted by one query alongside the page of results."""
+        for year, country in ((2020, "Wales"), (2020, "France"), (2021, "Wales")):
+            trip = TripFactory(user=self.user, cave_name="Draenen", cave_country=country)
+            trip.start = trip.start.replace(year=year)
+            trip.end = None
+            trip.save()
+
+        # Friends, then matching trips and facets in a savepoint, then the page and cavers
+        with self.assertNumQueries(7):
+            results = search.trip_search(terms="draenen", for_user=self.user)
+
+        self.assertEqual(results.count, 3)
+        self.assertEqual(results.facets["country"], [("Wales", 2), ("France", 1)])
+        self.assertEqual(results.facets["year"], [(2020, 2), (2021, 1)])
+        self.assertEqual(sum(count for _, count in results.facets["type"]), 3)
+
+    def test_cursor_pages_through_equal_scores(self):
+        """Test that trips with the same score are not skipped or repeated between pages."""
+        trips = [TripFactory(user=self.user, cave_name="Dan yr Ogof") for _ in range(25)]
+
+        seen, cursor = [], None
+        while True:
+            page = search.trip_search(terms="ogof", for_user=self.user, cursor=cursor)
+            seen.extend(page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+
+        self.assertEqual(sorted(trip.pk for trip in seen), sorted(trip.pk for trip in trips))
+
+    def test_later_pages_are_read_from_the_cache(self):
+        """Test that paging through cached results only fetches the trips on the page."""
+        for _ in range(15):
+            TripFactory(user=self.user, cave_name="Ogof Hesp Alyn")
+
+        first_page = search.trip_search(terms="hesp", for_user=self.user)
+        with self.assertNumQueries(3):  # Friends, then the page and its cavers
+            second_page = search.trip_search(
+                terms="  HESP ", for_user=self.user, cursor=first_page.next_cursor
+            )
+
+        self.assertEqual(len(second_page), 5)
+        self.assertEqual(second_page.count, 15)
+        self.assertFalse(set(first_page.object_list) & set(second_page.object_list))
+
+    def test_cached_results_are_invalidated_by_trip_writes(self):
+        """Test that adding, hiding and deleting trips is reflected in cached results."""
+        trip = TripFactory(user=self.user, cave_name="Pwll Du")
+        self.assertEqual(self._search("pwll"), [trip])
+
+        other = TripFactory(user=self.user, cave_name="Pwll Dwfn")
+        self.assertEqual(len(self._search("pwll")), 2)
+
+        other.delete()
+        self.assertEqual(self._search("pwll"), [trip])
+
+        # Edits which cannot change any search results keep them cached
+        version = cache.get(search.SEARCH_VERSION_KEY)
+        trip.notes = "Private notes are not searched"
+        trip.save()
+        self.assertEqual(cache.get(search.SEARCH_VERSION_KEY), version)
+
+        trip.cave_name = "Ogof Pwll"
+        trip.save()
+        self.assertGreater(cache.get(search.SEARCH_VERSION_KEY), version)
+
+    def test_cached_results_are_invalidated_by_pruning_users(self):
+        """Test that the trips of pruned users are removed from cached results."""
+        other = UserFactory(is_active=True, privacy=User.PUBLIC)
+        TripFactory(user=other, cave_name="Pwll Du", privacy=Trip.PUBLIC)
+        self.assertEqual(search.trip_search(terms="pwll", for_user=self.user).count, 1)
+        User.objects.filter(pk=other.pk).update(
+            is_active=False,
+            has_verified_email=False,
+            date_joined=timezone.now() - td(days=2),
+        )
+
+        call_command("prune_inactive_users", stdout=StringIO())
+        self.assertEqual(search.trip_search(terms="pwll", for_user=self.user).count, 0)
+
+    def test_cached_results_are_invalidated_by_caver_writes(self):
+        """Test that renaming and deleting a caver is reflected in cached results."""
+        trip = TripFactory(user=self.user)
+        caver = Caver.objects.create(name="Gwenllian Rhaff", user=self.user)
+        trip.cavers.add(caver)
+        search.invalidate_search_results()
+        self.assertEqual(self._search("gwenllian", ["cavers"]), [trip])
+
+        version = cache.get(search.SEARCH_VERSION_KEY)
+        caver.linked_account = None
+        caver.save()
+        self.assertEqual(cache.get(search.SEARCH_VERSION_KEY), version)
+
+        caver.delete()
+        self.assertEqual(self._search("gwenllian", ["cavers"]), [])
+
+    def test_cached_results_depend_on_the_viewer(self):
+        """Test that cached results are not shared with a viewer who cannot see them."""
+        friend = UserFactory(is_active=True)
+        stranger = UserFactory(is_active=True)
+        friend.friends.add(self.user)
+        self.user.friends.add(friend)
+        trip = TripFactory(user=self.user, cave_name="Eglwys Faen", privacy=Trip.FRIENDS)
+
+        results = search.trip_search(terms="eglwys", for_user=friend)
+        self.assertEqual(list(results), [trip])
+        results = search.trip_search(terms="eglwys", for_user=stranger)
+        self.assertEqual(list(results), [])
+
+        # Removing a friend changes the set of trips they can view
+        friend.friends.remove(self.user)
+        self.user.friends.remove(friend)
+        results = search.trip_search(terms="eglwys", for_user=friend)
+        self.assertEqual(list(results), [])
+
+
+@tag("fast", "search", "views", "logger")
+class SearchStreamTests(IsolatedCacheMixin, TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = UserFactory(is_active=True)
+        self.stranger = UserFactory(is_active=True)
+        self.client.force_login(self.user)
+
+    def _stream(self, **params):
+        response = self.client.get(reverse("log:search_stream"), params)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        return [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+    def test_stream_yields_viewable_trips_in_relevance_order(self):
+        """Test that matching trips are streamed as JSON lines, best match first."""
+        club_trip = TripFactory(user=self.user, cave_name="Swildons", clubs="Mendip Rangers")
+        cave_trip = TripFactory(user=self.user, cave_name="Mendip Hole", notes="Private")
+        TripFactory(user=self.stranger, cave_name="Mendip Pot", privacy=Trip.PRIVATE)
+
+        trips = self._stream(terms="mendip")
+        self.assertEqual([t["uuid"] for t in trips], [str(cave_trip.uuid), str(club_trip.uuid)])
+        self.assertEqual(trips[0]["cave_name"], "Mendip Hole")
+        self.assertEqual(trips[0]["username"], self.user.username)
+        self.assertNotIn("notes", trips[0])
+
+    def test_stream_applies_search_options(self):
+        """Test that the stream is limited by the same options as the search form."""
+        trip = TripFactory(user=self.user, cave_name="Dan yr Ogof", expedition="")
+        TripFactory(user=self.user, cave_name="Daren", expedition="Dan Expedition")
+
+        trips = self._stream(terms="dan", cave_name="on")
+        self.assertEqual([t["uuid"] for t in trips], [str(trip.uuid)])
+        trips = self._stream(terms="dna yr ogof", cave_name="on", fuzzy="on")
+        self.assertEqual([t["uuid"] for t in trips], [str(trip.uuid)])
+
+    def test_stream_reads_trips_in_chunks_outside_a_transaction(self):
+        """Test that trips are streamed in order a chunk at a time, with no transaction open."""
+        # Pairs of trips start at the same time, and are then ordered newest first
+        now = timezone.now()
+        trips = [
+            TripFactory(user=self.user, cave_name="Mendip", start=now - td(days=day // 2))
+            for day in range(5)
+        ]
+        savepoints = len(connection.savepoint_ids)
+
+        stream = search.stream_trip_search(terms="mendip", for_user=self.user, chunk_size=2)
+        first = next(stream)
+        self.assertEqual(len(connection.savepoint_ids), savepoints)
+        self.assertEqual(
+            [first["uuid"], *[trip["uuid"] for trip in stream]],
+            [trips[i].uuid for i in (1, 0, 3, 2, 4)],
+        )
+
+    @tag("privacy")
+    def test_stream_leaves_out_trips_which_can_no_longer_be_viewed(self):
+        """Test that a trip made private while the results are streamed is left out."""
+        now = timezone.now()
+        trips = [
+            TripFactory(
+                user=self.stranger,
+                cave_name="Mendip",
+                privacy=Trip.PUBLIC,
+                start=now - td(days=day),
+            )
+            for day in range(4)
+        ]
+
+        stream = search.stream_trip_search(terms="mendip", for_user=self.user, chunk_size=2)
+        first = next(stream)
+        Trip.objects.filter(pk=trips[3].pk).update(privacy=Trip.PRIVATE)
+        self.assertEqual(
+            [first["uuid"], *[trip["uuid"] for trip in stream]],
+            [trip.uuid for trip in trips[:3]],
+        )
+
+    def test_stream_rejects_invalid_searches(self):
+        """Test that an invalid search is rejected with the form errors."""
+        response = self.client.get(reverse("log:search_stream"), {"terms": "ab"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("terms", response.json()["errors"])
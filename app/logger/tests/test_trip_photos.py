@@ -1,6 +1,7 @@
 from unittest import skipIf
 from unittest.mock import MagicMock
 
+from core.tests.mixins import IsolatedCacheMixin
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db.models.fields.files import ImageFieldFile
@@ -23,7 +24,7 @@ def aws_not_configured():
 
 
 @tag("logger", "tripphotos", "fast")
-class TripPhotoTests(TestCase):
+class TripPhotoTests(IsolatedCacheMixin, TestCase):
     def setUp(self):
         self.client = Client()
 
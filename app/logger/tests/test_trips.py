@@ -1,21 +1,32 @@
 import logging
+import random
 from datetime import datetime as dt
 from datetime import timedelta as td
+from io import StringIO
+from unittest.mock import MagicMock
 
+from core.tests.mixins import IsolatedCacheMixin
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
 from django.contrib.gis.measure import D
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
 from django.test import Client, TestCase, tag
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone as tz
+from users.factories import UserFactory
 
-from ..models import Trip
+from .. import services
+from ..factories import TripFactory
+from ..models import Trip, TripPhoto
 
 User = get_user_model()
 
 
 @tag("logger", "trip", "fast")
-class TripModelTests(TestCase):
+class TripModelTests(IsolatedCacheMixin, TestCase):
     def setUp(self):
         """Reduce log level to avoid 404 error."""
         logger = logging.getLogger("django.request")
@@ -343,8 +354,93 @@ class TripModelTests(TestCase):
         user5.friends.add(self.user)
         self.user.friends.add(user5)
 
-        result = self.trip.get_liked_str(self.user, self.user.friends.all())
-        self.assertEqual(result, "Liked by Test User 4, Test User 5 and 8 others")
+        result = services.get_liked_str_context(MagicMock(user=self.user), [self.trip])
+        self.assertEqual(result, {self.trip.pk: "Liked by Test User 4, Test User 5 and 8 others"})
+
+    def test_liked_str_context_for_a_page_of_trips(self):
+        """Test that the liked strings for several trips are built in one query."""
+        users = [
+            User.objects.create_user(
+                email=f"test_user{i}@user.app",
+                username=f"test_user{i}",
+                password="password",
+                name=f"Test User {i}",
+            )
+            for i in range(4)
+        ]
+        self.user.friends.add(users[3])
+
+        liked_by_one = TripFactory(user=self.user2)
+        liked_by_one.likes.add(users[0])
+        liked_by_self = TripFactory(user=self.user2)
+        liked_by_self.likes.add(self.user)
+        liked_by_self_and_one = TripFactory(user=self.user2)
+        liked_by_self_and_one.likes.add(self.user, users[0])
+        liked_by_many = TripFactory(user=self.user2)
+        # Added one at a time, as likes are ordered by when they were added
+        for user in [self.user, *users]:
+            liked_by_many.likes.add(user)
+        not_liked = TripFactory(user=self.user2)
+
+        trips = [liked_by_one, liked_by_self, liked_by_self_and_one, liked_by_many, not_liked]
+        with self.assertNumQueries(1):
+            result = services.get_liked_str_context(MagicMock(user=self.user), trips)
+
+        self.assertEqual(
+            result,
+            {
+                liked_by_one.pk: "Test User 0 liked this",
+                liked_by_self.pk: "You liked this",
+                liked_by_self_and_one.pk: "Liked by Test User 0 and you",
+                liked_by_many.pk: "Liked by Test User 3, Test User 0 and 3 others",
+                not_liked.pk: "0 likes",
+            },
+        )
+
+        result = services.get_liked_str_context(MagicMock(user=AnonymousUser()), trips)
+        self.assertEqual(result[liked_by_self.pk], "Firstname liked this")
+        self.assertEqual(result[liked_by_many.pk], "Liked by Firstname, Test User 0 and 3 others")
+
+    def test_add_and_remove_like_update_the_likes_count(self):
+        """Test that liking a trip twice only counts once, and unliking reverses it."""
+        self.assertTrue(self.trip.add_like(self.user2))
+        self.assertFalse(self.trip.add_like(self.user2))
+        self.assertEqual(self.trip.likes_count, 1)
+        self.assertEqual(self.trip.likes.count(), 1)
+
+        self.assertTrue(self.trip.remove_like(self.user2))
+        self.assertFalse(self.trip.remove_like(self.user2))
+        self.assertEqual(self.trip.likes_count, 0)
+        self.assertEqual(self.trip.likes.count(), 0)
+
+    def test_saving_a_stale_trip_does_not_overwrite_the_counters(self):
+        """Test that a full save of an old instance does not reset the counters."""
+        stale_trip = Trip.objects.get(pk=self.trip.pk)
+        self.trip.add_like(self.user2)
+
+        stale_trip.cave_name = "Renamed Cave"
+        stale_trip.save()
+
+        self.trip.refresh_from_db()
+        self.assertEqual(self.trip.cave_name, "Renamed Cave")
+        self.assertEqual(self.trip.likes_count, 1)
+
+    def test_recount_trip_counters_command(self):
+        """Test that the recount_trip_counters command repairs counters that have drifted."""
+        self.trip.likes.add(self.user, self.user2)
+        TripPhoto.objects.create(trip=self.trip, user=self.user, is_valid=True)
+        TripPhoto.objects.create(trip=self.trip, user=self.user, is_valid=False)
+        Trip.objects.filter(pk=self.trip.pk).update(comments_count=5)
+
+        out = StringIO()
+        call_command("recount_trip_counters", stdout=out)
+        self.assertIn("Repaired the counters of 1 trips.", out.getvalue())
+
+        self.trip.refresh_from_db()
+        self.assertEqual(self.trip.likes_count, 2)
+        self.assertEqual(self.trip.comments_count, 0)
+        self.assertEqual(self.trip.valid_photo_count, 1)
+        self.assertEqual(Trip.objects.recount_counters(), 0)
 
     def test_trip_number_function(self):
         """Test the Trip model number function."""
@@ -353,6 +449,48 @@ class TripModelTests(TestCase):
         self.trip.save()
         self.assertEqual(self.trip.number, 6)
 
+    def assert_numbers_are_correct(self):
+        expected = dict(Trip.objects.with_numbers().values_list("pk", "row_number"))
+        self.assertEqual(dict(Trip.objects.values_list("pk", "number")), expected)
+
+    def test_trip_number_is_maintained(self):
+        """Test that stored trip numbers follow inserts, start and owner changes and deletes."""
+        self.assert_numbers_are_correct()
+        start = dt.fromisoformat("2010-01-01T13:00:00+00:00")
+
+        # A new trip with the same start time as an existing one comes first
+        new_trip = Trip.objects.create(user=self.user, cave_name="New", start=start)
+        self.assertEqual(new_trip.number, 2)
+        self.assert_numbers_are_correct()
+
+        new_trip.start = start - td(days=365)
+        new_trip.save()
+        self.assertEqual(new_trip.number, 1)
+        self.assert_numbers_are_correct()
+
+        new_trip.start = start + td(days=365)
+        new_trip.save(update_fields=["start"])
+        self.assert_numbers_are_correct()
+
+        # Trips are only renumbered when their start time or owner changes
+        new_trip.notes = "Not renumbered"
+        with CaptureQueriesContext(connection) as queries:
+            new_trip.save()
+        self.assertFalse([query for query in queries if "FOR UPDATE" in query["sql"]])
+
+        new_trip.user = self.user2
+        new_trip.save()
+        self.assertEqual(new_trip.number, 1)
+        self.assert_numbers_are_correct()
+
+        self.trip.delete()
+        self.assert_numbers_are_correct()
+
+        self.assertEqual(Trip.objects.renumber(), 0)
+        Trip.objects.update(number=None)
+        self.assertEqual(Trip.objects.renumber(), Trip.objects.count())
+        self.assert_numbers_are_correct()
+
     @tag("views")
     def test_trip_creation_form(self):
         """Test the trip creation form."""
@@ -544,7 +682,7 @@ class TripModelTests(TestCase):
 
 
 @tag("logger", "fast", "trip", "views")
-class TripDetailViewTests(TestCase):
+class TripDetailViewTests(IsolatedCacheMixin, TestCase):
     def setUp(self):
         self.client = Client()
 
@@ -683,3 +821,42 @@ class TripDetailViewTests(TestCase):
         response = self.client.get(trip.get_absolute_url())
         self.assertNotContains(response, "Add as friend")
         self.assertNotContains(response, reverse("users:friend_add"))
+
+
+@tag("logger", "trip", "privacy", "fast")
+class TripVisibilityTests(IsolatedCacheMixin, TestCase):
+    """Check that `Trip.objects.visible_to` agrees with `Trip.is_viewable_by`."""
+
+    def assert_visibility_agrees(self, viewers):
+        trips = Trip.objects.select_related("user").prefetch_related("user__friends")
+        for viewer in viewers:
+            with self.subTest(viewer=viewer):
+                expected = {trip.pk for trip in trips if trip.is_viewable_by(viewer)}
+                actual = set(Trip.objects.visible_to(viewer).values_list("pk", flat=True))
+                self.assertEqual(actual, expected)
+
+    def test_visible_to_agrees_for_every_privacy_combination(self):
+        """Test every trip privacy against every profile privacy and relationship."""
+        friend = UserFactory(is_active=True)
+        stranger = UserFactory(is_active=True)
+        owners = []
+        for profile_privacy in (User.PUBLIC, User.FRIENDS, User.PRIVATE):
+            owner = UserFactory(is_active=True, privacy=profile_privacy)
+            owner.friends.add(friend)
+            for trip_privacy in (Trip.DEFAULT, Trip.PUBLIC, Trip.FRIENDS, Trip.PRIVATE):
+                TripFactory(user=owner, privacy=trip_privacy)
+            owners.append(owner)
+
+        self.assert_visibility_agrees([None, AnonymousUser(), friend, stranger, *owners])
+
+    def test_visible_to_agrees_for_random_friendship_graphs(self):
+        """Test randomly generated users, friendships and trips."""
+        rng = random.Random(20240217)
+        for _graph in range(5):
+            Trip.objects.all().delete()
+            users = UserFactory.create_batch(6, is_active=True)
+            for user in users:
+                user.friends.set(rng.sample(users, rng.randint(0, len(users) - 1)))
+                TripFactory.create_batch(rng.randint(0, 4), user=user)
+
+            self.assert_visibility_agrees([None, *users])
@@ -1,5 +1,6 @@
 from datetime import timedelta as td
 
+from core.tests.mixins import IsolatedCacheMixin
 from django.contrib.auth import get_user_model
 from django.contrib.gis.geos import Point
 from django.test import Client, TestCase, tag
@@ -13,7 +14,7 @@ User = get_user_model()
 
 
 @tag("fast", "profile", "logger", "views")
-class UserProfileViewTests(TestCase):
+class UserProfileViewTests(IsolatedCacheMixin, TestCase):
     def setUp(self):
         self.client = Client()
 
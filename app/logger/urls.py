@@ -21,6 +21,11 @@ urlpatterns = [
         views.HTMXTripFollow.as_view(),
         name="trip_follow_htmx_view",
     ),
+    path(
+        "trip/cave_names/",
+        views.HTMXCaveNameSuggestions.as_view(),
+        name="cave_name_suggestions",
+    ),
     path("trip/<uuid:uuid>/", views.TripDetail.as_view(), name="trip_detail"),
     path("trip/<uuid:uuid>/photos/", views.TripPhotos.as_view(), name="trip_photos"),
     path(
@@ -84,6 +89,8 @@ urlpatterns = [
     ),
     path("report/<uuid:uuid>/", views.TripReportRedirect.as_view(), name="report_detail"),
     path("search/", views.Search.as_view(), name="search"),
+    path("search/stream/", views.SearchStream.as_view(), name="search_stream"),
+    path("discover/", views.Discover.as_view(), name="discover"),
     path("feed/htmx/", views.HTMXTripFeed.as_view(), name="feed_htmx_view"),
     path("feed/set_ordering/", views.SetFeedOrdering.as_view(), name="feed_set_ordering"),
 ]
@@ -8,8 +8,8 @@ from .cavers import (
     CaverRename,
     CaverUnlink,
 )
-from .feed import HTMXTripFeed, HTMXTripLike, Index, SetFeedOrdering
-from .search import Search
+from .feed import Discover, HTMXTripFeed, HTMXTripLike, Index, SetFeedOrdering
+from .search import Search, SearchStream
 from .tripphotos import (
     TripPhotoFeature,
     TripPhotos,
@@ -21,6 +21,7 @@ from .tripphotos import (
     TripPhotoUnsetFeature,
 )
 from .trips import (
+    HTMXCaveNameSuggestions,
     HTMXTripFollow,
     TripCreate,
     TripDelete,
@@ -40,11 +41,13 @@ __all__ = [
     "CaverMerge",
     "CaverRename",
     "CaverUnlink",
+    "Discover",
     "HTMXTripFeed",
     "HTMXTripLike",
     "Index",
     "SetFeedOrdering",
     "Search",
+    "SearchStream",
     "TripCreate",
     "TripDelete",
     "TripDetail",
@@ -61,4 +64,5 @@ __all__ = [
     "TripPhotosUploadSuccess",
     "TripPhotoUnsetFeature",
     "HTMXTripFollow",
+    "HTMXCaveNameSuggestions",
 ]
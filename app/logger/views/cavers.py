@@ -3,7 +3,7 @@ from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.exceptions import PermissionDenied
 from django.db import transaction
-from django.db.models import Count, Max, Sum
+from django.db.models import Max, Sum
 from django.shortcuts import get_object_or_404, redirect
 from django.views import View
 from django.views.generic import DetailView, ListView
@@ -14,15 +14,14 @@ from ..models import Caver, Trip
 
 class CaverAutocomplete(LoginRequiredMixin, autocomplete.Select2QuerySetView):
     def get_queryset(self):
-        qs = Caver.objects.filter(user=self.request.user)
+        # This may be a list of cached cavers rather than a queryset
+        return Caver.objects.autocomplete(self.request.user, self.q)
 
-        if self.q:
-            qs = qs.filter(name__istartswith=self.q)
-
-        return qs
+    def validate(self, text):
+        Caver(name=text, user=self.request.user).full_clean(exclude=["linked_account"])
 
     def create_object(self, text):
-        return self.get_queryset().get_or_create(name=text, user=self.request.user)[0]
+        return Caver.objects.get_or_create(name=text, user=self.request.user)[0]
 
     def has_add_permission(self, request):
         return True
@@ -39,7 +38,6 @@ class CaverList(LoginRequiredMixin, ListView):
             Caver.objects.filter(user=self.request.user)
             .prefetch_related("trip_set")
             .order_by("name")
-            .annotate(trip_count=Count("trip", distinct=True))
             .annotate(last_trip_date=Max("trip__start"))
             .annotate(annotated_total_trip_duration=Sum("trip__duration", distinct=True))
         )
@@ -32,9 +32,8 @@ class Index(TemplateView):
         context = super().get_context_data(**kwargs)
         user = get_user(self.request)
         context["ordering"] = user.feed_ordering
-        context["trips"] = services.get_trips_context(self.request, context["ordering"])
+        context.update(services.get_feed_context(self.request, context["ordering"]))
         context["quick_stats"] = user.quick_stats
-        context["liked_str"] = services.get_liked_str_context(self.request, context["trips"])
 
         # If there are no trips, show the new user page
         if context["trips"]:
@@ -46,6 +45,24 @@ class Index(TemplateView):
         return context
 
 
+class Discover(LoginRequiredMixin, TemplateView):
+    """Show the most popular recent public trips, ranked by `TripScore`."""
+
+    template_name = "logger/social_feed.html"
+
+    @method_decorator(ratelimit(key="user", rate="500/h", group="feed"))
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["discover"] = True
+        context.update(services.get_discover_context(self.request))
+        context["quick_stats"] = get_user(self.request).quick_stats
+        services.bulk_update_view_count(self.request, context["trips"])
+        return context
+
+
 class SetFeedOrdering(LoginRequiredMixin, View):
     @method_decorator(ratelimit(key="user", rate="30/h"))
     def post(self, request, *args, **kwargs):
@@ -67,18 +84,18 @@ class HTMXTripLike(LoginRequiredMixin, TemplateView):
         trip = self._get_trip(request, uuid)
 
         if trip.user_liked:  # User already liked, so remove the existing like
-            trip.likes.remove(request.user)
+            trip.remove_like(request.user)
             trip.user_liked = False
             log_trip_action(request.user, trip, "unliked")
 
-            if not trip.likes.exists():
+            if not trip.likes_count:
                 # Delete the notification if there are no likes left
                 notification = self._get_trip_like_notification(trip)
                 if notification:
                     notification.delete()
 
         else:  # A new like, so add it
-            trip.likes.add(request.user)
+            trip.add_like(request.user)
             trip.user_liked = True
             log_trip_action(request.user, trip, "liked")
 
@@ -93,13 +110,10 @@ class HTMXTripLike(LoginRequiredMixin, TemplateView):
                         trip=trip, user=trip.user, type=Notification.TRIP_LIKE
                     )
 
-        friends = request.user.friends.all()
-        liked_str = {trip.pk: trip.get_liked_str(request.user, friends)}
-
         context = {
             "trip": trip,
-            "liked_str": liked_str,
-            "likes_count": trip.likes.count(),
+            "liked_str": services.get_liked_str_context(request, [trip]),
+            "likes_count": trip.likes_count,
         }
 
         return self.render_to_response(context)
@@ -141,12 +155,16 @@ class HTMXTripFeed(LoginRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["ordering"] = get_user(self.request).feed_ordering
-        context["trips"] = services.get_trips_context(
-            request=self.request,
-            ordering=context["ordering"],
-            page=self.request.GET.get("page", 1),
-        )
-        context["liked_str"] = services.get_liked_str_context(self.request, context["trips"])
+        try:
+            context.update(
+                services.get_feed_context(
+                    request=self.request,
+                    ordering=context["ordering"],
+                    cursor=self.request.GET.get("cursor"),
+                )
+            )
+        except ValueError:
+            raise Http404
 
         services.bulk_update_view_count(self.request, context["trips"])
 
@@ -1,8 +1,12 @@
+import json
+
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.utils.decorators import method_decorator
+from django.views import View
 from django.views.generic import FormView
 from django_ratelimit.decorators import ratelimit
 
@@ -10,34 +14,53 @@ from .. import search
 from ..forms import TripSearchForm
 
 
+def get_search_params(form):
+    """Return the parameters of the search made with a valid `TripSearchForm`."""
+    return {
+        "terms": form.cleaned_data["terms"],
+        "search_user": form.cleaned_data.get("user"),
+        "type": form.cleaned_data.get("trip_type"),
+        "country": form.cleaned_data.get("in_country"),
+        "year": form.cleaned_data.get("year"),
+        "fields": [f for f in search.SEARCH_FIELD_WEIGHTS if form.cleaned_data.get(f)],
+        "fuzzy": form.cleaned_data.get("fuzzy"),
+    }
+
+
+def get_session_params(form):
+    """Return the fields of a valid `TripSearchForm`, to be stored to repeat the search."""
+    params = {name: form.cleaned_data.get(name) for name in form.fields}
+    if params["user"]:
+        params["user"] = params["user"].username
+    return params
+
+
 @method_decorator(ratelimit(key="user", rate="60/h", method=ratelimit.UNSAFE), name="dispatch")
 class Search(LoginRequiredMixin, FormView):
     form_class = TripSearchForm
     template_name = "logger/search.html"
 
+    # GET parameters which narrow down the last search to one of its facets
+    REFINE_PARAMS = ("trip_type", "in_country", "year")
+
     def get(self, request, *args, **kwargs):
-        if "page" in self.request.GET:
-            form = TripSearchForm(self.request.session["search_params"])
+        params = self.request.session.get("search_params")
+        refine = {k: v for k, v in self.request.GET.items() if k in self.REFINE_PARAMS}
+        if params and ("cursor" in self.request.GET or refine):
+            params = {**params, **refine}
+            form = TripSearchForm(params)
             if form.is_valid():
-                return self.form_valid(form, store_params=False)
+                return self.form_valid(form, cursor=self.request.GET.get("cursor"))
 
         return super().get(request, *args, **kwargs)
 
-    def form_valid(self, form, store_params=True):
-        search_fields = [f for f in form.cleaned_data if form.cleaned_data[f] is True]
-
-        search_user = form.cleaned_data.get("user")
-        trips = search.trip_search(
-            terms=form.cleaned_data["terms"],
-            for_user=self.request.user,
-            search_user=search_user,
-            type=form.cleaned_data.get("trip_type"),
-            fields=search_fields,
-        )
-
-        paginator = Paginator(trips, 10, allow_empty_first_page=True)
-        page = self.request.GET.get("page", 1)
-        trips = paginator.get_page(page)
+    def form_valid(self, form, cursor=None):
+        try:
+            trips = search.trip_search(
+                for_user=self.request.user, cursor=cursor, **get_search_params(form)
+            )
+        except ValueError:
+            raise Http404
 
         context = {
             "trips": trips,
@@ -47,9 +70,28 @@ class Search(LoginRequiredMixin, FormView):
         if len(trips) == 0:
             messages.error(self.request, "No trips were found with the provided search terms.")
 
-        # Store the POST parameters in the session so that the user can paginate
-        # through the results without losing the search.
-        if store_params:
-            self.request.session["search_params"] = self.request.POST
+        # Store the search in the session so that the user can paginate through
+        # and refine the results without losing it.
+        self.request.session["search_params"] = get_session_params(form)
 
         return render(self.request, "logger/search.html", context)
+
+
+@method_decorator(ratelimit(key="user", rate="60/h"), name="dispatch")
+class SearchStream(LoginRequiredMixin, View):
+    """Stream every trip matching a search as newline delimited JSON.
+
+    The search is made with the same GET parameters as the fields of the search form,
+    and the trip type defaults to any type.
+    """
+
+    def get(self, request, *args, **kwargs):
+        form = TripSearchForm({"trip_type": "Any", **request.GET.dict()})
+        if not form.is_valid():
+            return JsonResponse({"errors": form.errors}, status=400)
+
+        trips = search.stream_trip_search(for_user=request.user, **get_search_params(form))
+        return StreamingHttpResponse(
+            (json.dumps(trip, cls=DjangoJSONEncoder) + "\n" for trip in trips),
+            content_type="application/x-ndjson",
+        )
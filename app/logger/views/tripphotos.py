@@ -10,6 +10,7 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.messages.views import SuccessMessageMixin
 from django.core.exceptions import BadRequest, PermissionDenied
 from django.core.files import File
+from django.db import transaction
 from django.db.models.fields.files import ImageFieldFile
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect
@@ -20,10 +21,11 @@ from django.utils.timezone import make_aware
 from django.views.generic import FormView, View
 from django_ratelimit.decorators import ratelimit
 from PIL import Image
+from stats.models import UserStats
 
 from .. import services
 from ..forms import PhotoPrivacyForm, TripPhotoForm
-from ..models import Trip, TripPhoto, trip_photo_upload_path
+from ..models import FeedEntry, Trip, TripPhoto, trip_photo_upload_path
 
 
 class TripPhotos(LoginRequiredMixin, SuccessMessageMixin, FormView):
@@ -133,8 +135,12 @@ class TripPhotosUploadSuccess(LoginRequiredMixin, View):
                 )
 
         photo.filesize = photo.photo.size
-        photo.is_valid = True
-        photo.save()
+        with transaction.atomic():
+            if not photo.is_valid and photo.photo_type == TripPhoto.PhotoTypes.DEFAULT:
+                trip.update_counters(valid_photo_count=1)
+                UserStats.objects.update_counters(request.user, photos=1)
+            photo.is_valid = True
+            photo.save()
         log_tripphoto_action(request.user, photo, "uploaded", f"{photo.filesize} bytes")
         return JsonResponse({"success": True})
 
@@ -148,6 +154,7 @@ class TripPhotosUpdate(LoginRequiredMixin, View):
         form = TripPhotoForm(request.POST, instance=photo)
         if form.is_valid():
             photo = form.save()
+            FeedEntry.objects.invalidate_trip(photo.trip)
             messages.success(request, "The photo has been updated.")
             log_tripphoto_action(request.user, photo, "updated the caption for", photo.caption)
             return redirect(photo.trip.get_absolute_url())
@@ -164,8 +171,12 @@ class TripPhotosDelete(LoginRequiredMixin, View):
         if not photo.user == request.user:
             raise PermissionDenied
 
-        photo.deleted_at = timezone.now()
-        photo.save()
+        with transaction.atomic():
+            if TripPhoto.objects.valid().filter(pk=photo.pk).exists():
+                photo.trip.update_counters(valid_photo_count=-1)
+                UserStats.objects.update_counters(request.user, photos=-1)
+            photo.deleted_at = timezone.now()
+            photo.save()
         log_tripphoto_action(request.user, photo, "deleted")
         messages.success(request, "The photo has been deleted.")
         return redirect(photo.trip.get_absolute_url())
@@ -179,8 +190,10 @@ class TripPhotosDeleteAll(LoginRequiredMixin, View):
 
         qs = TripPhoto.objects.valid().filter(trip=trip, user=request.user)
         if qs.exists():
-            deleted_count = qs.count()
-            qs.update(deleted_at=timezone.now())
+            with transaction.atomic():
+                deleted_count = qs.update(deleted_at=timezone.now())
+                trip.update_counters(valid_photo_count=-deleted_count)
+                UserStats.objects.update_counters(request.user, photos=-deleted_count)
             messages.success(request, "All photos for the trip have been deleted.")
             log_trip_action(
                 request.user,
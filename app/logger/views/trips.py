@@ -6,7 +6,8 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.gis.geos import Point
 from django.contrib.messages.views import SuccessMessageMixin
 from django.core.exceptions import PermissionDenied
-from django.db.models import Count, Exists, OuterRef
+from django.db import transaction
+from django.db.models import Exists, OuterRef
 from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse
@@ -15,11 +16,13 @@ from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.generic import CreateView, RedirectView, TemplateView, UpdateView
 from django_ratelimit.decorators import ratelimit
+from stats.models import UserStats
 from users.models import CavingUser as User
 
+from .. import search, services
 from ..forms import TripForm
 from ..mixins import TripContextMixin, ViewableObjectDetailView
-from ..models import Trip, TripPhoto
+from ..models import CaveNameDictionary, FeedEntry, Trip, TripPhoto
 
 
 class TripsRedirect(LoginRequiredMixin, RedirectView):
@@ -61,6 +64,10 @@ class TripUpdate(LoginRequiredMixin, SuccessMessageMixin, UpdateView):
 
         trip.save()
         form.save_m2m()
+        if "cavers" in form.changed_data:
+            # The trip is searched and shown in the feed with its cavers
+            search.invalidate_search_results()
+            FeedEntry.objects.invalidate_trip(trip)
 
         log_trip_action(self.request.user, self.object, "updated")
         return redirect(trip.get_absolute_url())
@@ -84,15 +91,11 @@ class TripDetail(TripContextMixin, ViewableObjectDetailView):
             .prefetch_related(
                 "photos",
                 "cavers",
-                "likes",
                 "comments",
                 "comments__author",
-                "likes__friends",
                 "user__friends",
             )
             .annotate(
-                likes_count=Count("likes", distinct=True),
-                comments_count=Count("comments", distinct=True),
                 user_liked=Exists(
                     User.objects.filter(pk=self.request.user.pk, liked_trips=OuterRef("pk")).only(
                         "pk"
@@ -105,14 +108,7 @@ class TripDetail(TripContextMixin, ViewableObjectDetailView):
         """Add the string of users that liked the trip to the context."""
         context = super().get_context_data(*args, **kwargs)
 
-        if self.request.user.is_authenticated:
-            friends = get_user(self.request).friends.all()
-        else:
-            friends = None
-
-        context["liked_str"] = {
-            self.object.pk: self.object.get_liked_str(self.request.user, friends)
-        }
+        context["liked_str"] = services.get_liked_str_context(self.request, [self.object])
 
         photos = self.object.valid_photos
         if photos.exists() and (
@@ -149,6 +145,10 @@ class TripCreate(LoginRequiredMixin, SuccessMessageMixin, CreateView):
 
         trip.save()
         form.save_m2m()
+        if "cavers" in form.changed_data:
+            # The trip is searched and shown in the feed with its cavers
+            search.invalidate_search_results()
+            FeedEntry.objects.invalidate_trip(trip)
         trip.followers.add(self.request.user)
 
         log_trip_action(self.request.user, trip, "added")
@@ -177,10 +177,13 @@ class TripDelete(LoginRequiredMixin, View):
 
         # Delete all photos associated with the trip
         photos = TripPhoto.objects.all().filter(trip=trip)
-        if photos.exists():
-            photos.update(deleted_at=timezone.now())
+        with transaction.atomic():
+            if photos.exists():
+                valid_count = TripPhoto.objects.valid().filter(trip=trip).count()
+                photos.update(deleted_at=timezone.now())
+                UserStats.objects.update_counters(request.user, photos=-valid_count)
 
-        trip.delete()
+            trip.delete()
         log_trip_action(request.user, trip, "deleted")
         messages.success(
             request,
@@ -236,3 +239,17 @@ class HTMXTripFollow(LoginRequiredMixin, TemplateView):
             return trip
 
         raise PermissionDenied
+
+
+class HTMXCaveNameSuggestions(LoginRequiredMixin, TemplateView):
+    """HTMX view for suggesting cave names as one is typed in."""
+
+    template_name = "logger/_htmx_cave_name_suggestions.html"
+
+    # The names of the inputs which cave names may be typed into
+    QUERY_PARAMS = ("cave_name", "terms")
+
+    def get(self, request, *args, **kwargs):
+        query = next((request.GET[p] for p in self.QUERY_PARAMS if p in request.GET), "")
+        context = {"cave_names": CaveNameDictionary.objects.suggest(request.user, query)}
+        return self.render_to_response(context)
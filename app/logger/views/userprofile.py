@@ -43,15 +43,14 @@ class UserProfile(TemplateView):
             .order_by("-start")
         )
 
+        # Remove trips that the user cannot view
+        if (self.profile_user != for_user) and (for_user is None or not for_user.is_superuser):
+            trips = trips.visible_to(for_user)
+
         for trip in trips:
             trip.total_surveyed_dist = trip.surveyed_dist + trip.resurveyed_dist  # type: ignore[attr-defined]
 
-        # Remove trips that the user cannot view
-        if (self.profile_user == for_user) or (for_user is not None and for_user.is_superuser):
-            return list(trips)
-
-        friends = self.profile_user.friends.all()
-        return [x for x in trips if x.is_viewable_by(for_user, friends)]
+        return list(trips)
 
     # noinspection PyTypeChecker
     def get_context_data(self, **kwargs: Any) -> dict[str, Any]:
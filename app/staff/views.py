@@ -1,6 +1,6 @@
 from comments.models import Comment
 from django.contrib.auth import get_user_model
-from django.db.models import Count, Sum
+from django.db.models import Count, Exists, OuterRef, Sum
 from django.views.generic import RedirectView, TemplateView
 from logger.models import Caver, Trip, TripPhoto
 
@@ -44,16 +44,16 @@ class Dashboard(ModeratorRequiredMixin, TemplateView):
             Trip.objects.all()
             .order_by("-added")
             .select_related("user")
-            .prefetch_related("comments", "photos", "user__friends")
+            .prefetch_related("user__friends")
             .annotate(
-                comment_count=Count("comments", distinct=True),
-                photo_count=Count("photos", distinct=True),
-                like_count=Count("likes", distinct=True),
+                is_viewable=Exists(
+                    Trip.objects.visible_to(self.request.user).filter(pk=OuterRef("pk"))
+                ),
             )[:30]
         )
 
         for trip in context["recent_trips"]:
-            if not trip.is_viewable_by(self.request.user):
+            if not trip.is_viewable:
                 trip.cave_name = "Private trip"
 
             if not trip.user.is_viewable_by(self.request.user):
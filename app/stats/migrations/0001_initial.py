@@ -0,0 +1,106 @@
+# Generated by Django 5.2.9 on 2026-10-17 07:51
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Kept in agreement with `UserWeeklyStatsManager.rebuild`
+POPULATE_WEEKLY_STATS = """
+INSERT INTO stats_userweeklystats (user_id, week_start, type, trips, duration, vert_up,
+    vert_down, surveyed, resurveyed, aid, horizontal, caving_days)
+SELECT trip.user_id,
+    GREATEST(date_trunc('week', trip.start AT TIME ZONE owner.timezone),
+        date_trunc('month', trip.start AT TIME ZONE owner.timezone))::date,
+    trip.type,
+    COUNT(*),
+    COALESCE(SUM(trip.duration), '0'::interval),
+    COALESCE(SUM(trip.vert_dist_up), 0),
+    COALESCE(SUM(trip.vert_dist_down), 0),
+    COALESCE(SUM(trip.surveyed_dist), 0),
+    COALESCE(SUM(trip.resurveyed_dist), 0),
+    COALESCE(SUM(trip.aid_dist), 0),
+    COALESCE(SUM(trip.horizontal_dist), 0),
+    bit_or(1 << (EXTRACT(ISODOW FROM trip.start AT TIME ZONE owner.timezone)::int - 1))
+FROM logger_trip trip
+INNER JOIN users_cavinguser owner ON owner.id = trip.user_id
+GROUP BY 1, 2, 3;
+"""
+
+
+class Migration(migrations.Migration):
+    initial = True
+
+    dependencies = [
+        ("logger", "0060_caver_trip_count"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserWeeklyStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("week_start", models.DateField()),
+                (
+                    "type",
+                    models.CharField(
+                        choices=[
+                            ("Sport", "Sport"),
+                            ("Digging", "Digging"),
+                            ("Survey", "Survey"),
+                            ("Exploration", "Exploration"),
+                            ("Aid climbing", "Aid climbing"),
+                            ("Photography", "Photography"),
+                            ("Training", "Training"),
+                            ("Rescue", "Rescue"),
+                            ("Science", "Science"),
+                            ("Hauling", "Hauling"),
+                            ("Rigging", "Rigging"),
+                            ("Surface", "Surface"),
+                            ("Other", "Other"),
+                        ],
+                        max_length=15,
+                    ),
+                ),
+                ("trips", models.PositiveIntegerField(default=0)),
+                ("duration", models.DurationField(default=timedelta)),
+                ("vert_up", models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ("vert_down", models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ("surveyed", models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ("resurveyed", models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ("aid", models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ("horizontal", models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                (
+                    "caving_days",
+                    models.PositiveSmallIntegerField(
+                        default=0,
+                        help_text="The days of the week with a trip starting, as bits from Monday upwards.",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="weekly_stats",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "user weekly stats",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "week_start", "type"), name="unique_user_weekly_stats"
+                    )
+                ],
+            },
+        ),
+        migrations.RunSQL(POPULATE_WEEKLY_STATS, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,166 @@
+# Generated by Django 5.2.9 on 2026-10-17 10:28
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# A caver is counted while they are on any of a user's trips other than surface trips
+CREATE_TRIGGERS = """
+CREATE FUNCTION stats_userstats_trip_cavers() RETURNS trigger AS $$
+DECLARE
+    link logger_trip_cavers%ROWTYPE;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        link := OLD;
+    ELSE
+        link := NEW;
+    END IF;
+
+    UPDATE stats_userstats SET cavers = cavers + CASE TG_OP WHEN 'DELETE' THEN -1 ELSE 1 END
+    FROM logger_trip trip
+    WHERE trip.id = link.trip_id AND trip.type <> 'Surface'
+    AND stats_userstats.user_id = trip.user_id
+    AND NOT EXISTS (
+        SELECT 1 FROM logger_trip_cavers other
+        INNER JOIN logger_trip other_trip ON other_trip.id = other.trip_id
+        WHERE other.caver_id = link.caver_id AND other.trip_id <> link.trip_id
+        AND other_trip.user_id = trip.user_id AND other_trip.type <> 'Surface'
+    );
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER stats_userstats_trip_cavers
+    AFTER INSERT OR DELETE ON logger_trip_cavers
+    FOR EACH ROW EXECUTE FUNCTION stats_userstats_trip_cavers();
+
+CREATE FUNCTION stats_userstats_trip_type() RETURNS trigger AS $$
+BEGIN
+    UPDATE stats_userstats
+    SET cavers = cavers + CASE WHEN NEW.type = 'Surface' THEN -1 ELSE 1 END * (
+        SELECT COUNT(*) FROM logger_trip_cavers link WHERE link.trip_id = NEW.id
+        AND NOT EXISTS (
+            SELECT 1 FROM logger_trip_cavers other
+            INNER JOIN logger_trip other_trip ON other_trip.id = other.trip_id
+            WHERE other.caver_id = link.caver_id AND other.trip_id <> NEW.id
+            AND other_trip.user_id = NEW.user_id AND other_trip.type <> 'Surface'
+        )
+    )
+    WHERE user_id = NEW.user_id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER stats_userstats_trip_type
+    AFTER UPDATE OF type ON logger_trip
+    FOR EACH ROW WHEN ((OLD.type = 'Surface') <> (NEW.type = 'Surface'))
+    EXECUTE FUNCTION stats_userstats_trip_type();
+"""
+
+DROP_TRIGGERS = """
+DROP TRIGGER stats_userstats_trip_type ON logger_trip;
+DROP FUNCTION stats_userstats_trip_type();
+DROP TRIGGER stats_userstats_trip_cavers ON logger_trip_cavers;
+DROP FUNCTION stats_userstats_trip_cavers();
+"""
+
+# Kept in agreement with `UserStatsManager.recount`
+POPULATE_USER_STATS = """
+INSERT INTO stats_userstats (user_id, trips, duration, vert_up, vert_down, surveyed,
+    resurveyed, aid, horizontal, longest_trip, last_trip_id, cavers, friends, photos)
+SELECT owner.id,
+    COALESCE(totals.trips, 0),
+    COALESCE(totals.duration, '0'::interval),
+    COALESCE(totals.vert_up, 0),
+    COALESCE(totals.vert_down, 0),
+    COALESCE(totals.surveyed, 0),
+    COALESCE(totals.resurveyed, 0),
+    COALESCE(totals.aid, 0),
+    COALESCE(totals.horizontal, 0),
+    COALESCE(totals.longest_trip, '0'::interval),
+    last_trip.id,
+    COALESCE(cavers.count, 0),
+    COALESCE(friends.count, 0),
+    COALESCE(photos.count, 0)
+FROM users_cavinguser owner
+LEFT JOIN (
+    SELECT user_id, COUNT(*) AS trips, SUM(duration) AS duration,
+        SUM(vert_dist_up) AS vert_up, SUM(vert_dist_down) AS vert_down,
+        SUM(surveyed_dist) AS surveyed, SUM(resurveyed_dist) AS resurveyed,
+        SUM(aid_dist) AS aid, SUM(horizontal_dist) AS horizontal,
+        MAX(duration) AS longest_trip
+    FROM logger_trip WHERE type <> 'Surface' GROUP BY user_id
+) AS totals ON totals.user_id = owner.id
+LEFT JOIN (
+    SELECT DISTINCT ON (user_id) user_id, id FROM logger_trip
+    ORDER BY user_id, start DESC, id DESC
+) AS last_trip ON last_trip.user_id = owner.id
+LEFT JOIN (
+    SELECT trip.user_id, COUNT(DISTINCT link.caver_id) AS count
+    FROM logger_trip_cavers link INNER JOIN logger_trip trip ON trip.id = link.trip_id
+    WHERE trip.type <> 'Surface' GROUP BY trip.user_id
+) AS cavers ON cavers.user_id = owner.id
+LEFT JOIN (
+    SELECT from_cavinguser_id AS user_id, COUNT(*) AS count FROM users_cavinguser_friends
+    GROUP BY from_cavinguser_id
+) AS friends ON friends.user_id = owner.id
+LEFT JOIN (
+    SELECT user_id, COUNT(*) AS count FROM logger_tripphoto
+    WHERE is_valid AND deleted_at IS NULL AND photo_type = 'DE' GROUP BY user_id
+) AS photos ON photos.user_id = owner.id;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("logger", "0060_caver_trip_count"),
+        ("stats", "0001_initial"),
+        ("users", "0046_cavinguser_feed_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserStats",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("trips", models.PositiveIntegerField(default=0)),
+                ("duration", models.DurationField(default=timedelta)),
+                ("vert_up", models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ("vert_down", models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ("surveyed", models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ("resurveyed", models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ("aid", models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ("horizontal", models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ("longest_trip", models.DurationField(default=timedelta)),
+                ("cavers", models.PositiveIntegerField(default=0)),
+                ("friends", models.PositiveIntegerField(default=0)),
+                ("photos", models.PositiveIntegerField(default=0)),
+                (
+                    "last_trip",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="logger.trip",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "user stats",
+            },
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS, reverse_sql=DROP_TRIGGERS),
+        migrations.RunSQL(POPULATE_USER_STATS, reverse_sql=migrations.RunSQL.noop),
+    ]
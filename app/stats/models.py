@@ -0,0 +1,378 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, models, transaction
+from django.db.models import F
+from logger.models import Trip, TripPhoto
+
+# The date of the week a trip is counted in, given the timezone of its owner. Weeks are
+# split at the start of each month, so that every week lies within a single month and
+# year, and rows may be totalled over weeks, months or years alike.
+WEEK_START_SQL = (
+    "GREATEST(date_trunc('week', trip.start AT TIME ZONE {0}), "
+    "date_trunc('month', trip.start AT TIME ZONE {0}))::date"
+)
+
+# The bit of `UserWeeklyStats.caving_days` for the day of the week a trip started on
+DAY_BIT_SQL = "(1 << (EXTRACT(ISODOW FROM trip.start AT TIME ZONE {0})::int - 1))"
+
+# The columns of `UserWeeklyStats` which are totals of the trips in a week, with the
+# column of each trip that they total
+TOTAL_COLUMNS = {
+    "duration": "duration",
+    "vert_up": "vert_dist_up",
+    "vert_down": "vert_dist_down",
+    "surveyed": "surveyed_dist",
+    "resurveyed": "resurveyed_dist",
+    "aid": "aid_dist",
+    "horizontal": "horizontal_dist",
+}
+
+# The fields of a trip which change the statistics it is counted in
+TRIP_FIELDS = frozenset(["user", "type", "start", "end", "duration", *TOTAL_COLUMNS.values()])
+
+
+class UserWeeklyStatsManager(models.Manager):
+    def add_trip(self, trip: Trip):
+        """Count `trip`, as stored in the database, in the statistics of its owner."""
+        self._add("trip.id = %s", [trip.pk])
+
+    def remove_trip(self, trip: Trip):
+        """Stop counting `trip`, as stored in the database, in the statistics of its owner.
+
+        This must be called before the trip is changed or deleted, and `add_trip` once
+        a changed trip has been saved.
+        """
+        self._subtract(trip.pk)
+
+    def rebuild(self, user=None):
+        """Rebuild the statistics of `user`, or of every user, from their trips.
+
+        Returns:
+            The number of rows stored.
+        """
+        rows = self.all() if user is None else self.filter(user=user)
+        with transaction.atomic():
+            rows.delete()
+            if user is None:
+                self._add("TRUE", [])
+            else:
+                self._add("trip.user_id = %s", [user.pk])
+        return rows.count()
+
+    def _tables(self):
+        """Return the quoted names of the rollup, trip and user tables."""
+        return [
+            connection.ops.quote_name(model._meta.db_table)
+            for model in (self.model, Trip, get_user_model())
+        ]
+
+    def _totals_sql(self, where_sql):
+        """Return SQL totalling the trips matching `where_sql` by owner, week and type."""
+        _, trip_table, user_table = self._tables()
+        totals = []
+        for column, field in TOTAL_COLUMNS.items():
+            zero = "'0'::interval" if column == "duration" else "0"
+            totals.append(f"COALESCE(SUM(trip.{field}), {zero}) AS {column}")
+        totals = ", ".join(totals)
+        return (
+            f"SELECT trip.user_id, {WEEK_START_SQL.format('owner.timezone')} AS week_start, "
+            f"trip.type, owner.timezone, COUNT(*) AS trips, {totals}, "
+            f"bit_or({DAY_BIT_SQL.format('owner.timezone')}) AS caving_days "
+            f"FROM {trip_table} trip INNER JOIN {user_table} owner ON owner.id = trip.user_id "
+            f"WHERE {where_sql} "
+            f"GROUP BY 1, 2, 3, 4"
+        )
+
+    def _add(self, where_sql, params):
+        """Count each trip matching `where_sql` once more."""
+        table = self._tables()[0]
+        columns = ["trips", *TOTAL_COLUMNS]
+        updates = ", ".join(
+            f"{column} = {table}.{column} + EXCLUDED.{column}" for column in columns
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (user_id, week_start, type, {', '.join(columns)}, "
+                f"caving_days) "
+                f"SELECT user_id, week_start, type, {', '.join(columns)}, caving_days "
+                f"FROM ({self._totals_sql(where_sql)}) AS totals "
+                f"ON CONFLICT (user_id, week_start, type) DO UPDATE SET {updates}, "
+                f"caving_days = {table}.caving_days | EXCLUDED.caving_days",
+                params,
+            )
+
+    def _subtract(self, trip_id):
+        """Count the trip with the id `trip_id` once less.
+
+        The days caved on in the trip's week are found again from the other trips in
+        that week, and the week is removed if there are none.
+        """
+        table, trip_table, _ = self._tables()
+        columns = ["trips", *TOTAL_COLUMNS]
+        updates = ", ".join(f"{column} = {table}.{column} - totals.{column}" for column in columns)
+        # The other trips in the week, found by the index on their start
+        remaining_sql = (
+            f"SELECT COALESCE(bit_or({DAY_BIT_SQL.format('totals.timezone')}), 0) "
+            f"FROM {trip_table} trip "
+            f"WHERE trip.user_id = totals.user_id AND trip.type = totals.type "
+            f"AND trip.start >= totals.week_start::timestamp AT TIME ZONE totals.timezone "
+            f"AND trip.start < (totals.week_start + 7)::timestamp AT TIME ZONE totals.timezone "
+            f"AND {WEEK_START_SQL.format('totals.timezone')} = totals.week_start "
+            f"AND trip.id <> %s"
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"WITH totals AS MATERIALIZED ({self._totals_sql('trip.id = %s')}) "
+                f"UPDATE {table} SET {updates}, caving_days = ({remaining_sql}) FROM totals "
+                f"WHERE {table}.user_id = totals.user_id "
+                f"AND {table}.week_start = totals.week_start AND {table}.type = totals.type",
+                [trip_id, trip_id],
+            )
+            cursor.execute(
+                f"DELETE FROM {table} WHERE trips <= 0 "
+                f"AND user_id IN (SELECT user_id FROM {trip_table} WHERE id = %s)",
+                [trip_id],
+            )
+
+
+class UserWeeklyStats(models.Model):
+    """The totals of a user's trips of one type in one week.
+
+    Weeks start on Monday in the user's timezone, but are split at the start of each
+    month, so a week spanning two months is stored as two rows. The totals are kept
+    up to date as trips are saved and deleted, and may be rebuilt with the
+    `rebuild_weekly_stats` command.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="weekly_stats",
+    )
+    week_start = models.DateField()
+    type = models.CharField(max_length=15, choices=Trip.TRIP_TYPES)
+    trips = models.PositiveIntegerField(default=0)
+    duration = models.DurationField(default=timedelta)
+    vert_up = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    vert_down = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    surveyed = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    resurveyed = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    aid = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    horizontal = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    caving_days = models.PositiveSmallIntegerField(
+        default=0,
+        help_text="The days of the week with a trip starting, as bits from Monday upwards.",
+    )
+
+    objects = UserWeeklyStatsManager()
+
+    class Meta:
+        verbose_name_plural = "user weekly stats"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "week_start", "type"],
+                name="unique_user_weekly_stats",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.week_start} {self.type}"
+
+
+class UserStatsManager(models.Manager):
+    def for_user(self, user):
+        """Return the statistics of `user` with their last trip, counting them if needed."""
+        stats = self.select_related("last_trip").filter(user=user).first()
+        if stats is None:
+            self.recount(user)
+            stats = self.select_related("last_trip").get(user=user)
+        return stats
+
+    def update_counters(self, *users, **deltas):
+        """Add each delta to the named counter field of the statistics of each of `users`.
+
+        For example, `UserStats.objects.update_counters(user, photos=1)`.
+        """
+        self.filter(user__in=users).update(
+            **{name: F(name) + delta for name, delta in deltas.items()}
+        )
+
+    def add_trip(self, trip: Trip):
+        """Count `trip`, as stored in the database, in the statistics of its owner."""
+        self._count(trip.pk, 1)
+
+    def remove_trip(self, trip: Trip):
+        """Stop counting `trip`, as stored in the database, in the statistics of its owner.
+
+        This must be called before the trip is changed or deleted, and `add_trip` once
+        a changed trip has been saved.
+        """
+        self._count(trip.pk, -1)
+
+    def recount(self, user=None):
+        """Recalculate the statistics of `user`, or of every user, from scratch.
+
+        Returns:
+            The number of users whose statistics were missing or incorrect.
+        """
+        table, trip_table, user_table = self._tables()
+        cavers_table = connection.ops.quote_name(Trip.cavers.through._meta.db_table)
+        friends_table = connection.ops.quote_name(get_user_model().friends.through._meta.db_table)
+        photo_table = connection.ops.quote_name(TripPhoto._meta.db_table)
+        columns = ["trips", *TOTAL_COLUMNS, "longest_trip", "last_trip_id"]
+        columns += ["cavers", "friends", "photos"]
+        totals = ", ".join(
+            f"COALESCE(SUM({field}), {self._zero(column)}) AS {column}"
+            for column, field in TOTAL_COLUMNS.items()
+        )
+        where_sql, params = ("TRUE", []) if user is None else ("owner.id = %s", [user.pk])
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (user_id, {', '.join(columns)}) "
+                f"SELECT owner.id, COALESCE(totals.trips, 0), "
+                + ", ".join(
+                    f"COALESCE(totals.{column}, {self._zero(column)})" for column in TOTAL_COLUMNS
+                )
+                + ", COALESCE(totals.longest_trip, '0'::interval), last_trip.id, "
+                f"COALESCE(cavers.count, 0), COALESCE(friends.count, 0), "
+                f"COALESCE(photos.count, 0) "
+                f"FROM {user_table} owner "
+                f"LEFT JOIN ("
+                f"SELECT user_id, COUNT(*) AS trips, {totals}, MAX(duration) AS longest_trip "
+                f"FROM {trip_table} WHERE type <> %s GROUP BY user_id"
+                f") AS totals ON totals.user_id = owner.id "
+                f"LEFT JOIN ("
+                f"SELECT DISTINCT ON (user_id) user_id, id FROM {trip_table} "
+                f"ORDER BY user_id, start DESC, id DESC"
+                f") AS last_trip ON last_trip.user_id = owner.id "
+                f"LEFT JOIN ("
+                f"SELECT trip.user_id, COUNT(DISTINCT link.caver_id) AS count "
+                f"FROM {cavers_table} link INNER JOIN {trip_table} trip ON trip.id = link.trip_id "
+                f"WHERE trip.type <> %s GROUP BY trip.user_id"
+                f") AS cavers ON cavers.user_id = owner.id "
+                f"LEFT JOIN ("
+                f"SELECT from_cavinguser_id AS user_id, COUNT(*) AS count FROM {friends_table} "
+                f"GROUP BY from_cavinguser_id"
+                f") AS friends ON friends.user_id = owner.id "
+                f"LEFT JOIN ("
+                f"SELECT user_id, COUNT(*) AS count FROM {photo_table} "
+                f"WHERE is_valid AND deleted_at IS NULL AND photo_type = %s GROUP BY user_id"
+                f") AS photos ON photos.user_id = owner.id "
+                f"WHERE {where_sql} "
+                f"ON CONFLICT (user_id) DO UPDATE SET "
+                + ", ".join(f"{column} = EXCLUDED.{column}" for column in columns)
+                + f" WHERE ({', '.join(f'{table}.{column}' for column in columns)}) "
+                f"IS DISTINCT FROM ({', '.join(f'EXCLUDED.{column}' for column in columns)})",
+                [Trip.SURFACE, Trip.SURFACE, TripPhoto.PhotoTypes.DEFAULT, *params],
+            )
+            return cursor.rowcount
+
+    def _tables(self):
+        """Return the quoted names of the statistics, trip and user tables."""
+        return [
+            connection.ops.quote_name(model._meta.db_table)
+            for model in (self.model, Trip, get_user_model())
+        ]
+
+    @staticmethod
+    def _zero(column):
+        return "'0'::interval" if column == "duration" else "0"
+
+    def _count(self, trip_id, sign):
+        """Add the trip with the id `trip_id` to its owner's statistics `sign` times.
+
+        Surface trips are only counted as the last trip. The longest and last trips
+        are found again from the owner's other trips when a trip which may have been
+        either is removed. The cavers of the trip are counted by a database trigger.
+        """
+        table, trip_table, _ = self._tables()
+        updates = [f"trips = {table}.trips + %(sign)s * trip.counted"]
+        for column, field in TOTAL_COLUMNS.items():
+            updates.append(
+                f"{column} = {table}.{column} "
+                f"+ %(sign)s * trip.counted * COALESCE(trip.{field}, {self._zero(column)})"
+            )
+
+        if sign > 0:
+            longest_trip_sql = (
+                f"GREATEST({table}.longest_trip, CASE WHEN trip.counted = 1 THEN trip.duration END)"
+            )
+            last_trip_sql = (
+                f"(SELECT id FROM {trip_table} WHERE user_id = trip.user_id "
+                f"ORDER BY start DESC, id DESC LIMIT 1)"
+            )
+        else:
+            longest_trip_sql = (
+                f"CASE WHEN trip.counted = 1 AND trip.duration >= {table}.longest_trip THEN ("
+                f"SELECT COALESCE(MAX(duration), '0'::interval) FROM {trip_table} "
+                f"WHERE user_id = trip.user_id AND type <> %(surface)s AND id <> trip.id"
+                f") ELSE {table}.longest_trip END"
+            )
+            last_trip_sql = (
+                f"CASE WHEN {table}.last_trip_id = trip.id THEN ("
+                f"SELECT id FROM {trip_table} WHERE user_id = trip.user_id AND id <> trip.id "
+                f"ORDER BY start DESC, id DESC LIMIT 1"
+                f") ELSE {table}.last_trip_id END"
+            )
+        updates.append(f"longest_trip = {longest_trip_sql}")
+        updates.append(f"last_trip_id = {last_trip_sql}")
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"WITH trip AS MATERIALIZED ("
+                f"SELECT *, (type <> %(surface)s)::int AS counted FROM {trip_table} "
+                f"WHERE id = %(trip_id)s"
+                f") "
+                f"UPDATE {table} SET {', '.join(updates)} FROM trip "
+                f"WHERE {table}.user_id = trip.user_id",
+                {"trip_id": trip_id, "sign": sign, "surface": Trip.SURFACE},
+            )
+
+
+class UserStats(models.Model):
+    """The totals shown in the quick statistics of a user.
+
+    The totals are kept up to date as the user's trips, photos and friends change,
+    and may be recounted with the `recount_user_stats` command. Surface trips are
+    not counted, other than as the last trip.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stats",
+    )
+    trips = models.PositiveIntegerField(default=0)
+    duration = models.DurationField(default=timedelta)
+    vert_up = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    vert_down = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    surveyed = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    resurveyed = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    aid = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    horizontal = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    longest_trip = models.DurationField(default=timedelta)
+    last_trip = models.ForeignKey(
+        Trip,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    # Kept up to date by database triggers on the cavers of each trip
+    cavers = models.PositiveIntegerField(default=0)
+    friends = models.PositiveIntegerField(default=0)
+    photos = models.PositiveIntegerField(default=0)
+
+    objects = UserStatsManager()
+
+    class Meta:
+        verbose_name_plural = "user stats"
+
+    def __str__(self):
+        return str(self.user)
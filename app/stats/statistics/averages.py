@@ -1,8 +1,23 @@
 from attrs import frozen
 from django.contrib.gis.measure import D
-from django.db import models
+from django.db.models import Avg, Count, Min, Q
 from django.utils import timezone
 
+# The distance fields averaged unless distance statistics are disabled, with the name
+# of the row for each
+DISTANCE_FIELDS = {
+    "vert_dist_up": "Rope climbed",
+    "vert_dist_down": "Rope descended",
+    "aid_dist": "Aid climbed",
+    "horizontal_dist": "Horizontal",
+}
+
+# The distance fields averaged unless survey statistics are disabled
+SURVEY_FIELDS = {
+    "surveyed_dist": "Surveyed",
+    "resurveyed_dist": "Resurveyed",
+}
+
 
 @frozen
 class Row:
@@ -13,70 +28,40 @@ class Row:
 
 
 def averages(queryset, disable_dist_stats=False, disable_survey_stats=False):
-    rows = [
-        Row(metric="Trips per week", value=trips_per_week(queryset)),
-        Row(metric="Trip duration", value=trip_duration(queryset), is_time=True),
-    ]
+    """Average the trips in `queryset` in a single query.
 
+    The average of each distance excludes trips with a zero value, and the average
+    duration excludes trips without an end.
+    """
+    fields = {}
     if not disable_dist_stats:
-        rows += [
-            Row(
-                metric="Rope climbed",
-                value=dist(queryset, "vert_dist_up"),
-                is_dist=True,
-            ),
-            Row(
-                metric="Rope descended",
-                value=dist(queryset, "vert_dist_down"),
-                is_dist=True,
-            ),
-            Row(metric="Aid climbed", value=dist(queryset, "aid_dist"), is_dist=True),
-            Row(
-                metric="Horizontal",
-                value=dist(queryset, "horizontal_dist"),
-                is_dist=True,
-            ),
-        ]
-
+        fields.update(DISTANCE_FIELDS)
     if not disable_survey_stats:
-        rows += [
-            Row(metric="Surveyed", value=dist(queryset, "surveyed_dist"), is_dist=True),
-            Row(
-                metric="Resurveyed",
-                value=dist(queryset, "resurveyed_dist"),
-                is_dist=True,
-            ),
-        ]
+        fields.update(SURVEY_FIELDS)
+
+    totals = queryset.order_by().aggregate(
+        trips=Count("pk"),
+        first_start=Min("start"),
+        duration=Avg("duration", filter=Q(end__isnull=False)),
+        **{f"avg_{field}": Avg(field, filter=Q(**{f"{field}__gt": 0})) for field in fields},
+    )
+
+    rows = [
+        Row(metric="Trips per week", value=trips_per_week(totals["trips"], totals["first_start"])),
+        Row(metric="Trip duration", value=totals["duration"] or 0, is_time=True),
+    ]
+    for field, metric in fields.items():
+        rows.append(Row(metric=metric, value=D(m=totals[f"avg_{field}"] or 0), is_dist=True))
 
     # Clear out any rows with a zero value
     return [row for row in rows if row.value]
 
 
-def trips_per_week(queryset):
-    if not queryset.exists():  # pragma: no cover
+def trips_per_week(trips, first_start):
+    if not trips:  # pragma: no cover
         return 0
 
-    qs = queryset.order_by("start")
-    weeks = (timezone.now() - qs.first().start).days // 7
-
+    weeks = (timezone.now() - first_start).days // 7
     if weeks == 0:  # pragma: no cover
         return 0
-    return qs.count() / weeks
-
-
-def trip_duration(queryset):
-    qs = queryset.filter(end__isnull=False)
-    if qs.count() == 0:
-        return 0
-
-    return qs.aggregate(avg_duration=models.Avg("duration"))["avg_duration"]
-
-
-def dist(queryset, field):
-    """Get the average distance for a field, excluding trips with a zero value."""
-    qs = queryset.filter(**{f"{field}__gt": 0})
-    if qs.count() == 0:
-        return D(m=0)
-
-    avg_meters = qs.aggregate(avg_dist=models.Avg(field))["avg_dist"]
-    return D(m=avg_meters)
+    return trips / weeks
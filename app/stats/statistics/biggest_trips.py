@@ -4,6 +4,19 @@ from attrs import Factory, define, frozen
 from distancefield import D
 from logger.models import Trip
 
+# The fields that trips are ranked by, with the title and metric name of each table
+DURATION_FIELD = ("duration", "Longest trips", "Duration")
+SURVEY_FIELDS = (
+    ("surveyed_dist", "Surveyed", "Surveyed"),
+    ("resurveyed_dist", "Resurveyed", "Resurveyed"),
+)
+DISTANCE_FIELDS = (
+    ("vert_dist_up", "Rope climbed", "Climbed"),
+    ("vert_dist_down", "Rope descended", "Descended"),
+    ("aid_dist", "Aid climbed", "Aid climbed"),
+    ("horizontal_dist", "Horizontal distance", "Distance"),
+)
+
 
 @frozen
 class TripStatsRow:
@@ -22,76 +35,44 @@ class TripStats:
         self.rows.append(TripStatsRow(trip=trip, value=value, is_time=is_time))
 
 
-def _build_trip_stats(queryset, title, field, limit, metric=None, is_time=False):
-    if metric is None:
-        metric = title
-
-    stats = TripStats(title=title, metric=metric)
-    qs = queryset.exclude(**{field: None}).order_by("-" + field)[:limit]
-
-    for trip in qs:
-        stats.add_row(trip, getattr(trip, field), is_time)
-
-    return stats
-
-
 def biggest_trips(queryset, limit=10, disable_dist_stats=False, disable_survey_stats=False):
-    stats = [
-        _build_trip_stats(
-            queryset=queryset,
-            title="Longest trips",
-            field="duration",
-            metric="Duration",
-            limit=limit,
-            is_time=True,
-        ),
-    ]
+    """Rank the trips in `queryset` by each field, keeping the top `limit` of each.
 
+    Every field is ranked in a single query, which loads only the columns of each
+    trip shown in the tables.
+    """
+    fields = [DURATION_FIELD]
     if not disable_survey_stats:
-        stats += [
-            _build_trip_stats(
-                queryset=queryset,
-                title="Surveyed",
-                field="surveyed_dist",
-                limit=limit,
-            ),
-            _build_trip_stats(
-                queryset=queryset,
-                title="Resurveyed",
-                field="resurveyed_dist",
-                limit=limit,
-            ),
-        ]
-
+        fields += SURVEY_FIELDS
     if not disable_dist_stats:
-        stats += [
-            _build_trip_stats(
-                queryset=queryset,
-                title="Rope climbed",
-                field="vert_dist_up",
-                metric="Climbed",
-                limit=limit,
-            ),
-            _build_trip_stats(
-                queryset=queryset,
-                title="Rope descended",
-                field="vert_dist_down",
-                metric="Descended",
-                limit=limit,
-            ),
-            _build_trip_stats(
-                queryset=queryset,
-                title="Aid climbed",
-                field="aid_dist",
-                limit=limit,
-            ),
-            _build_trip_stats(
-                queryset=queryset,
-                title="Horizontal distance",
-                field="horizontal_dist",
-                metric="Distance",
-                limit=limit,
-            ),
-        ]
-
-    return [stat for stat in stats if stat.rows]
+        fields += DISTANCE_FIELDS
+    stats = {field: TripStats(title=title, metric=metric) for field, title, metric in fields}
+
+    columns = ("id", "uuid", "cave_name", "start", *stats)
+    trips_sql, trips_params = queryset.order_by().values(*columns).query.sql_with_params()
+
+    # Each trip is unpivoted into a row for each field, with durations in seconds
+    values_sql = ", ".join(
+        "(%s, EXTRACT(EPOCH FROM trips.duration))"
+        if field == "duration"
+        else f"(%s, trips.{field}::numeric)"
+        for field in stats
+    )
+    ranked = Trip.objects.raw(
+        f"SELECT id, uuid, cave_name, start, field, value FROM ("
+        f"SELECT trips.id, trips.uuid, trips.cave_name, trips.start, fields.field, fields.value, "
+        f"ROW_NUMBER() OVER (PARTITION BY fields.field ORDER BY fields.value DESC) AS rank "
+        f"FROM ({trips_sql}) AS trips "
+        f"CROSS JOIN LATERAL (VALUES {values_sql}) AS fields(field, value) "
+        f"WHERE fields.value IS NOT NULL"
+        f") AS ranked WHERE rank <= %s ORDER BY field, rank",
+        [*trips_params, *stats, limit],
+    )
+
+    for trip in ranked:
+        if trip.field == "duration":
+            stats[trip.field].add_row(trip, timedelta(seconds=float(trip.value)), is_time=True)
+        else:
+            stats[trip.field].add_row(trip, D(m=float(trip.value)))
+
+    return [stat for stat in stats.values() if stat.rows]
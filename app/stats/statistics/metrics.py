@@ -1,6 +1,6 @@
 from attrs import frozen
-from django.db.models import Count
-from django.db.models.functions import Lower, Trim
+from django.db import connection
+from logger.models import Trip
 
 
 @frozen
@@ -10,43 +10,39 @@ class Row:
 
 
 def metrics(queryset):
+    """Count the distinct places and cavers of the trips in `queryset` in a single query.
+
+    The entrances and exits used by a trip are counted, or the cave itself if the
+    trip has neither.
+    """
+    columns = ("id", "cave_name", "cave_entrance", "cave_exit", "cave_region", "cave_country")
+    trips_sql, trips_params = queryset.order_by().values(*columns).query.sql_with_params()
+    cavers_table = connection.ops.quote_name(Trip.cavers.through._meta.db_table)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT COUNT(DISTINCT LOWER(trips.cave_name)), "
+            f"COUNT(DISTINCT COALESCE(places.place, CASE "
+            f"WHEN trips.cave_entrance = '' AND trips.cave_exit = '' THEN trips.cave_name END)), "
+            f"COUNT(DISTINCT TRIM(LOWER(trips.cave_country))), "
+            f"COUNT(DISTINCT TRIM(LOWER(trips.cave_region))), "
+            f"COUNT(DISTINCT link.caver_id) "
+            f"FROM ({trips_sql}) AS trips "
+            f"CROSS JOIN LATERAL unnest(ARRAY["
+            f"NULLIF(trips.cave_entrance, ''), NULLIF(trips.cave_exit, '')"
+            f"]) AS places(place) "
+            f"LEFT JOIN {cavers_table} link ON link.trip_id = trips.id",
+            trips_params,
+        )
+        caves, entrances, countries, regions, cavers = cursor.fetchone()
+
     rows = [
-        Row(metric="Unique caves entered", value=unique_caves(queryset)),
-        Row(metric="Unique entrances/exits used", value=unique_entrance_exit(queryset)),
-        Row(metric="Unique countries", value=unique_countries(queryset)),
-        Row(metric="Unique regions", value=unique_regions(queryset)),
-        Row(metric="Cavers caved with", value=unique_cavers(queryset)),
+        Row(metric="Unique caves entered", value=caves),
+        Row(metric="Unique entrances/exits used", value=entrances),
+        Row(metric="Unique countries", value=countries),
+        Row(metric="Unique regions", value=regions),
+        Row(metric="Cavers caved with", value=cavers),
     ]
 
     # Clear out any rows with a zero value
     return [row for row in rows if row.value]
-
-
-def unique_caves(queryset):
-    return queryset.values(cave=Lower("cave_name")).distinct().count()
-
-
-def unique_entrance_exit(queryset):
-    uniques = set()
-    for trip in queryset:
-        if trip.cave_entrance or trip.cave_exit:
-            if trip.cave_entrance:
-                uniques.add(trip.cave_entrance)
-            if trip.cave_exit:
-                uniques.add(trip.cave_exit)
-        else:
-            uniques.add(trip.cave_name)
-
-    return len(uniques)
-
-
-def unique_countries(queryset):
-    return queryset.values(country=Trim(Lower("cave_country"))).distinct().count()
-
-
-def unique_regions(queryset):
-    return queryset.values(region=Trim(Lower("cave_region"))).distinct().count()
-
-
-def unique_cavers(queryset):
-    return queryset.aggregate(cavers=Count("cavers", distinct=True))["cavers"]
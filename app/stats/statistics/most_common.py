@@ -1,6 +1,8 @@
+from collections import Counter
+
 from attrs import Factory, define, frozen
 from django.db.models import Count, Sum
-from logger.models import Caver
+from logger.models import Caver, Club
 
 
 @frozen
@@ -22,27 +24,6 @@ class MostCommonStatistics:
         self.rows.append(MostCommonRow(metric=metric, value=value, url=url))
 
 
-def _sort_comma_separated_list(qs, value, limit=10):
-    """Sort a field that has a comma separated list of values from a QuerySet."""
-    values = qs.values(value)
-    common = {}
-    for v in values:
-        split_list = v[value].split(",")
-
-        for split_value in split_list:
-            trimmed = split_value.strip()
-
-            if not trimmed:
-                continue
-
-            if trimmed in common:
-                common[trimmed] += 1
-            else:
-                common[trimmed] = 1
-
-    return sorted(common.items(), key=lambda x: x[1], reverse=True)[0:limit]
-
-
 def most_common_caves(queryset, limit):
     stats = MostCommonStatistics(
         title="Most common caves",
@@ -75,21 +56,48 @@ def most_common_trip_types(queryset, limit):
     return stats
 
 
-def most_common_from_csv(*, queryset, field, title, metric_name, value_name, limit):
+def most_common_clubs(queryset, limit):
     stats = MostCommonStatistics(
-        title=title,
-        metric_name=metric_name,
-        value_name=value_name,
+        title="Most common clubs",
+        metric_name="Club",
+        value_name="Trips",
     )
 
-    results = _sort_comma_separated_list(queryset, field, limit=limit)
+    clubs = list(
+        Club.objects.filter(trips__in=queryset)
+        .annotate(num_trips=Count("trips"))
+        .order_by("-num_trips")[0:limit]
+    )
+    spellings = _most_used_spellings(queryset, clubs)
 
-    for result in results:
-        stats.add_row(result[0], result[1])
+    for club in clubs:
+        stats.add_row(spellings.get(club.name.lower(), club.name), club.num_trips)
 
     return stats
 
 
+def _most_used_spellings(queryset, clubs):
+    """Return the spelling of each of `clubs` used most often in the trips of `queryset`.
+
+    A club is shared by every user who names it, and is stored as spelt by the first
+    of them, so each user is shown the spelling from their own trips instead. A tie
+    goes to the spelling in their earliest trip.
+    """
+    spellings = {club.name.lower(): Counter() for club in clubs}
+    trips = (
+        queryset.filter(linked_club__in=[club.pk for club in clubs])
+        .distinct()
+        .order_by("pk")
+        .values_list("clubs", flat=True)
+    )
+    for value in trips:
+        for name in Club.objects.split(value):
+            if (counter := spellings.get(name.lower())) is not None:
+                counter[name] += 1
+
+    return {key: counter.most_common(1)[0][0] for key, counter in spellings.items() if counter}
+
+
 def most_common_cavers_by_trips(queryset, limit):
     stats = MostCommonStatistics(
         title="Most common cavers by trips",
@@ -99,12 +107,12 @@ def most_common_cavers_by_trips(queryset, limit):
 
     cavers = (
         Caver.objects.filter(trip__in=queryset)
-        .annotate(trip_count=Count("trip"))
-        .order_by("-trip_count")[0:limit]
+        .annotate(num_trips=Count("trip"))
+        .order_by("-num_trips")[0:limit]
     )
 
     for caver in cavers:
-        stats.add_row(caver.name, caver.trip_count, caver.get_absolute_url())
+        stats.add_row(caver.name, caver.num_trips, caver.get_absolute_url())
 
     return stats
 
@@ -139,14 +147,7 @@ def most_common(queryset, limit=10):
         most_common_cavers_by_trips(queryset=queryset, limit=limit),
         most_common_cavers_by_time(queryset, limit),
         most_common_caves(queryset, limit),
-        most_common_from_csv(
-            queryset=queryset,
-            field="clubs",
-            title="Most common clubs",
-            metric_name="Club",
-            value_name="Trips",
-            limit=limit,
-        ),
+        most_common_clubs(queryset, limit),
         most_common_trip_types(queryset, limit),
     ]
 
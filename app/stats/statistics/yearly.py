@@ -1,9 +1,21 @@
-from datetime import date, timedelta
+from datetime import timedelta
 
 from attrs import Factory, define
 from django.contrib.gis.measure import D, Distance
+from django.db import connection
 from django.utils import timezone
 
+# The columns of a trip totalled for each year, with the attribute of
+# `YearlyStatistics` that they are totalled in
+DISTANCE_COLUMNS = {
+    "vert_dist_up": "climbed",
+    "vert_dist_down": "descended",
+    "surveyed_dist": "surveyed",
+    "resurveyed_dist": "resurveyed",
+    "horizontal_dist": "horizontal",
+    "aid_dist": "aid_climbed",
+}
+
 
 @define
 class YearlyStatistics:
@@ -16,56 +28,70 @@ class YearlyStatistics:
     aid_climbed: Distance = Factory(D)
     time: timedelta = Factory(timedelta)
     trips: int = 0
-    dates: list[date] = Factory(list)
+    caving_days: int = 0
     is_total: bool = False
 
-    def add_trip(self, trip):
-        self.climbed += trip.vert_dist_up
-        self.descended += trip.vert_dist_down
-        self.surveyed += trip.surveyed_dist
-        self.resurveyed += trip.resurveyed_dist
-        self.horizontal += trip.horizontal_dist
-        self.aid_climbed += trip.aid_dist
-        self.time += trip.duration if trip.duration else timedelta()
-        self.trips += 1
-
-        # Collect a list of dates that this trip spans. The start date is always added,
-        # and then if the trip is over 24 hours, we add one additional date for each
-        # 24 hour period. datetime.timedelta.days returns 0 for timedeltas less than
-        # so the loop will not run for trips less than 24 hours.
-
-        self.dates.append(trip.start.date())
-        if trip.duration:
-            for i in range(1, trip.duration.days + 1):
-                self.dates.append((trip.start + timedelta(days=i)).date())
-
-    @property
-    def caving_days(self):
-        return len(set(self.dates))
-
 
 def yearly(queryset, /, max_years=10) -> tuple:
-    earliest_year = timezone.now().year - (max_years - 1)
-    total = YearlyStatistics(year=0, is_total=True)
-    stats = {}
+    """Total the trips in `queryset` for each of the last `max_years` years.
 
-    for trip in queryset:
-        # First, add to the total
-        total.add_trip(trip)
-
-        # Now, determine if we should add to the yearly stats
-        year = trip.start.year
-        if year < earliest_year:  # pragma: no cover
-            continue
+    Returns:
+        The statistics of each year with any trips, latest first, followed by
+        the statistics of every trip in `queryset`, or an empty tuple if no trips
+        were in the last `max_years` years.
+    """
+    earliest_year = timezone.now().year - (max_years - 1)
+    columns = ("start", "duration", *DISTANCE_COLUMNS)
+    trips_sql, trips_params = queryset.order_by().values(*columns).query.sql_with_params()
+    distances_sql = ", ".join(f"COALESCE(SUM({column}), 0)" for column in DISTANCE_COLUMNS)
 
-        if year not in stats:
-            stats[year] = YearlyStatistics(year=year)
+    # Trips are grouped by the year they start in, in UTC. A caving day is counted for
+    # the date that a trip starts on, and for each whole day that it lasts after that.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"WITH trips AS ("
+            f"SELECT trips.*, EXTRACT(YEAR FROM trips.start AT TIME ZONE 'UTC')::int AS year "
+            f"FROM ({trips_sql}) AS trips"
+            f"), totals AS ("
+            f"SELECT year, GROUPING(year) AS is_total, COUNT(*) AS trips, "
+            f"COALESCE(SUM(duration), '0'::interval) AS time, {distances_sql} "
+            f"FROM trips GROUP BY GROUPING SETS ((year), ())"
+            f"), caving_days AS ("
+            f"SELECT year, GROUPING(year) AS is_total, COUNT(DISTINCT day) AS caving_days "
+            f"FROM ("
+            f"SELECT trips.year, "
+            f"(trips.start AT TIME ZONE 'UTC' + days.i * interval '1 day')::date AS day "
+            f"FROM trips, generate_series("
+            f"0, floor(EXTRACT(EPOCH FROM COALESCE(trips.duration, '0'::interval)) / 86400)::int"
+            f") AS days(i)"
+            f") AS days GROUP BY GROUPING SETS ((year), ())"
+            f") "
+            f"SELECT totals.*, caving_days.caving_days FROM totals "
+            f"INNER JOIN caving_days ON caving_days.is_total = totals.is_total "
+            f"AND caving_days.year IS NOT DISTINCT FROM totals.year "
+            f"WHERE totals.is_total = 1 OR totals.year >= %s "
+            f"ORDER BY totals.is_total, totals.year DESC",
+            [*trips_params, earliest_year],
+        )
+        rows = cursor.fetchall()
 
-        stats[year].add_trip(trip)
+    stats = []
+    for year, is_total, trips, time, *distances, caving_days in rows:
+        stats.append(
+            YearlyStatistics(
+                year=0 if is_total else year,
+                trips=trips,
+                time=time,
+                caving_days=caving_days,
+                is_total=bool(is_total),
+                **{
+                    attribute: D(m=float(distance))
+                    for attribute, distance in zip(DISTANCE_COLUMNS.values(), distances)
+                },
+            )
+        )
 
-    if stats:
-        stats_list = list(stats.values())
-        sorted_stats = sorted(stats_list, key=lambda s: s.year, reverse=True)
-        return tuple(sorted_stats + [total])
+    if len(stats) > 1:
+        return tuple(stats)
 
     return ()
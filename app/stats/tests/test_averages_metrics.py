@@ -0,0 +1,67 @@
+from datetime import datetime as dt
+from datetime import timedelta
+
+from django.contrib.gis.measure import D
+from django.test import TestCase, tag
+from logger.factories import CaverFactory, TripFactory
+from logger.models import Trip
+from users.factories import UserFactory
+
+from ..statistics import averages, metrics
+
+
+@tag("fast", "stats")
+class AveragesAndMetricsTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory(is_active=True)
+
+    def _trip(self, cave_name, entrance="", exit="", hours=None, vert_up=None, **kwargs):
+        kwargs.setdefault("cave_region", "Region")
+        start = dt.fromisoformat("2023-01-02T10:00:00+00:00")
+        return TripFactory(
+            user=self.user,
+            type=Trip.SPORT,
+            cave_name=cave_name,
+            cave_entrance=entrance,
+            cave_exit=exit,
+            start=start,
+            end=start + timedelta(hours=hours) if hours else None,
+            vert_dist_up=vert_up,
+            no_distances=True,
+            **kwargs,
+        )
+
+    def test_averages(self):
+        """Test that averages exclude trips without an end or distance, in one query."""
+        self._trip("Cave", hours=2, vert_up="10m")
+        self._trip("Cave", hours=4, vert_up="20m")
+        self._trip("Cave")
+
+        with self.assertNumQueries(1):
+            rows = averages(self.user.trips, disable_survey_stats=True)
+
+        values = {row.metric: row.value for row in rows}
+        self.assertEqual(list(values), ["Trips per week", "Trip duration", "Rope climbed"])
+        self.assertEqual(values["Trip duration"], timedelta(hours=3))
+        self.assertEqual(values["Rope climbed"], D(m=15))
+
+    def test_metrics(self):
+        """Test that each distinct place and caver is counted, in one query."""
+        caver = CaverFactory(user=self.user)
+        self._trip("Cave", entrance="Top", exit="Bottom", cave_country="UK").cavers.add(caver)
+        self._trip("cave", entrance="Top", cave_country=" uk").cavers.add(caver)
+        self._trip("Other Cave", cave_region="region ", cave_country="FR")
+
+        with self.assertNumQueries(1):
+            rows = metrics(self.user.trips)
+
+        self.assertEqual(
+            {row.metric: row.value for row in rows},
+            {
+                "Unique caves entered": 2,
+                "Unique entrances/exits used": 3,
+                "Unique countries": 2,
+                "Unique regions": 1,
+                "Cavers caved with": 1,
+            },
+        )
@@ -0,0 +1,49 @@
+from datetime import datetime as dt
+from datetime import timedelta
+
+from distancefield import D
+from django.test import TestCase, tag
+from logger.factories import TripFactory
+from logger.models import Trip
+from users.factories import UserFactory
+
+from ..statistics import biggest_trips
+
+
+@tag("fast", "stats")
+class BiggestTripsTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory(is_active=True)
+
+    def _trip(self, hours, vert_up=None, surveyed=None):
+        start = dt.fromisoformat("2023-01-02T10:00:00+00:00")
+        return TripFactory(
+            user=self.user,
+            type=Trip.SPORT,
+            start=start,
+            end=start + timedelta(hours=hours),
+            vert_dist_up=vert_up,
+            no_distances=True,
+            surveyed_dist=surveyed,
+        )
+
+    def test_trips_are_ranked_by_each_field(self):
+        """Test that the biggest trips for every field are found in a single query."""
+        short = self._trip(1, vert_up="10m")
+        long = self._trip(5, vert_up="100ft", surveyed="20m")
+        medium = self._trip(3)
+
+        with self.assertNumQueries(1):
+            stats = biggest_trips(self.user.trips, limit=2)
+            self.assertEqual(len(stats), 7)
+            rows = {stat.title: [(row.trip, row.value) for row in stat.rows] for stat in stats}
+            self.assertEqual(rows["Longest trips"][0][0].cave_name, long.cave_name)
+
+        self.assertEqual(
+            rows["Longest trips"], [(long, timedelta(hours=5)), (medium, timedelta(hours=3))]
+        )
+        self.assertEqual(rows["Surveyed"][0], (long, D(m=20)))
+        self.assertEqual(rows["Rope climbed"], [(long, D(ft=100)), (short, D(m=10))])
+
+        stats = biggest_trips(self.user.trips, disable_dist_stats=True, disable_survey_stats=True)
+        self.assertEqual([stat.title for stat in stats], ["Longest trips"])
@@ -0,0 +1,122 @@
+from datetime import date
+from datetime import datetime as dt
+
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase, tag
+from django.urls import reverse
+from django.utils import timezone
+from logger.factories import TripFactory
+from logger.models import Trip
+
+from ..timeseries import METRICS, time_series
+
+User = get_user_model()
+
+
+@tag("fast", "stats")
+class TimeSeriesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="test@caves.app",
+            username="testuser",
+            password="password",
+            name="Test User",
+        )
+        self.user.is_active = True
+        self.user.save()
+
+        self.client = Client()
+
+    def _trip(self, start, hours, vert_up=None):
+        start = dt.fromisoformat(start)
+        return TripFactory(
+            user=self.user,
+            type=Trip.SPORT,
+            start=start,
+            end=start + timezone.timedelta(hours=hours),
+            vert_dist_up=vert_up,
+            no_distances=True,
+        )
+
+    def test_trips_are_totalled_for_every_period(self):
+        """Test that each week is totalled, including weeks without trips."""
+        self._trip("2023-01-02T10:00:00+00:00", 2, vert_up="10m")
+        self._trip("2023-01-05T10:00:00+00:00", 3)
+        self._trip("2023-01-17T10:00:00+00:00", 1, vert_up="5m")
+
+        series = time_series(self.user.trips.all(), "week", ["trips", "duration", "vert_up"])
+        self.assertEqual(series.periods, [date(2023, 1, 2), date(2023, 1, 9), date(2023, 1, 16)])
+        self.assertEqual(series.values["trips"], [2, 0, 1])
+        self.assertEqual(series.values["duration"], [5, 0, 1])
+        self.assertEqual(series.values["vert_up"], [10, 0, 5])
+
+        series = time_series(self.user.trips.all(), "week", ["duration"], cumulative=True)
+        self.assertEqual(series.values["duration"], [5, 5, 6])
+
+    def test_periods_are_in_the_current_timezone(self):
+        """Test that trips are grouped by the period they start in locally."""
+        self._trip("2023-01-31T23:30:00+00:00", 1)
+
+        with timezone.override("Europe/Paris"):
+            series = time_series(self.user.trips.all(), "month", ["trips"])
+        self.assertEqual(series.periods, [date(2023, 2, 1)])
+
+        with timezone.override("UTC"):
+            series = time_series(
+                self.user.trips.all(),
+                "month",
+                ["trips"],
+                start=dt.fromisoformat("2022-12-15T00:00:00+00:00"),
+                end=dt.fromisoformat("2023-02-15T00:00:00+00:00"),
+            )
+        self.assertEqual(series.periods, [date(2022, 12, 1), date(2023, 1, 1), date(2023, 2, 1)])
+        self.assertEqual(series.values["trips"], [0, 1, 0])
+
+    def test_time_series_is_one_query(self):
+        """Test that the series is built in one query, however long it is."""
+        self._trip("2003-01-01T10:00:00+00:00", 2)
+        self._trip("2023-01-01T10:00:00+00:00", 2)
+
+        with self.assertNumQueries(1):
+            series = time_series(self.user.trips.all(), "week", list(METRICS))
+        self.assertEqual(len(series.periods), 1044)
+
+    def test_stats_over_time_chart(self):
+        """Test that the stats over time chart accumulates the weekly totals."""
+        self._trip("2023-01-02T10:00:00+00:00", 2, vert_up="10m")
+        self._trip("2023-01-17T10:00:00+00:00", 1)
+
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse("stats:chart_stats_over_time", args=[self.user.username])
+        )
+        self.assertEqual(
+            response.json(),
+            {
+                "labels": ["2023-01-02", "2023-01-09", "2023-01-16"],
+                "duration": [2, 2, 3],
+                "vert_up": [10, 10, 10],
+            },
+        )
+
+    def test_hours_per_month_and_trip_type_charts(self):
+        """Test the charts of hours per month and of trip types."""
+        now = timezone.now()
+        self._trip(now.isoformat(), 2)
+        TripFactory(
+            user=self.user, type=Trip.DIGGING, start=now, end=now + timezone.timedelta(hours=4)
+        )
+        TripFactory(user=self.user, type=Trip.DIGGING, start=now, end=None)
+
+        self.client.force_login(self.user)
+        data = self.client.get(
+            reverse("stats:chart_hours_per_month", args=[self.user.username])
+        ).json()
+        self.assertEqual(len(data["labels"]), len(data["data"]))
+        self.assertEqual(data["data"][-1], 6)
+        self.assertEqual(sum(data["data"]), 6)
+
+        data = self.client.get(reverse("stats:chart_trip_types")).json()
+        self.assertEqual(data, {"labels": ["Digging", "Sport"], "data": [2, 1]})
+        data = self.client.get(reverse("stats:chart_trip_types_time")).json()
+        self.assertEqual(data, {"labels": ["Digging", "Sport"], "data": [4, 2]})
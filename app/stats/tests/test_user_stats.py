@@ -0,0 +1,217 @@
+from datetime import datetime as dt
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.gis.measure import D
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from logger.factories import CaverFactory, TripFactory
+from logger.models import CaveNameDictionary, Club, Expedition, Trip, TripPhoto
+from users.factories import UserFactory
+from users.models import FriendRequest
+
+from ..models import UserStats, UserWeeklyStats
+
+COLUMNS = (
+    "trips",
+    "duration",
+    "vert_up",
+    "longest_trip",
+    "last_trip",
+    "cavers",
+    "friends",
+    "photos",
+)
+
+
+@tag("fast", "stats")
+class UserStatsTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory(is_active=True)
+        self.user2 = UserFactory(is_active=True)
+        UserStats.objects.recount()
+
+    def _trip(self, start, hours, type=Trip.SPORT, vert_up=None):
+        start = dt.fromisoformat(start)
+        return TripFactory(
+            user=self.user,
+            type=type,
+            start=start,
+            end=start + timedelta(hours=hours),
+            vert_dist_up=vert_up,
+            no_distances=True,
+        )
+
+    def _stats(self, user=None):
+        user = user or self.user
+        return UserStats.objects.filter(user=user).values_list(*COLUMNS).get()
+
+    def _assert_stats_are_correct(self):
+        """Assert that the stored statistics are the same as those counted from scratch."""
+        stats = self._stats(), self._stats(self.user2)
+        self.assertEqual(UserStats.objects.recount(), 0)
+        self.assertEqual((self._stats(), self._stats(self.user2)), stats)
+
+    def test_trips_are_counted_as_they_are_saved_and_deleted(self):
+        """Test that the trip totals are kept up to date as trips change."""
+        first = self._trip("2023-01-02T10:00:00+00:00", 2, vert_up="10m")
+        longest = self._trip("2023-01-05T10:00:00+00:00", 6, vert_up="5m")
+        surface = self._trip("2023-02-01T10:00:00+00:00", 9, type=Trip.SURFACE)
+        self.assertEqual(
+            self._stats(), (2, timedelta(hours=8), 15, timedelta(hours=6), surface.pk, 0, 0, 0)
+        )
+        self._assert_stats_are_correct()
+
+        # Shorten the longest trip and make it the latest
+        longest.start = dt.fromisoformat("2023-03-01T10:00:00+00:00")
+        longest.end = longest.start + timedelta(hours=1)
+        longest.save()
+        self.assertEqual(
+            self._stats(), (2, timedelta(hours=3), 15, timedelta(hours=2), longest.pk, 0, 0, 0)
+        )
+        self._assert_stats_are_correct()
+
+        # Count the surface trip, then move a trip to another user
+        surface.type = Trip.SPORT
+        surface.save()
+        first.user = self.user2
+        first.save()
+        self.assertEqual(
+            self._stats(), (2, timedelta(hours=10), 5, timedelta(hours=9), longest.pk, 0, 0, 0)
+        )
+        self._assert_stats_are_correct()
+
+        # Saving changes to fields which are not counted does no bookkeeping
+        longest.notes = "Not counted"
+        with CaptureQueriesContext(connection) as queries:
+            longest.save()
+        tables = [
+            model._meta.db_table
+            for model in (UserStats, UserWeeklyStats, CaveNameDictionary, Club, Expedition)
+        ]
+        self.assertFalse(
+            [query for query in queries if any(table in query["sql"] for table in tables)]
+        )
+
+        longest.delete()
+        surface.delete()
+        self.assertEqual(self._stats(), (0, timedelta(), 0, timedelta(), None, 0, 0, 0))
+        self._assert_stats_are_correct()
+
+    def test_cavers_are_counted_as_they_are_added_and_removed(self):
+        """Test that each caver is counted once while they are on a trip."""
+        caver, other_caver = CaverFactory.create_batch(2, user=self.user)
+        first = self._trip("2023-01-02T10:00:00+00:00", 2)
+        second = self._trip("2023-01-03T10:00:00+00:00", 2)
+        first.cavers.add(caver, other_caver)
+        second.cavers.add(caver)
+        self.assertEqual(self._stats()[5], 2)
+        self._assert_stats_are_correct()
+
+        first.cavers.remove(other_caver)
+        self.assertEqual(self._stats()[5], 1)
+
+        # Cavers only on surface trips are not counted
+        second.type = Trip.SURFACE
+        second.save()
+        self.assertEqual(self._stats()[5], 1)
+        first.type = Trip.SURFACE
+        first.save()
+        self.assertEqual(self._stats()[5], 0)
+        first.type = Trip.SPORT
+        first.save()
+        self.assertEqual(self._stats()[5], 1)
+        self._assert_stats_are_correct()
+
+        first.delete()
+        self.assertEqual(self._stats()[5], 0)
+        self._assert_stats_are_correct()
+
+    def test_friends_and_photos_are_counted(self):
+        """Test that friends and valid photos are counted as they are added and removed."""
+        friend_request = FriendRequest.objects.create(user_from=self.user, user_to=self.user2)
+        self.client.force_login(self.user2)
+        self.client.post(reverse("users:friend_request_accept", args=[friend_request.pk]))
+        self.assertEqual(self._stats()[6], 1)
+        self.assertEqual(self._stats(self.user2)[6], 1)
+        self._assert_stats_are_correct()
+
+        # Accepting a request between users who are already friends counts nothing
+        friend_request = FriendRequest.objects.create(user_from=self.user, user_to=self.user2)
+        self.client.post(reverse("users:friend_request_accept", args=[friend_request.pk]))
+        self.assertFalse(FriendRequest.objects.exists())
+        self.assertEqual(self._stats()[6], 1)
+        self.assertEqual(self._stats(self.user2)[6], 1)
+
+        self.client.post(reverse("users:friend_remove", args=[self.user.username]))
+        self.assertEqual(self._stats()[6], 0)
+        self.assertEqual(self._stats(self.user2)[6], 0)
+
+        trip = self._trip("2023-01-02T10:00:00+00:00", 2)
+        photos = [
+            TripPhoto.objects.create(trip=trip, user=self.user, photo=None, is_valid=True)
+            for _ in range(3)
+        ]
+        UserStats.objects.update_counters(self.user, photos=len(photos))
+        self._assert_stats_are_correct()
+
+        self.client.force_login(self.user)
+        self.client.post(reverse("log:trip_photos_delete"), {"photoUUID": photos[0].uuid})
+        self.assertEqual(self._stats()[7], 2)
+        self.client.post(reverse("log:trip_delete", args=[trip.uuid]))
+        self.assertEqual(self._stats()[7], 0)
+        self._assert_stats_are_correct()
+
+    def test_friends_of_pruned_users_are_recounted(self):
+        """Test that pruning an unverified user removes them from their friends' counts."""
+        self.user.friends.add(self.user2)
+        self.user2.friends.add(self.user)
+        UserStats.objects.recount()
+        self.assertEqual(self._stats()[6], 1)
+        get_user_model().objects.filter(pk=self.user2.pk).update(
+            is_active=False,
+            has_verified_email=False,
+            date_joined=dt.fromisoformat("2020-01-01T00:00:00+00:00"),
+        )
+
+        call_command("prune_inactive_users", stdout=StringIO())
+        self.assertEqual(self._stats()[6], 0)
+        self.assertEqual(UserStats.objects.recount(), 0)
+
+    def test_quick_stats_are_read_in_a_single_query(self):
+        """Test that the quick stats are read from the user's statistics."""
+        self._trip("2023-01-02T10:00:00+00:00", 2, vert_up="10m")
+        self._trip("2023-02-02T10:00:00+00:00", 3, vert_up="15m")
+        last_trip = self._trip("2023-02-03T10:00:00+00:00", 4, type=Trip.SURFACE, vert_up="5m")
+        user = get_user_model().objects.get(pk=self.user.pk)
+
+        with self.assertNumQueries(1):
+            quick_stats = user.quick_stats
+            self.assertEqual(quick_stats["qs_last_trip"].start, last_trip.start)
+
+        self.assertEqual(quick_stats["qs_trips"], 2)
+        self.assertEqual(quick_stats["qs_duration"], timedelta(hours=5))
+        self.assertEqual(quick_stats["qs_longest_trip"], timedelta(hours=3))
+        self.assertEqual(quick_stats["qs_climbed"], D(m=25))
+        self.assertEqual(quick_stats["qs_surveyed"], D(m=0))
+
+    def test_statistics_are_recounted(self):
+        """Test that missing or incorrect statistics are recounted."""
+        self._trip("2023-01-02T10:00:00+00:00", 2)
+        UserStats.objects.filter(user=self.user).update(trips=5, friends=2)
+        UserStats.objects.filter(user=self.user2).delete()
+
+        output = StringIO()
+        call_command("recount_user_stats", stdout=output)
+        self.assertIn("Repaired the statistics of 2 users.", output.getvalue())
+        self.assertEqual(self._stats()[0], 1)
+        self.assertEqual(self._stats()[6], 0)
+        self.assertEqual(self._stats(self.user2)[0], 0)
+
+        # A user without any statistics is counted when they are first read
+        UserStats.objects.filter(user=self.user).delete()
+        self.assertEqual(UserStats.objects.for_user(self.user).trips, 1)
@@ -0,0 +1,126 @@
+from datetime import date, timedelta
+from datetime import datetime as dt
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, tag
+from django.utils import timezone
+from logger.factories import TripFactory
+from logger.models import Trip
+from users.factories import UserFactory
+
+from ..models import UserWeeklyStats
+from ..timeseries import time_series, user_time_series, weekly_stats_series
+
+COLUMNS = (
+    "week_start",
+    "type",
+    "trips",
+    "duration",
+    "vert_up",
+    "vert_down",
+    "surveyed",
+    "resurveyed",
+    "aid",
+    "horizontal",
+    "caving_days",
+)
+
+
+@tag("fast", "stats")
+class UserWeeklyStatsTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory(is_active=True, timezone="UTC")
+
+    def _trip(self, start, hours, type=Trip.SPORT, vert_up=None):
+        start = dt.fromisoformat(start)
+        return TripFactory(
+            user=self.user,
+            type=type,
+            start=start,
+            end=start + timedelta(hours=hours),
+            vert_dist_up=vert_up,
+            no_distances=True,
+        )
+
+    def _rows(self):
+        return {
+            (row[0], row[1]): row[2:]
+            for row in self.user.weekly_stats.values_list(*COLUMNS).order_by("week_start")
+        }
+
+    def test_weeks_are_counted_as_trips_are_saved_and_deleted(self):
+        """Test that each week is totalled as trips are added, changed and deleted."""
+        monday = self._trip("2023-01-02T10:00:00+00:00", 2, vert_up="10m")
+        thursday = self._trip("2023-01-05T10:00:00+00:00", 3)
+        week = date(2023, 1, 2)
+        self.assertEqual(self._rows()[week, Trip.SPORT][:3], (2, timedelta(hours=5), 10))
+        self.assertEqual(self._rows()[week, Trip.SPORT][-1], 0b1001)
+
+        thursday.type = Trip.DIGGING
+        thursday.save()
+        monday.vert_dist_up = "25m"
+        monday.save()
+        rows = self._rows()
+        self.assertEqual(rows[week, Trip.SPORT][:3], (1, timedelta(hours=2), 25))
+        self.assertEqual(rows[week, Trip.SPORT][-1], 0b0001)
+        self.assertEqual(rows[week, Trip.DIGGING][-1], 0b1000)
+
+        monday.delete()
+        self.assertEqual(list(self._rows()), [(week, Trip.DIGGING)])
+
+    def test_weeks_are_split_by_month(self):
+        """Test that a week spanning two months is stored as one row for each."""
+        self._trip("2023-01-30T10:00:00+00:00", 1)
+        self._trip("2023-02-02T10:00:00+00:00", 2)
+        self.assertEqual(
+            list(self._rows()), [(date(2023, 1, 30), Trip.SPORT), (date(2023, 2, 1), Trip.SPORT)]
+        )
+
+        series = weekly_stats_series(self.user.weekly_stats.all(), "week", ["trips", "duration"])
+        self.assertEqual(series.periods, [date(2023, 1, 30)])
+        self.assertEqual(series.values, {"trips": [2], "duration": [3]})
+
+        series = weekly_stats_series(self.user.weekly_stats.all(), "month", ["duration"])
+        self.assertEqual(series.values, {"duration": [1, 2]})
+
+    def test_rollup_series_matches_the_trip_series(self):
+        """Test that the series of weekly stats agrees with the series of trips."""
+        self._trip("2022-12-31T23:30:00+00:00", 2, vert_up="5m")
+        self._trip("2023-01-17T10:00:00+00:00", 1, type=Trip.DIGGING, vert_up="10m")
+        self._trip("2023-03-01T10:00:00+00:00", 4)
+
+        metrics = ["trips", "duration", "vert_up"]
+        for period in ("week", "month", "year"):
+            with timezone.override("UTC"):
+                self.assertEqual(
+                    weekly_stats_series(self.user.weekly_stats.all(), period, metrics),
+                    time_series(self.user.trips.all(), period, metrics),
+                )
+
+    def test_user_series_is_in_the_viewers_timezone(self):
+        """Test that a user's series is grouped in the current timezone, not their own."""
+        self._trip("2023-01-31T23:30:00+00:00", 1)
+        self._trip("2023-03-01T10:00:00+00:00", 1, type=Trip.SURFACE)
+
+        for tz, month in (("UTC", date(2023, 1, 1)), ("Europe/Paris", date(2023, 2, 1))):
+            with timezone.override(tz):
+                series = user_time_series(
+                    self.user, "month", ["trips"], exclude_types=[Trip.SURFACE]
+                )
+            self.assertEqual(series.periods, [month])
+            self.assertEqual(series.values, {"trips": [1]})
+
+    def test_rebuild_matches_the_incremental_totals(self):
+        """Test that rebuilding the weekly stats gives the same rows as trip saves."""
+        self._trip("2023-01-02T10:00:00+00:00", 2, vert_up="10m")
+        trip = self._trip("2023-01-03T10:00:00+00:00", 3)
+        self._trip("2023-04-03T10:00:00+00:00", 1, type=Trip.SURFACE)
+        trip.start = dt.fromisoformat("2023-02-03T10:00:00+00:00")
+        trip.end = trip.start + timedelta(hours=1)
+        trip.save()
+        rows = self._rows()
+
+        call_command("rebuild_weekly_stats", stdout=StringIO())
+        self.assertEqual(self._rows(), rows)
+        self.assertEqual(UserWeeklyStats.objects.rebuild(self.user), 3)
@@ -0,0 +1,59 @@
+from datetime import datetime as dt
+from datetime import timedelta
+
+from django.contrib.gis.measure import D
+from django.test import TestCase, tag
+from django.utils import timezone
+from logger.factories import TripFactory
+from logger.models import Trip
+from users.factories import UserFactory
+
+from ..statistics import yearly
+
+
+@tag("fast", "stats")
+class YearlyStatisticsTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory(is_active=True)
+        self.year = timezone.now().year
+
+    def _trip(self, start, hours, vert_up=None):
+        start = dt.fromisoformat(start)
+        return TripFactory(
+            user=self.user,
+            type=Trip.SPORT,
+            start=start,
+            end=start + timedelta(hours=hours),
+            vert_dist_up=vert_up,
+            no_distances=True,
+        )
+
+    def test_trips_are_totalled_by_year(self):
+        """Test that trips are totalled for each recent year and in the total."""
+        last_year = self.year - 1
+        self._trip(f"{last_year}-12-31T22:00:00+00:00", 50, vert_up="10m")
+        self._trip(f"{self.year}-01-01T10:00:00+00:00", 2, vert_up="5m")
+        self._trip(f"{self.year - 15}-06-01T10:00:00+00:00", 3)
+
+        with self.assertNumQueries(1):
+            stats = yearly(self.user.trips)
+
+        self.assertEqual([s.year for s in stats], [self.year, last_year, 0])
+        self.assertEqual([s.is_total for s in stats], [False, False, True])
+        self.assertEqual([s.trips for s in stats], [1, 1, 3])
+        self.assertEqual(
+            [s.time for s in stats],
+            [timedelta(hours=2), timedelta(hours=50), timedelta(hours=55)],
+        )
+        self.assertEqual([s.climbed for s in stats], [D(m=5), D(m=10), D(m=15)])
+        self.assertEqual([s.surveyed for s in stats], [D(m=0), D(m=0), D(m=0)])
+
+        # The trip over new year spans three days, one of which is shared with the
+        # trip on new year's day
+        self.assertEqual([s.caving_days for s in stats], [1, 3, 4])
+
+    def test_no_recent_trips(self):
+        """Test that no statistics are given without any trips in recent years."""
+        self.assertEqual(yearly(self.user.trips), ())
+        self._trip(f"{self.year - 15}-06-01T10:00:00+00:00", 3)
+        self.assertEqual(yearly(self.user.trips), ())
@@ -0,0 +1,186 @@
+"""Total the statistics of trips over evenly spaced periods of time in a single query."""
+
+from datetime import date
+
+from attrs import frozen
+from django.db import connection
+from django.utils import timezone
+
+from .models import TOTAL_COLUMNS
+
+# The periods that trips may be grouped into, as understood by `date_trunc`
+PERIODS = ("day", "week", "month", "year")
+
+# The SQL aggregate of each metric over the trips in a period. Durations are totalled
+# in hours, and distances in metres.
+METRICS = {
+    "trips": "COUNT(*)",
+    "duration": "SUM(EXTRACT(EPOCH FROM trips.duration)) / 3600",
+    "vert_up": "SUM(trips.vert_dist_up)",
+    "vert_down": "SUM(trips.vert_dist_down)",
+    "surveyed": "SUM(trips.surveyed_dist)",
+    "resurveyed": "SUM(trips.resurveyed_dist)",
+    "aid": "SUM(trips.aid_dist)",
+    "horizontal": "SUM(trips.horizontal_dist)",
+}
+
+# The same aggregates over the rows of `UserWeeklyStats`
+WEEKLY_STATS_METRICS = {
+    "trips": "SUM(stats.trips)",
+    "duration": "SUM(EXTRACT(EPOCH FROM stats.duration)) / 3600",
+    "vert_up": "SUM(stats.vert_up)",
+    "vert_down": "SUM(stats.vert_down)",
+    "surveyed": "SUM(stats.surveyed)",
+    "resurveyed": "SUM(stats.resurveyed)",
+    "aid": "SUM(stats.aid)",
+    "horizontal": "SUM(stats.horizontal)",
+}
+
+# The periods that the rows of `UserWeeklyStats` may be grouped into
+WEEKLY_STATS_PERIODS = ("week", "month", "year")
+
+# The columns of a trip read by `METRICS`
+METRIC_COLUMNS = (
+    "start",
+    "duration",
+    "vert_dist_up",
+    "vert_dist_down",
+    "surveyed_dist",
+    "resurveyed_dist",
+    "aid_dist",
+    "horizontal_dist",
+)
+
+
+@frozen
+class TimeSeries:
+    """The totals of some metrics for each period in a series.
+
+    `values` maps the name of each metric to a list with one total for each of the
+    `periods`, which are given by the date that they start on.
+    """
+
+    periods: list[date]
+    values: dict[str, list[float]]
+
+
+def time_series(queryset, period, metrics, *, start=None, end=None, cumulative=False) -> TimeSeries:
+    """Total `metrics` over the trips in `queryset` starting in each `period`.
+
+    Trips are grouped by the period that they start in, in the current timezone.
+    The series runs from the period containing `start` to the period containing
+    `end`, which default to those of the first and last trips. Periods without any
+    trips are included with totals of zero.
+
+    If `cumulative` is set, the total for each period also includes the totals of
+    every earlier period in the series.
+
+    The cost of the query depends on the number of trips and periods, but there is
+    no work done for each combination of the two.
+    """
+    if period not in PERIODS:
+        raise ValueError(f"Unknown period: {period}")
+
+    trips_sql, trips_params = queryset.order_by().values(*METRIC_COLUMNS).query.sql_with_params()
+    tz = timezone.get_current_timezone_name()
+    return _series(
+        "date_trunc(%s, trips.start AT TIME ZONE %s)",
+        f"({trips_sql}) AS trips",
+        [period, tz, *trips_params],
+        [METRICS[metric] for metric in metrics],
+        metrics,
+        period,
+        start,
+        end,
+        cumulative,
+    )
+
+
+def weekly_stats_series(
+    queryset, period, metrics, *, start=None, end=None, cumulative=False
+) -> TimeSeries:
+    """Total `metrics` over the `UserWeeklyStats` rows in `queryset` for each `period`.
+
+    This is the same as `time_series` over the trips counted in the rows, except
+    that trips are grouped by the period that they start in, in their owner's
+    timezone, and periods may not be shorter than a week.
+    """
+    if period not in WEEKLY_STATS_PERIODS:
+        raise ValueError(f"Unknown period: {period}")
+
+    columns = ("week_start", "trips", *TOTAL_COLUMNS)
+    rows_sql, rows_params = queryset.order_by().values(*columns).query.sql_with_params()
+    return _series(
+        "date_trunc(%s, stats.week_start::timestamp)",
+        f"({rows_sql}) AS stats",
+        [period, *rows_params],
+        [WEEKLY_STATS_METRICS[metric] for metric in metrics],
+        metrics,
+        period,
+        start,
+        end,
+        cumulative,
+    )
+
+
+def user_time_series(
+    user, period, metrics, *, exclude_types=(), start=None, end=None, cumulative=False
+) -> TimeSeries:
+    """Total `metrics` over the trips of `user` starting in each `period`.
+
+    Trips are grouped by the period that they start in, in the current timezone,
+    which is that of the user viewing the series. The weekly statistics of `user`
+    are totalled when they give the same series, which is when they were counted in
+    the current timezone and `period` is no shorter than a week, and otherwise the
+    trips themselves. Trips of the types in `exclude_types` are not totalled.
+    """
+    kwargs = {"start": start, "end": end, "cumulative": cumulative}
+    if period in WEEKLY_STATS_PERIODS and timezone.get_current_timezone_name() == str(
+        user.timezone
+    ):
+        rows = user.weekly_stats.exclude(type__in=exclude_types)
+        return weekly_stats_series(rows, period, metrics, **kwargs)
+
+    trips = user.trips.exclude(type__in=exclude_types)
+    return time_series(trips, period, metrics, **kwargs)
+
+
+def _series(period_sql, from_sql, params, aggregates, metrics, period, start, end, cumulative):
+    """Run the query for a series of the `aggregates` of each of `metrics`.
+
+    The rows in `from_sql` are totalled by the period given by `period_sql`, and
+    `params` are those of both, in order.
+    """
+    tz = timezone.get_current_timezone_name()
+    totals_sql = ", ".join(f"{aggregate} AS metric_{i}" for i, aggregate in enumerate(aggregates))
+    if cumulative:
+        values_sql = ", ".join(
+            f"SUM(COALESCE(totals.metric_{i}, 0)) OVER (ORDER BY periods.period)"
+            for i in range(len(aggregates))
+        )
+    else:
+        values_sql = ", ".join(f"COALESCE(totals.metric_{i}, 0)" for i in range(len(aggregates)))
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"WITH totals AS ("
+            f"SELECT {period_sql} AS period, {totals_sql} FROM {from_sql} GROUP BY 1"
+            f"), periods AS ("
+            f"SELECT generate_series("
+            f"COALESCE(date_trunc(%s, %s::timestamptz AT TIME ZONE %s), "
+            f"(SELECT MIN(period) FROM totals)), "
+            f"COALESCE(date_trunc(%s, %s::timestamptz AT TIME ZONE %s), "
+            f"(SELECT MAX(period) FROM totals)), "
+            f"%s::interval) AS period"
+            f") "
+            f"SELECT periods.period, {values_sql} "
+            f"FROM periods LEFT JOIN totals ON totals.period = periods.period "
+            f"ORDER BY periods.period",
+            [*params, period, start, tz, period, end, tz, f"1 {period}"],
+        )
+        rows = cursor.fetchall()
+
+    return TimeSeries(
+        periods=[row[0].date() for row in rows],
+        values={metric: [float(row[i + 1]) for row in rows] for i, metric in enumerate(metrics)},
+    )
@@ -4,6 +4,7 @@ from core.utils import get_user
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.gis.measure import D
+from django.db.models import Count, Sum
 from django.http import JsonResponse
 from django.utils import timezone
 from django.utils.decorators import method_decorator
@@ -11,7 +12,7 @@ from django.views.generic import TemplateView
 from django_ratelimit.decorators import ratelimit
 from logger.models import Trip
 
-from . import statistics
+from . import statistics, timeseries
 from .services import match_and_check_username, use_units
 
 
@@ -59,79 +60,31 @@ class Index(LoginRequiredMixin, TemplateView):
 def chart_stats_over_time(request, username):
     """JSON data for a chart showing stats over time.
 
-    We will iterate through every week between the user's first and last trip, add
-    up the stats for that week, and then add them to separate lists. These lists will
-    be used by chart.js to generate the chart.
+    The stats of the user's trips are totalled for each week between their first and
+    last trip, and accumulated from week to week. These lists will be used by chart.js
+    to generate the chart.
     """
     user = match_and_check_username(request, username)
-    qs = Trip.objects.filter(user=user).exclude(type=Trip.SURFACE).order_by("start")
-
-    # These lists will contain one value for each week. The labels list will contain
-    # the date for each week, and the other lists will contain the accumulated stats
-    # for that week.
-    labels, duration, vert_down, vert_up, surveyed, resurveyed = [], [], [], [], [], []
-
-    # These variables will contain the accumulated stats for the current week, to be
-    # added to the lists above.
-    accum_duration, accum_vert_up, accum_vert_down, accum_surveyed = 0, D(), D(), D()
-    accum_resurveyed = D()
-
-    first_trip = qs.first().start
-    last_trip = qs.last().start
-    cur_date = first_trip
-
-    while cur_date <= last_trip:
-        # Variables to hold the totals for the current week
-        week_duration, week_vert_up, week_vert_down = (
-            0,
-            D(),
-            D(),
-        )
-        week_surveyed, week_resurveyed = D(), D()
-
-        # Iterate through the trips and select the ones that fall within the current
-        # week, and then add their stats to the totals for the week.
-        for trip in qs:
-            if cur_date <= trip.start < cur_date + td(days=7):
-                if trip.duration:  # Ensure trip.duration != None
-                    week_duration += trip.duration.total_seconds() / 60 / 60
-
-                week_vert_up += trip.vert_dist_up
-                week_vert_down += trip.vert_dist_down
-                week_surveyed += trip.surveyed_dist
-                week_resurveyed += trip.resurveyed_dist
-
-        # Update the accumulators
-        accum_duration += week_duration
-        accum_vert_up += week_vert_up
-        accum_vert_down += week_vert_down
-        accum_surveyed += week_surveyed
-        accum_resurveyed += week_resurveyed
-
-        # Append the new data to the lists to be processed by chart.js
-        labels.append(cur_date.strftime("%Y-%m-%d"))
-        duration.append(accum_duration)
-        vert_up.append(use_units(accum_vert_up, get_user(request).units))
-        vert_down.append(use_units(accum_vert_down, get_user(request).units))
-        surveyed.append(use_units(accum_surveyed, get_user(request).units))
-        resurveyed.append(use_units(accum_resurveyed, get_user(request).units))
-
-        # Finally, increment the current date by one week
-        cur_date += td(days=7)
+    units = get_user(request).units
+
+    series = timeseries.user_time_series(
+        user,
+        "week",
+        ["duration", "vert_up", "vert_down", "surveyed", "resurveyed"],
+        exclude_types=[Trip.SURFACE],
+        cumulative=True,
+    )
 
     data = {
-        "labels": labels,
+        "labels": [week.strftime("%Y-%m-%d") for week in series.periods],
     }
 
     # Check for blank datasets and don't add them to the response
-    for x in ["duration", "vert_up", "vert_down", "surveyed", "resurveyed"]:
-        add = False
-        for y in locals()[x]:
-            if y != 0:
-                add = True
-                break
-        if add:
-            data[x] = locals()[x]
+    for metric, values in series.values.items():
+        if metric != "duration":
+            values = [use_units(D(m=value), units) for value in values]
+        if any(values):
+            data[metric] = values
 
     return JsonResponse(data=data)
 
@@ -141,50 +94,34 @@ def chart_stats_over_time(request, username):
 def chart_hours_per_month(request, username):
     """JSON data for a chart showing hours per month."""
     user = match_and_check_username(request, username)
-    qs = Trip.objects.filter(user=user).exclude(type=Trip.SURFACE).order_by("start")
-
-    # Each of labels and data will contain one value for each month
-    labels = []
-    data = []
 
     # Start at the beginning of the month two years ago
-    today = timezone.now()
+    today = timezone.localtime()
     start_date = (today - td(days=(365 * 2))).replace(day=1)
 
-    # Iterate through the months, adding the total hours for each month to the data
-    cur_date = start_date
-    while cur_date <= today:
-        start_of_next_month = (cur_date + td(days=32)).replace(day=1)
-
-        month_hours = 0
-        for trip in qs:
-            if cur_date <= trip.start < start_of_next_month and trip.duration:
-                month_hours += trip.duration.total_seconds() / 3600
+    series = timeseries.user_time_series(
+        user, "month", ["duration"], exclude_types=[Trip.SURFACE], start=start_date, end=today
+    )
+    labels = [month.strftime("%b %y") for month in series.periods]
 
-        labels.append(cur_date.strftime("%b %y"))
-        data.append(month_hours)
-
-        cur_date = start_of_next_month
-
-    return JsonResponse(data={"labels": labels, "data": data})
+    return JsonResponse(data={"labels": labels, "data": series.values["duration"]})
 
 
 @login_required
 @ratelimit(key="user", rate="60/h")
 def chart_trip_types(request):  # TODO: Refactor and add to template
     """JSON data for a chart showing trip types."""
-    qs = Trip.objects.filter(user=request.user).exclude(type=Trip.SURFACE).order_by("start")
-    result = {}
-    for trip in qs:
-        if trip.type not in result:
-            result[trip.type] = 1
-        else:
-            result[trip.type] += 1
-    result = dict(sorted(result.items(), key=lambda item: item[1], reverse=True))
+    qs = (
+        Trip.objects.filter(user=request.user)
+        .exclude(type=Trip.SURFACE)
+        .values("type")
+        .annotate(trips=Count("pk"))
+        .order_by("-trips")
+    )
     labels, data = [], []
-    for k, v in result.items():
-        labels.append(k)
-        data.append(v)
+    for result in qs:
+        labels.append(result["type"])
+        data.append(result["trips"])
 
     return JsonResponse(data={"labels": labels, "data": data})
 
@@ -193,20 +130,16 @@ def chart_trip_types(request):  # TODO: Refactor and add to template
 @ratelimit(key="user", rate="60/h")
 def chart_trip_types_time(request):  # TODO: Refactor and add to template
     """JSON data for a chart showing trip types by time."""
-    qs = Trip.objects.filter(user=request.user).exclude(type=Trip.SURFACE).order_by("start")
-    result = {}
-    for trip in qs:
-        if trip.end:
-            if trip.type not in result:
-                result[trip.type] = trip.duration
-            else:
-                result[trip.type] += trip.duration
-
-    result = dict(sorted(result.items(), key=lambda item: item[1], reverse=True))
+    qs = (
+        Trip.objects.filter(user=request.user, end__isnull=False)
+        .exclude(type=Trip.SURFACE)
+        .values("type")
+        .annotate(duration=Sum("duration"))
+        .order_by("-duration")
+    )
     labels, data = [], []
-    for k, v in result.items():
-        result[k] = v.total_seconds() / 60 / 60
-        labels.append(k)
-        data.append(result[k])
+    for result in qs:
+        labels.append(result["type"])
+        data.append(result["duration"].total_seconds() / 60 / 60)
 
     return JsonResponse(data={"labels": labels, "data": data})
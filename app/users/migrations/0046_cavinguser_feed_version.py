@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-17 04:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0045_remove_cavinguser_show_cavers_on_trip_list"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cavinguser",
+            name="feed_version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
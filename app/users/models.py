@@ -2,9 +2,9 @@ from __future__ import annotations
 
 import os
 import uuid
-from datetime import timedelta
-from functools import lru_cache
 
+from core.counters import BufferedCounter
+from core.mixins import FullSaveExcludedFieldsMixin
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import (
     AbstractBaseUser,
@@ -15,7 +15,7 @@ from django.contrib.gis.measure import D
 from django.core.exceptions import ValidationError
 from django.core.validators import MinLengthValidator, RegexValidator
 from django.db import models
-from django.db.models import Count, Max, QuerySet, Sum
+from django.db.models import Count, Q, QuerySet, Sum
 from django.http import HttpRequest
 from django.urls import reverse
 from django.utils import timezone as django_tz
@@ -80,7 +80,7 @@ class CavingUserManager(BaseUserManager):
         return user
 
 
-class CavingUser(AbstractBaseUser, PermissionsMixin):
+class CavingUser(FullSaveExcludedFieldsMixin, AbstractBaseUser, PermissionsMixin):
     """Custom user model containing social profile information and site settings."""
 
     #
@@ -92,6 +92,9 @@ class CavingUser(AbstractBaseUser, PermissionsMixin):
     EMAIL_FIELD = "email"
     REQUIRED_FIELDS = ["username", "name"]
 
+    # Going back to an older feed version would serve stale cached pages of the feed
+    FULL_SAVE_EXCLUDED_FIELDS = ("profile_view_count", "feed_version")
+
     uuid = models.UUIDField(
         verbose_name="UUID",
         default=uuid.uuid4,
@@ -192,6 +195,7 @@ class CavingUser(AbstractBaseUser, PermissionsMixin):
 
     # Profile views
     profile_view_count = models.IntegerField(default=0)
+    profile_view_counter = BufferedCounter("users.CavingUser", "profile_view_count")
 
     #
     #  Settings
@@ -325,6 +329,9 @@ class CavingUser(AbstractBaseUser, PermissionsMixin):
         max_length=15,
         choices=FEED_ORDERING_CHOICES,
     )
+    # Incremented whenever anything shown in the user's feed changes, so
+    # that cached pages of the feed are no longer used.
+    feed_version = models.PositiveIntegerField(default=0, editable=False)
 
     # All other settings
     timezone = TimeZoneField(
@@ -367,7 +374,11 @@ class CavingUser(AbstractBaseUser, PermissionsMixin):
         # Ensure a user cannot add themselves as a friend
         # self._state.adding is True when the object is being created
         if self._state.adding is False and self in self.friends.all():
+            from stats.models import UserStats
+
             self.friends.remove(self)
+            UserStats.objects.update_counters(self, friends=-1)
+
         return super().save(*args, **kwargs)
 
     def notify(self, message, url):
@@ -411,29 +422,21 @@ class CavingUser(AbstractBaseUser, PermissionsMixin):
         if for_user is None:
             return TripPhoto.objects.valid().filter(user=self)
 
-        qs = (
+        # Remove photos from trips which are not viewable by the user
+        return (
             TripPhoto.objects.valid()
-            .filter(user=self)
+            .filter(user=self, trip__in=Trip.objects.visible_to(for_user))
+            .filter(Q(trip__private_photos=False) | Q(trip__user=for_user))
             .select_related("trip", "trip__user", "user")
             .order_by("-trip__added", "-taken")
         )
 
-        # Remove photos from trips which are not viewable by the user
-        friends = self.friends.all()
-        for photo in qs:
-            if not photo.trip.is_viewable_by(for_user, friends):
-                qs = qs.exclude(pk=photo.pk)
-            if photo.trip.private_photos and photo.trip.user != for_user:
-                qs = qs.exclude(pk=photo.pk)
-
-        return qs
-
     def add_profile_view(self, request: HttpRequest):
         if request.user == self or request.user.is_anonymous:
             return
 
         self.profile_view_count += 1
-        self.save(update_fields=["profile_view_count"])
+        self.profile_view_counter.increment(self.pk)
 
     @property
     def trips(self):
@@ -467,62 +470,81 @@ class CavingUser(AbstractBaseUser, PermissionsMixin):
     def total_trip_duration(self):
         return self.trips.exclude(type=Trip.SURFACE).aggregate(Sum("duration"))["duration__sum"]
 
-    @lru_cache
-    def _sum_distance_field(self, qs: QuerySet, field_name: str) -> D:
-        """Return the total distance for the given field."""
+    # The distance fields of a trip totalled by `distance_totals`
+    DISTANCE_TOTAL_FIELDS = (
+        "vert_dist_up",
+        "vert_dist_down",
+        "surveyed_dist",
+        "resurveyed_dist",
+        "aid_dist",
+        "horizontal_dist",
+    )
+
+    def distance_totals(self, qs: QuerySet | None = None) -> dict[str, D]:
+        """Return the total of each distance field of a trip over the trips in `qs`.
+
+        `qs` defaults to the user's trips for statistics, whose totals are cached on
+        the user until it is discarded at the end of the request, or a trip of the
+        user is saved or deleted through it.
+        """
         if qs is None:
-            qs = self.trips_for_stats
+            return self._stats_distance_totals
+        return self._sum_distance_fields(qs)
+
+    def invalidate_distance_totals(self):
+        """Forget the cached totals of the user's trips for statistics."""
+        self.__dict__.pop("_stats_distance_totals", None)
 
-        total = D(m=0)
-        for trip in qs:
-            total += getattr(trip, field_name)
-        return total
+    @cached_property
+    def _stats_distance_totals(self) -> dict[str, D]:
+        return self._sum_distance_fields(self.trips_for_stats)
+
+    def _sum_distance_fields(self, qs: QuerySet) -> dict[str, D]:
+        """Return the total of each distance field over `qs` in a single query."""
+        totals = qs.aggregate(
+            **{field: Sum(field, default=0) for field in self.DISTANCE_TOTAL_FIELDS}
+        )
+        return {field: D(m=float(total)) for field, total in totals.items()}
 
-    @lru_cache
     def total_vert_dist_up(self, qs: QuerySet | None = None):
-        return self._sum_distance_field(qs, "vert_dist_up")
+        return self.distance_totals(qs)["vert_dist_up"]
 
-    @lru_cache
     def total_vert_dist_down(self, qs: QuerySet | None = None):
-        return self._sum_distance_field(qs, "vert_dist_down")
+        return self.distance_totals(qs)["vert_dist_down"]
 
-    @lru_cache
     def total_surveyed(self, qs: QuerySet | None = None):
-        return self._sum_distance_field(qs, "surveyed_dist")
+        return self.distance_totals(qs)["surveyed_dist"]
 
-    @lru_cache
     def total_resurveyed(self, qs: QuerySet | None = None):
-        return self._sum_distance_field(qs, "resurveyed_dist")
+        return self.distance_totals(qs)["resurveyed_dist"]
 
-    @lru_cache
     def total_aid_climbed(self, qs: QuerySet | None = None):
-        return self._sum_distance_field(qs, "aid_dist")
+        return self.distance_totals(qs)["aid_dist"]
 
-    @lru_cache
     def total_horizontal(self, qs: QuerySet | None = None):
-        return self._sum_distance_field(qs, "horizontal_dist")
+        return self.distance_totals(qs)["horizontal_dist"]
 
     @cached_property
     def quick_stats(self):
-        qs = self.trips.exclude(type=Trip.SURFACE).aggregate(
-            qs_trips=Count("pk", distinct=True),
-            qs_cavers=Count("cavers", distinct=True),
-            qs_longest_trip=Max("duration", default=timedelta()),
-        )
-        qs["qs_duration"] = self.total_trip_duration
-        qs["qs_friends"] = self.friends.count()
-        qs["qs_photos"] = self.get_photos().count()
-        qs["qs_joined"] = self.date_joined
-        qs["qs_last_trip"] = self.trips.order_by("-start").first()
-
-        stats_qs = self.trips_for_stats
-        qs["qs_climbed"] = self.total_vert_dist_up(stats_qs)
-        qs["qs_descended"] = self.total_vert_dist_down(stats_qs)
-        qs["qs_surveyed"] = self.total_surveyed(stats_qs)
-        qs["qs_resurveyed"] = self.total_resurveyed(stats_qs)
-        qs["qs_aid_climbed"] = self.total_aid_climbed(stats_qs)
-        qs["qs_horizontal"] = self.total_horizontal(stats_qs)
-        return qs
+        from stats.models import UserStats
+
+        stats = UserStats.objects.for_user(self)
+        return {
+            "qs_trips": stats.trips,
+            "qs_cavers": stats.cavers,
+            "qs_longest_trip": stats.longest_trip,
+            "qs_duration": stats.duration if stats.trips else None,
+            "qs_friends": stats.friends,
+            "qs_photos": stats.photos,
+            "qs_joined": self.date_joined,
+            "qs_last_trip": stats.last_trip,
+            "qs_climbed": D(m=float(stats.vert_up)),
+            "qs_descended": D(m=float(stats.vert_down)),
+            "qs_surveyed": D(m=float(stats.surveyed)),
+            "qs_resurveyed": D(m=float(stats.resurveyed)),
+            "qs_aid_climbed": D(m=float(stats.aid)),
+            "qs_horizontal": D(m=float(stats.horizontal)),
+        }
 
     @property
     def has_social_media_links(self):
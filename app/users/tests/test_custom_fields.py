@@ -1,3 +1,4 @@
+from core.tests.mixins import IsolatedCacheMixin
 from django.test import Client, TestCase, tag
 from django.urls import reverse
 from logger.factories import TripFactory
@@ -6,7 +7,7 @@ from ..factories import UserFactory
 
 
 @tag("fast", "trips", "custom_fields")
-class CustomFieldTests(TestCase):
+class CustomFieldTests(IsolatedCacheMixin, TestCase):
     def setUp(self):
         self.client = Client()
         self.user = UserFactory(is_active=True)
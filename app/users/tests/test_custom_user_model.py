@@ -1,7 +1,11 @@
+import gc
 import uuid
+import weakref
 from unittest import mock
 
+from core.tests.mixins import IsolatedCacheMixin
 from django.contrib.auth import get_user_model
+from django.contrib.gis.measure import D
 from django.core import mail
 from django.test import Client, TestCase, tag
 from django.urls import reverse
@@ -14,7 +18,7 @@ User = get_user_model()
 
 
 @tag("unit", "users", "fast")
-class UserUnitTests(TestCase):
+class UserUnitTests(IsolatedCacheMixin, TestCase):
     def setUp(self):
         # Reduce log level to avoid 404 error
         import logging
@@ -72,6 +76,47 @@ class UserUnitTests(TestCase):
         )
         self.assertTrue(user.has_trips)
 
+    def test_distance_totals(self):
+        """Test that the distance totals are summed, cached and invalidated."""
+        user = User.objects.get(email="user@caves.app")
+        trip = Trip.objects.create(
+            user=user, cave_name="Test Cave", start=timezone.now(), vert_dist_up="10m"
+        )
+        Trip.objects.create(
+            user=user, cave_name="Test Cave", start=timezone.now(), surveyed_dist="5m"
+        )
+
+        with self.assertNumQueries(1):
+            self.assertEqual(user.total_vert_dist_up(), D(m=10))
+            self.assertEqual(user.total_surveyed(), D(m=5))
+            self.assertEqual(user.total_aid_climbed(), D(m=0))
+        self.assertEqual(user.total_surveyed(user.trips.filter(pk=trip.pk)), D(m=0))
+
+        trip.vert_dist_up = "15m"
+        trip.save()
+        self.assertEqual(user.total_vert_dist_up(), D(m=15))
+
+    def test_users_are_garbage_collected_after_a_request(self):
+        """Test that nothing keeps a user alive once a request has finished with it."""
+        Trip.objects.create(
+            user=self.user, cave_name="Test Cave", start=timezone.now(), vert_dist_up="10m"
+        )
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("log:user", args=[self.user.username]))
+        self.assertEqual(response.status_code, 200)
+        request_user = weakref.ref(response.wsgi_request.user._wrapped)
+
+        user = User.objects.get(pk=self.user.pk)
+        for qs in (None, user.trips):
+            user.total_vert_dist_up(qs)
+            user.total_horizontal(qs)
+        user = weakref.ref(user)
+
+        del response, qs
+        gc.collect()
+        self.assertIsNone(request_user())
+        self.assertIsNone(user())
+
     def test_is_staff_property(self):
         """Test CavingUser.is_staff property."""
         # Test when not a superuser
@@ -134,7 +179,7 @@ class UserUnitTests(TestCase):
 
 
 @tag("integration", "users", "fast")
-class UserIntegrationTestCase(TestCase):
+class UserIntegrationTestCase(IsolatedCacheMixin, TestCase):
     def setUp(self):
         self.client = Client()
 
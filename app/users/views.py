@@ -6,6 +6,7 @@ from django.contrib.auth import views as auth_views
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.messages.views import SuccessMessageMixin
 from django.core.exceptions import PermissionDenied
+from django.db import transaction
 from django.db.models import Q
 from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
@@ -13,6 +14,9 @@ from django.urls import reverse, reverse_lazy
 from django.utils.decorators import method_decorator
 from django.views.generic import FormView, ListView, TemplateView, View
 from django_ratelimit.decorators import ratelimit
+from logger.models import CaveNameDictionary, FeedEntry
+from logger.search import invalidate_search_results
+from stats.models import UserStats, UserWeeklyStats
 
 from .emails import (
     EmailChangeNotificationEmail,
@@ -89,6 +93,8 @@ class ProfileUpdate(LoginRequiredMixin, SuccessMessageMixin, FormView):
 
     def form_valid(self, form):
         form.save()
+        if {"name", "username"}.intersection(form.changed_data):
+            FeedEntry.objects.invalidate_owner(self.request.user)
         log_user_action(self.request.user, "updated their profile")
         return super().form_valid(form)
 
@@ -108,6 +114,7 @@ class AvatarUpdate(LoginRequiredMixin, SuccessMessageMixin, FormView):
 
     def form_valid(self, form):  # pragma: no cover
         form.save()
+        FeedEntry.objects.invalidate_owner(self.request.user)
         log_user_action(self.request.user, "uploaded a new avatar")
         return super().form_valid(form)
 
@@ -208,15 +215,26 @@ class FriendRequestDeleteView(LoginRequiredMixin, View):
         return redirect("users:friends")
 
 
+def _lock_friends(user, friend):
+    """Lock the rows of two users, so that their friendship is changed once at a time."""
+    list(User.objects.select_for_update().filter(pk__in=[user.pk, friend.pk]).values_list("pk"))
+
+
 class FriendRequestAcceptView(LoginRequiredMixin, View):
     def post(self, request, pk):
         f_req = get_object_or_404(FriendRequest, pk=pk)
         if not f_req.user_to == request.user:
             raise PermissionDenied
 
-        f_req.user_from.friends.add(f_req.user_to)
-        f_req.user_to.friends.add(f_req.user_from)
-        f_req.delete()
+        with transaction.atomic():
+            _lock_friends(f_req.user_from, f_req.user_to)
+            # The request may have been accepted twice, or the users already be friends
+            if not f_req.user_from.friends.filter(pk=f_req.user_to.pk).exists():
+                f_req.user_from.friends.add(f_req.user_to)
+                f_req.user_to.friends.add(f_req.user_from)
+                UserStats.objects.update_counters(f_req.user_from, f_req.user_to, friends=1)
+                FeedEntry.objects.add_friendship(f_req.user_from, f_req.user_to)
+            f_req.delete()
 
         f_req.user_from.notify(
             f"{f_req.user_to.name} accepted your friend request",
@@ -242,11 +260,16 @@ class FriendRequestAcceptView(LoginRequiredMixin, View):
 class FriendRemoveView(LoginRequiredMixin, View):
     def post(self, request, username):
         user = get_object_or_404(User, username=username)
-        if user not in request.user.friends.all():
-            raise Http404
 
-        request.user.friends.remove(user)
-        user.friends.remove(request.user)
+        with transaction.atomic():
+            _lock_friends(request.user, user)
+            if not request.user.friends.filter(pk=user.pk).exists():
+                raise Http404
+
+            request.user.friends.remove(user)
+            user.friends.remove(request.user)
+            UserStats.objects.update_counters(request.user, user, friends=-1)
+            FeedEntry.objects.remove_friendship(request.user, user)
         messages.success(request, f"You are no longer friends with {user}.")
 
         log_user_interaction(request.user, "removed as a friend", user)
@@ -495,6 +518,23 @@ class AccountSettings(LoginRequiredMixin, View):
     def settings_form_valid(self, request, form):
         """Save the user's settings."""
         form.save()
+        if "privacy" in form.changed_data:
+            FeedEntry.objects.refresh_owner(request.user)
+            CaveNameDictionary.objects.update_owner_privacy(
+                request.user,
+                was_public=form.initial["privacy"] == User.PUBLIC,
+                is_public=form.instance.privacy == User.PUBLIC,
+            )
+            invalidate_search_results()
+        elif "allow_comments" in form.changed_data:
+            # The feeds showing the user's trips were invalidated by a privacy change
+            FeedEntry.objects.invalidate_owner(request.user)
+        if "timezone" in form.changed_data:
+            # Trips are counted in the weeks they start in locally
+            UserWeeklyStats.objects.rebuild(request.user)
+        if {"units", "timezone"}.intersection(form.changed_data):
+            # The viewer's own feed shows distances and times in their settings
+            FeedEntry.objects.invalidate_feeds([request.user.pk])
         messages.success(request, "Your settings have been updated.")
         log_user_action(request.user, "updated their account settings")
         return redirect("users:account_settings")
@@ -98,3 +98,17 @@ then
     cd "$APP_ROOT" || exit 1
     python manage.py runmailer_pg
 fi
+
+if [ "$1" = "counters" ]
+then
+    echo "Starting view counter worker..."
+    cd "$APP_ROOT" || exit 1
+    python manage.py flush_counters --interval "${COUNTER_FLUSH_INTERVAL:-60}"
+fi
+
+if [ "$1" = "scores" ]
+then
+    echo "Starting discover feed score worker..."
+    cd "$APP_ROOT" || exit 1
+    python manage.py refresh_trip_scores --interval "${SCORE_REFRESH_INTERVAL:-900}"
+fi